@@ -1,18 +1,118 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from main import create_enhanced_assignment
-import os, json
-from docx import Document
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.units import inch
+from flask import Flask, render_template, request, jsonify, send_file, session, Response
+from main import get_or_create_assignment, aget_or_create_assignment, get_generation_stats
+from tools import get_wikipedia_cache_stats, get_title_cache_stats
+from httpclient import get_http_stats
+from llmcache import get_llm_cache_stats
+from jobs import JobQueue, JobQueueFull, create_backend, DONE, FAILED
+from cache import ResultCache
+from metrics import new_trace_id, set_trace_id, get_trace_id, stage, render_prometheus, render_not_modified
+import os, json, time, hashlib, threading
+from io import BytesIO
 import textwrap
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
+# Set FLASK_SECRET_KEY when running several workers so session cookies are valid on all of them
+app.secret_key = os.getenv("FLASK_SECRET_KEY") or os.urandom(24)
 
-# Global variable to store the current assignment data
-current_assignment = None
+# Generated assignments keyed by assignment ID (the job ID that produced them).
+# Point ASSIGNMENT_STORE_PATH at a SQLite file to share the store between workers.
+assignment_store = ResultCache(
+    "assignments",
+    max_entries=int(os.getenv("ASSIGNMENT_STORE_MAX_ENTRIES", "256")),
+    ttl=float(os.getenv("ASSIGNMENT_STORE_TTL", str(24 * 3600))),
+    path=os.getenv("ASSIGNMENT_STORE_PATH") or None
+)
+
+def lookup_assignment(assignment_id=None):
+    """Find an assignment by explicit ID, falling back to the session's latest one"""
+    assignment_id = assignment_id or session.get("assignment_id")
+    if not assignment_id:
+        return None
+    return assignment_store.get(assignment_id)
+
+def parse_generation_result(result):
+    output = result.get("output")
+    
+    # The error stub parses as an assignment, but it must not be stored as a finished job
+    if result.get("error"):
+        raise RuntimeError(result["error"])
+    
+    if output is None:
+        raise RuntimeError("No output generated")
+    
+    try:
+        assignment = json.loads(output)
+    except json.JSONDecodeError:
+        raise RuntimeError("Invalid JSON response from generator")
+    
+    if not isinstance(assignment.get('sources'), list):
+        assignment['sources'] = []
+    
+    return assignment
+
+def run_generation_job(payload, emit):
+    """Run the generation pipeline for one queued job"""
+    set_trace_id(payload.get("trace_id"))
+    result = get_or_create_assignment(payload["topic"], force_fresh=payload.get("force_fresh", False), on_event=emit)
+    return parse_generation_result(result)
+
+async def run_generation_job_async(payload, emit):
+    """run_generation_job on the job queue's event loop (JOB_EXECUTION=async)"""
+    set_trace_id(payload.get("trace_id"))
+    result = await aget_or_create_assignment(payload["topic"], force_fresh=payload.get("force_fresh", False), on_event=emit)
+    return parse_generation_result(result)
+
+# Each generation tracks its research in its own context (tools.ResearchContext), so one
+# process runs several at once; they mostly wait on the LLM and Wikipedia.
+# JOB_EXECUTION=async runs jobs as coroutines on one event loop thread instead of worker threads
+job_queue = JobQueue(
+    backend=create_backend(),
+    handler=run_generation_job,
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    async_handler=run_generation_job_async if os.getenv("JOB_EXECUTION", "thread") == "async" else None,
+    async_concurrency=int(os.getenv("JOB_ASYNC_CONCURRENCY", "16"))
+)
+
+_warm_started_pid = None
+_warm_lock = threading.Lock()
+
+def start_background_tasks():
+    """Start this process's cache warm-up thread (WARM_TOPICS_PATH, see warm.py) on its first request.
+    
+    Deferred like the job queue's workers, so a master that preloads the app and then forks
+    starts no threads of its own.
+    """
+    global _warm_started_pid
+    if not os.getenv("WARM_TOPICS_PATH") or _warm_started_pid == os.getpid():
+        return
+    with _warm_lock:
+        if _warm_started_pid == os.getpid():
+            return
+        from warm import start_warm_scheduler
+        start_warm_scheduler(
+            os.getenv("WARM_TOPICS_PATH"),
+            interval=float(os.getenv("WARM_INTERVAL", "3600")),
+            assignments=os.getenv("WARM_ASSIGNMENTS", "0") == "1"
+        )
+        _warm_started_pid = os.getpid()
+
+def job_status(job):
+    """Public view of a job record"""
+    return {
+        "job_id": job["id"],
+        "trace_id": job["payload"].get("trace_id"),
+        "status": job["status"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "result_url": f"/jobs/{job['id']}/result"
+    }
+
+@app.before_request
+def assign_trace_id():
+    set_trace_id(request.headers.get("X-Trace-Id") or new_trace_id())
+    start_background_tasks()
 
 @app.route("/")
 def index():
@@ -20,8 +120,6 @@ def index():
 
 @app.route("/generate", methods=["POST"])
 def generate_assignment():
-    global current_assignment
-    
     try:
         data = request.get_json()
         topic = data.get("topic")
@@ -29,26 +127,126 @@ def generate_assignment():
         if not topic:
             return jsonify({"error": "No topic provided."}), 400
 
-        result = create_enhanced_assignment(topic)
-        output = result.get("output")
+        trace_id = get_trace_id()
+        job_id = job_queue.submit({"topic": topic, "force_fresh": bool(data.get("force_fresh")), "trace_id": trace_id})
         
-        if output is None:
-            return jsonify({"error": "No output generated"}), 500
-            
-        try:
-            current_assignment = json.loads(output)
-            
-            if not isinstance(current_assignment.get('sources'), list):
-                current_assignment['sources'] = []
-            
-            return jsonify({"success": True, "data": current_assignment})
-            
-        except json.JSONDecodeError as e:
-            return jsonify({"error": "Invalid JSON response from generator"}), 500
-
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "trace_id": trace_id,
+            "status_url": f"/jobs/{job_id}",
+            "result_url": f"/jobs/{job_id}/result"
+        }), 202
+    
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "10"}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/generate-batch", methods=["POST"])
+def generate_batch():
+    """Queue one generation job per topic, in order, until the job queue is full.
+
+    Topics that did not fit come back in `rejected` so the client can resubmit them later.
+    """
+    data = request.get_json() or {}
+    topics = [topic.strip() for topic in data.get("topics", []) if isinstance(topic, str) and topic.strip()]
+    
+    if not topics:
+        return jsonify({"error": "No topics provided."}), 400
+    
+    jobs = []
+    for topic in topics:
+        try:
+            job_id = job_queue.submit({"topic": topic, "trace_id": new_trace_id()})
+        except JobQueueFull:
+            break
+        jobs.append({"topic": topic, "job_id": job_id, "status_url": f"/jobs/{job_id}"})
+    rejected = topics[len(jobs):]
+    
+    if not jobs:
+        return jsonify({"error": "Job queue is full, try again later", "rejected": rejected}), 429, {"Retry-After": "30"}
+    headers = {"Retry-After": "30"} if rejected else {}
+    return jsonify({"success": True, "jobs": jobs, "rejected": rejected}), 202, headers
+
+@app.route("/jobs/<job_id>")
+def get_job(job_id):
+    """Poll the status of a generation job"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job_status(job))
+
+SSE_MAX_SECONDS = float(os.getenv("SSE_MAX_SECONDS", "600"))
+
+def _last_event_id(value):
+    """The event sequence number a client resumes after; a malformed one replays from the start."""
+    try:
+        return max(int(value or 0), 0)
+    except ValueError:
+        return 0
+
+@app.route("/jobs/<job_id>/events")
+def stream_job_events(job_id):
+    """Server-Sent Events stream of a job's progress (tool calls, phases, writer tokens)"""
+    if not job_queue.get(job_id):
+        return jsonify({"error": "Unknown job"}), 404
+    
+    last_seen = _last_event_id(request.headers.get("Last-Event-ID") or request.args.get("after"))
+    
+    def stream(after):
+        yield "retry: 2000\n\n"
+        started = idle_since = time.monotonic()
+        while True:
+            events = job_queue.events(job_id, after)
+            job = None if events else job_queue.get(job_id)
+            finished = not events and (job is None or job["status"] in (DONE, FAILED))
+            if finished:
+                # Pick up anything emitted between the two reads before ending the stream
+                events = job_queue.events(job_id, after)
+            for seq, event in events:
+                after = seq
+                yield f"id: {seq}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event["type"] == "status" and event["status"] in (DONE, FAILED):
+                    return
+            if finished:
+                # The job ended without a final status event (events purged) or no longer exists
+                event = {"type": "status", "status": job["status"] if job else FAILED,
+                         "error": job["error"] if job else "Unknown job"}
+                yield f"event: status\ndata: {json.dumps(event)}\n\n"
+                return
+            if events:
+                idle_since = time.monotonic()
+            if time.monotonic() - started > SSE_MAX_SECONDS:
+                # Frees the server thread; EventSource reconnects and resumes from Last-Event-ID
+                return
+            if not events and time.monotonic() - idle_since > 15:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                idle_since = time.monotonic()
+            time.sleep(0.25)
+    
+    return Response(
+        stream(last_seen),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/jobs/<job_id>/result")
+def get_job_result(job_id):
+    """Fetch the assignment produced by a finished job"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    if job["status"] == FAILED:
+        return jsonify({"error": job["error"]}), 500
+    if job["status"] != DONE:
+        return jsonify(job_status(job)), 202
+    
+    assignment_store.set(job_id, job["result"])
+    session["assignment_id"] = job_id
+    return jsonify({"success": True, "assignment_id": job_id, "data": job["result"]})
+
 def format_content_as_text(assignment_data):
     """Convert assignment data to formatted text"""
     content = f"# {assignment_data['topic']}\n\n"
@@ -73,15 +271,21 @@ def format_content_as_text(assignment_data):
     
     return content
 
-def create_txt_file(assignment_data, filepath):
-    """Create TXT file from assignment data"""
+def create_txt_file(assignment_data):
+    """Render assignment data as a TXT document in memory"""
     content = format_content_as_text(assignment_data)
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(content)
+    return BytesIO(content.encode("utf-8"))
 
-def create_pdf_file(assignment_data, filepath):
-    """Create PDF file from assignment data"""
-    doc = SimpleDocTemplate(filepath, pagesize=letter, topMargin=1*inch)
+def create_pdf_file(assignment_data):
+    """Render assignment data as a PDF document in memory"""
+    # reportlab and python-docx are imported on first use so app startup does not pay for them
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.units import inch
+    
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=1*inch)
     styles = getSampleStyleSheet()
     story = []
     
@@ -124,9 +328,13 @@ def create_pdf_file(assignment_data, filepath):
             story.append(Paragraph(f"{i}. {source}", styles['Normal']))
     
     doc.build(story)
+    buffer.seek(0)
+    return buffer
 
-def create_docx_file(assignment_data, filepath):
-    """Create DOCX file from assignment data"""
+def create_docx_file(assignment_data):
+    """Render assignment data as a DOCX document in memory"""
+    from docx import Document
+    
     doc = Document()
     
     # Title
@@ -157,30 +365,71 @@ def create_docx_file(assignment_data, filepath):
         for i, source in enumerate(assignment_data['sources'], 1):
             doc.add_paragraph(f"{i}. {source}")
     
-    doc.save(filepath)
+    buffer = BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+RENDERERS = {
+    "txt": (create_txt_file, "text/plain; charset=utf-8"),
+    "pdf": (create_pdf_file, "application/pdf"),
+    "docx": (create_docx_file, "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+}
+
+# Rendered documents keyed by a hash of the rendered fields plus format; the hash doubles as ETag
+render_cache = ResultCache(
+    "renders",
+    max_entries=int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "512")),
+    max_bytes=int(os.getenv("RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
+
+RENDERED_FIELDS = ("topic", "author", "date", "introduction", "main_sections", "conclusion", "sources")
+
+def render_cache_key(assignment_data, format):
+    """Content hash of everything the renderers read, so equal documents share a key"""
+    normalized = {field: assignment_data.get(field) for field in RENDERED_FIELDS}
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(f"{format}\n{payload}".encode("utf-8")).hexdigest()
+
+def send_rendered(assignment_data, format, filename):
+    """Serve the rendered assignment from the render cache, rendering it on a miss"""
+    etag = render_cache_key(assignment_data, format)
+    if etag in request.if_none_match:
+        render_not_modified.inc()
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    
+    rendered = render_cache.get(etag)
+    if rendered is None:
+        renderer, _ = RENDERERS[format]
+        with stage("render", format=format):
+            rendered = renderer(assignment_data).getvalue()
+        render_cache.set(etag, rendered)
+    
+    response = send_file(
+        BytesIO(rendered),
+        as_attachment=True,
+        download_name=f"{filename}.{format}",
+        mimetype=RENDERERS[format][1],
+        etag=etag
+    )
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 @app.route("/download/<format>")
 def download_assignment(format):
     """Download assignment in original format (without edits)"""
-    global current_assignment
+    current_assignment = lookup_assignment(request.args.get("assignment_id"))
     
     if not current_assignment:
         return jsonify({"error": "No assignment data available. Please generate an assignment first."}), 404
 
-    filename = f"assignment.{format}"
-    filepath = os.path.join(os.getcwd(), filename)
+    if format not in RENDERERS:
+        return jsonify({"error": "Unsupported format"}), 400
 
     try:
-        if format == "txt":
-            create_txt_file(current_assignment, filepath)
-        elif format == "pdf":
-            create_pdf_file(current_assignment, filepath)
-        elif format == "docx":
-            create_docx_file(current_assignment, filepath)
-        else:
-            return jsonify({"error": "Unsupported format"}), 400
-
-        return send_file(filepath, as_attachment=True)
+        return send_rendered(current_assignment, format, "assignment")
     
     except Exception as e:
         print(f"Error creating {format} file: {e}")
@@ -192,6 +441,7 @@ def download_edited():
     try:
         data = request.get_json()
         format_type = data.get("format")
+        current_assignment = lookup_assignment(data.get("assignment_id"))
         
         # Create assignment data from edited content
         edited_assignment = {
@@ -204,32 +454,71 @@ def download_edited():
             "sources": current_assignment.get('sources', []) if current_assignment else []
         }
 
-        filename = f"assignment_edited.{format_type}"
-        filepath = os.path.join(os.getcwd(), filename)
-
-        if format_type == "txt":
-            create_txt_file(edited_assignment, filepath)
-        elif format_type == "pdf":
-            create_pdf_file(edited_assignment, filepath)
-        elif format_type == "docx":
-            create_docx_file(edited_assignment, filepath)
-        else:
+        if format_type not in RENDERERS:
             return jsonify({"error": "Unsupported format"}), 400
 
-        return send_file(filepath, as_attachment=True)
+        return send_rendered(edited_assignment, format_type, "assignment_edited")
     
     except Exception as e:
         print(f"Error in download_edited: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/cache-stats")
+def cache_stats():
+    """Hit-rate statistics for the server-side caches"""
+    render_stats = render_cache.stats()
+    render_stats["not_modified"] = render_not_modified.value()
+    return jsonify({
+        "renders": render_stats,
+        "wikipedia": get_wikipedia_cache_stats(),
+        "wikipedia_titles": get_title_cache_stats(),
+        "llm_responses": get_llm_cache_stats(),
+        "assignments": assignment_store.stats(),
+        "generations": get_generation_stats(),
+        "http": get_http_stats()
+    })
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus-style metrics for this worker process"""
+    caches = [render_cache.stats(), get_wikipedia_cache_stats(), get_title_cache_stats(), assignment_store.stats()]
+    llm_cache_stats = get_llm_cache_stats()
+    if llm_cache_stats:
+        caches.append(llm_cache_stats)
+    gauges = {
+        "assignment_cache_hits": [({"cache": c["name"]}, c["hits"]) for c in caches],
+        "assignment_cache_misses": [({"cache": c["name"]}, c["misses"]) for c in caches],
+        "assignment_cache_bytes": [({"cache": c["name"]}, c["bytes"]) for c in caches],
+        "assignment_generations": [({"kind": k}, v) for k, v in get_generation_stats().items()],
+        "assignment_job_queue_depth": [({}, job_queue.backend.depth())],
+        "assignment_http_requests": [({"host": h}, c["requests"]) for h, c in get_http_stats().items()],
+        "assignment_http_connections_opened": [({"host": h}, c["connections_opened"]) for h, c in get_http_stats().items()]
+    }
+    return Response(render_prometheus(gauges), mimetype="text/plain; version=0.0.4")
+
 @app.route("/get-current-assignment")
 def get_current_assignment():
     """API endpoint to get current assignment data"""
-    global current_assignment
+    current_assignment = lookup_assignment(request.args.get("assignment_id"))
     if current_assignment:
         return jsonify(current_assignment)
     else:
         return jsonify({"error": "No assignment data available"}), 404
 
+def preload():
+    """Import and build everything the first generation and download would, ahead of time.
+    
+    Set PRELOAD=1 with `gunicorn --preload` to do this once in the master: the forked workers
+    share the loaded modules copy-on-write and none of them pays for them on its first request.
+    Workers, caches and HTTP clients are created per process after the fork.
+    """
+    import docx
+    import reportlab.platypus
+    import main
+    main.preload()
+
+if os.getenv("PRELOAD", "0") == "1":
+    preload()
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""Generate assignments for many topics: python batch.py topics.txt -o results.jsonl --workers 4
+
+Topics are read one per line, or from JSONL objects with a "topic" field. Results are
+appended to the output JSONL as each topic finishes, so an interrupted run can be
+restarted with the same arguments and will skip topics that already succeeded.
+Topics are generated on worker threads: each generation keeps its research state in its
+own context, and the workers share the Wikipedia, LLM response and result caches in memory.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from main import get_or_create_assignment, normalize_topic
+
+
+def read_topics(path):
+    topics = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            topic = json.loads(line).get("topic", "") if line.startswith("{") else line
+            if topic.strip() and normalize_topic(topic) not in seen:
+                seen.add(normalize_topic(topic))
+                topics.append(topic.strip())
+    return topics
+
+
+def completed_topics(output_path):
+    """Normalized topics that already have a successful result in the output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            if record.get("status") == "ok":
+                done.add(normalize_topic(record["topic"]))
+    return done
+
+
+def generate_topic(topic: str) -> dict:
+    """Run one generation; never raises, so one topic cannot stop the batch.
+
+    Error stubs and partial assignments are recorded as errors, so a rerun generates them again.
+    """
+    start = time.perf_counter()
+    try:
+        result = get_or_create_assignment(topic)
+        if result.get("error") or result.get("partial"):
+            raise RuntimeError(result.get("error") or "writer output was incomplete")
+        record = {"topic": topic, "status": "ok", "assignment": json.loads(result["output"])}
+    except Exception as e:
+        record = {"topic": topic, "status": "error", "error": str(e) or e.__class__.__name__}
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def summarize(records, wall_seconds):
+    ok = [record for record in records if record["status"] == "ok"]
+    timings = sorted(record["seconds"] for record in records)
+    summary = {
+        "topics": len(records),
+        "succeeded": len(ok),
+        "failed": len(records) - len(ok),
+        "wall_seconds": round(wall_seconds, 3),
+        "topics_per_minute": round(len(records) / wall_seconds * 60, 2) if wall_seconds else 0.0,
+    }
+    if timings:
+        summary["mean_topic_seconds"] = round(statistics.mean(timings), 3)
+        summary["p50_topic_seconds"] = timings[len(timings) // 2]
+        summary["max_topic_seconds"] = timings[-1]
+    return summary
+
+
+def run_batch(topics, output_path, workers=4, generate=generate_topic):
+    done = completed_topics(output_path)
+    pending = [topic for topic in topics if normalize_topic(topic) not in done]
+    print(f"{len(topics)} topics, {len(topics) - len(pending)} already done, {len(pending)} to generate")
+
+    records = []
+    start = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(generate, topic): topic for topic in pending}
+        for future in as_completed(futures):
+            record = future.result()
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            records.append(record)
+            print(f"[{len(records)}/{len(pending)}] {record['status']:>5} {record['seconds']:8.1f}s  {record['topic']}")
+
+    summary = summarize(records, time.perf_counter() - start)
+    print(json.dumps(summary, indent=2))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("topics", help="text file with one topic per line, or JSONL with a 'topic' field")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", "4")),
+                        help="topics generated at once")
+    args = parser.parse_args()
+
+    run_batch(read_topics(args.topics), args.output, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1006 @@
+"""Offline benchmarks for the assignment generator. Run `python benchmark.py --help`."""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import httpx
+
+import tools
+from stubs import stub_article, stub_wikipedia, sample_assignment, FakeChatModel, StubWikipediaServer
+
+
+def serial_topic_research(main_topic: str) -> str:
+    """The original one-at-a-time research loop, kept as the baseline."""
+    all_research = []
+    for term in tools.build_search_terms(main_topic):
+        research = tools.forced_wikipedia_research(term)
+        all_research.append(f"### Research on '{term}':\n{research}\n")
+        time.sleep(0.5)
+    return "\n".join(all_research)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def bench_research(args):
+    tools._run_wikipedia_query = stub_wikipedia(latency=args.latency)
+    tools.wiki_cache.path = None
+
+    results = {}
+    for name, func in (("serial", serial_topic_research), ("parallel", tools.comprehensive_topic_research)):
+        runs = []
+        for i in range(args.runs):
+            tools.wiki_cache.clear()
+            tools.clear_research_cache()
+            runs.append(timed(func, f"{args.topic} {i}"))
+        results[name] = sum(runs) / len(runs)
+        print(f"{name:>8}: {results[name]:.3f}s per topic ({args.runs} runs, {args.latency:.2f}s stub latency)")
+
+    print(f" speedup: {results['serial'] / results['parallel']:.1f}x")
+    return results
+
+
+def bench_context(args):
+    tools._run_wikipedia_query = stub_wikipedia(latency=0, chars=4000)
+    tools.wiki_cache.path = None
+    tools.clear_research_cache()
+    tools.comprehensive_topic_research(args.topic)
+
+    start = time.perf_counter()
+    context, stats = tools.build_research_context(args.topic, token_budget=args.budget)
+    elapsed = time.perf_counter() - start
+
+    print(f"research collected: ~{stats['raw_tokens']} tokens across {len(tools.current_research().facts)} queries")
+    print(f"writer context:     ~{stats['context_tokens']} tokens, {stats['passages']} of {stats['candidates']} unique passages")
+    print(f"build time:         {elapsed * 1000:.2f} ms")
+
+    # Whole generations without (the old behaviour) and with the notes in the writer's prompt
+    import main
+    from metrics import llm_tokens
+
+    main.RESEARCH_MODE = "template"
+    main.WRITER_MODE = args.writer_mode
+    main.SOURCE_VERIFY = False
+    main.llm = FakeChatModel(latency=args.llm_latency, tokens_per_second=args.tps,
+                             prompt_tokens_per_second=args.prompt_tps)
+    results = {"context": stats}
+    for name, enabled in (("without notes", False), ("with notes", True)):
+        main.WRITER_RESEARCH_CONTEXT = enabled
+        runs, prompt_tokens = [], []
+        for run in range(args.runs):
+            before = llm_tokens.value(phase="writing", kind="prompt")
+            with contextlib.redirect_stdout(io.StringIO()):
+                runs.append(timed(main.create_enhanced_assignment, f"{args.topic} {name} {run}"))
+            prompt_tokens.append(llm_tokens.value(phase="writing", kind="prompt") - before)
+        results[name] = {"writer_prompt_tokens": statistics.median(prompt_tokens),
+                         "seconds": round(statistics.median(runs), 3)}
+        print(f"{name:>18}: {results[name]['writer_prompt_tokens']:6.0f} writer prompt tokens, "
+              f"{results[name]['seconds']:.2f}s per generation (median of {args.runs})")
+    print(f"fake LLM: {args.llm_latency}s latency, {args.tps:.0f} output and {args.prompt_tps:.0f} prompt tokens/s, "
+          f"writer={args.writer_mode}")
+    return results
+
+
+def bench_writer(args):
+    import main
+    from jsonstream import parse_json_object
+    from writing import write_assignment_parallel
+
+    context = "- Stub research notes for the benchmark."
+    modes = {
+        "single": lambda llm: parse_json_object(
+            main.write_single_shot(llm, args.topic, context, "January 01, 2025", {})
+        )[0],
+        "parallel": lambda llm: write_assignment_parallel(
+            llm, args.topic, context, "January 01, 2025", max_workers=args.workers
+        ),
+    }
+
+    results = {}
+    for name, write in modes.items():
+        llm = FakeChatModel(latency=args.latency, tokens_per_second=args.tps)
+        start = time.perf_counter()
+        assignment = main.AssignmentResponse.model_validate(write(llm))
+        results[name] = time.perf_counter() - start
+        words = sum(len(section["content"].split()) for section in assignment.main_sections)
+        print(f"{name:>8}: {results[name]:.2f}s, {llm.calls} LLM calls, {words} words in main sections")
+
+    print(f" speedup: {results['single'] / results['parallel']:.1f}x "
+          f"(fake LLM: {args.latency}s latency, {args.tps:.0f} tokens/s)")
+    return results
+
+
+def bench_research_modes(args):
+    import main
+    from research import run_planned_research
+
+    tools._run_wikipedia_query = stub_wikipedia(latency=args.latency)
+    tools.wiki_cache.path = None
+    modes = {
+        "agent": lambda llm, topic: main.run_research_agent(llm, topic, {}),
+        "planner": lambda llm, topic: run_planned_research(llm, topic, mode="planner"),
+        "template": lambda llm, topic: run_planned_research(llm, topic, mode="template"),
+    }
+
+    results = {}
+    for name, research in modes.items():
+        llm = FakeChatModel(latency=args.llm_latency, tokens_per_second=args.tps, research_queries=args.queries)
+        tools.wiki_cache.clear()
+        tools.clear_research_cache()
+        start = time.perf_counter()
+        research(llm, args.topic)
+        results[name] = {"seconds": time.perf_counter() - start, "llm_calls": llm.calls,
+                         "articles": len(tools.current_research().facts)}
+        print(f"{name:>8}: {results[name]['seconds']:.2f}s, {llm.calls} LLM calls, "
+              f"{results[name]['articles']} Wikipedia queries")
+    return results
+
+
+def bench_overhead(args):
+    import main
+
+    main.RESEARCH_MODE = "agent"
+    main.WRITER_MODE = "single"
+    # Source checks would go to the live Wikipedia API; this measures the pipeline's own overhead
+    main.SOURCE_VERIFY = False
+    main.llm = FakeChatModel(latency=0, tokens_per_second=1e9, research_queries=args.queries)
+    tools._run_wikipedia_query = stub_wikipedia(latency=0)
+    tools.wiki_cache.path = None
+    shared_executor = main.get_agent_executor
+
+    def rebuilt_executor(kind, llm):
+        # The pre-sharing behaviour: fresh agents and executors for every request
+        return main._EXECUTOR_BUILDERS[kind](llm)
+
+    micro = {
+        "agents+executors": lambda: [rebuilt_executor(kind, main.llm) for kind in ("research", "writing")],
+        "shared lookup": lambda: [shared_executor(kind, main.llm) for kind in ("research", "writing")],
+    }
+    for name, build in micro.items():
+        seconds = min(timed(build) for _ in range(args.runs))
+        print(f"{name:>18}: {seconds * 1e6:9.1f} us per request")
+
+    results = {}
+    for name, executor in (("rebuilt", rebuilt_executor), ("shared", shared_executor)):
+        main.get_agent_executor = executor
+        tools.wiki_cache.clear()
+        runs = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(args.runs):
+                runs.append(timed(main.create_enhanced_assignment, f"{args.topic} {i % 4}"))
+        results[name] = statistics.median(runs)
+        print(f"{name:>18}: {results[name] * 1000:9.2f} ms per generation (zero-latency stubs, median of {args.runs})")
+    main.get_agent_executor = shared_executor
+    return results
+
+
+def bench_http(args):
+    import requests
+    import httpclient
+
+    with StubWikipediaServer(latency=0) as server:
+        tools.WIKI_API_URL = server.url
+        modes = {
+            # The pre-pooling behaviour: a new connection for every request
+            "fresh": lambda query: requests.get(server.url, params=tools._search_params(query), timeout=10).json(),
+            "pooled": lambda query: httpclient.get_session().get(server.url, params=tools._search_params(query)).json(),
+        }
+        results = {}
+        for name, fetch in modes.items():
+            latencies, wall = load_test(lambda: fetch(args.topic), args.requests, args.concurrency)
+            results[name] = report(name, latencies, wall)
+
+    for host, counts in httpclient.get_http_stats().items():
+        print(f"pooled session to {host}: {counts['requests']} requests over "
+              f"{counts['connections_opened']} connections ({counts['reuse_rate']:.1%} reused)")
+    results["connections"] = httpclient.get_http_stats()
+    return results
+
+
+def bench_backends(args):
+    import wikiindex
+
+    scratch = tempfile.mkdtemp()
+    articles = os.path.join(scratch, "articles.jsonl")
+    subjects = ["Photosynthesis", "Climate", "Volcano", "Democracy", "Algebra", "Jazz", "Bacteria", "Railway"]
+    with open(articles, "w", encoding="utf-8") as f:
+        for i in range(args.articles):
+            title = f"{subjects[i % len(subjects)]} {['history', 'applications', 'examples', 'research'][i // len(subjects) % 4]} {i}"
+            text = re.sub(r"^Page: .*\nSummary: ", "", stub_article(title, 1500), flags=re.MULTILINE)
+            f.write(json.dumps({"title": title, "text": text}) + "\n")
+
+    index_path = os.path.join(scratch, "wiki_index.sqlite3")
+    start = time.perf_counter()
+    count, _ = wikiindex.build_index([articles], index_path)
+    print(f"indexed {count} articles in {time.perf_counter() - start:.2f}s "
+          f"({os.path.getsize(index_path) / 1e6:.1f} MB)")
+
+    results = {"build_seconds": round(time.perf_counter() - start, 3)}
+    local = wikiindex.LocalIndexBackend(index_path)
+    queries = [f"{subject} {aspect}" for subject in subjects for aspect in ("history", "applications", "examples")]
+    with StubWikipediaServer(latency=args.latency / 2) as server:
+        tools.WIKI_API_URL = server.url
+        api = tools.WikipediaAPIBackend()
+        for name, backend in (("api", api), ("local", local)):
+            latencies, wall = load_test(
+                lambda: backend.lookup(queries[int(time.perf_counter() * 1e6) % len(queries)]),
+                args.requests, args.concurrency,
+            )
+            results[name] = report(name, latencies, wall)
+    print(f"sample local result: {local.lookup('photosynthesis history')[:80]!r}")
+    return results
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def load_test(request, total, concurrency):
+    """Call `request()` `total` times from `concurrency` threads; return latencies and wall time."""
+    def one(_):
+        start = time.perf_counter()
+        request()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(total)))
+    return latencies, time.perf_counter() - start
+
+
+def summarize_latencies(latencies, wall):
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "rps": round(len(latencies) / wall, 2),
+    }
+
+
+def report(name, latencies, wall):
+    summary = summarize_latencies(latencies, wall)
+    print(
+        f"{name:>14}: p50 {summary['p50_ms']:7.1f} ms  p95 {summary['p95_ms']:7.1f} ms  "
+        f"p99 {summary['p99_ms']:7.1f} ms  {summary['rps']:7.1f} req/s"
+    )
+    return summary
+
+
+def bench_downloads(args):
+    import app as web
+    from flask import send_file
+
+    scratch = tempfile.mkdtemp()
+
+    @web.app.route("/bench/legacy-download/<format>")
+    def legacy_download(format):
+        # The pre-BytesIO behaviour: render, write assignment.<fmt> to disk, send the file
+        renderer, _ = web.RENDERERS[format]
+        filepath = os.path.join(scratch, f"assignment.{format}")
+        with open(filepath, "wb") as f:
+            f.write(renderer(web.assignment_store.get("bench")).getvalue())
+        return send_file(filepath, as_attachment=True)
+
+    web.assignment_store.set("bench", sample_assignment())
+    client = web.app.test_client()
+
+    results = {}
+    for format in args.formats:
+        for name, url in (
+            ("disk", f"/bench/legacy-download/{format}"),
+            ("memory", f"/download/{format}?assignment_id=bench"),
+        ):
+            def request(url=url):
+                response = client.get(url)
+                assert response.status_code == 200, response.status_code
+                response.get_data()
+            latencies, wall = load_test(request, args.requests, args.concurrency)
+            results[f"{format} {name}"] = report(f"{format} {name}", latencies, wall)
+    return results
+
+
+def _serve_stub_wikipedia(latency, urls):
+    with StubWikipediaServer(latency=latency) as server:
+        urls.put(server.url)
+        threading.Event().wait()
+
+
+def blocking_stub_query(client):
+    """awikipedia_lookup's two requests on a blocking client, so both sides pay for real HTTP."""
+    def run(query):
+        search = client.get(tools.WIKI_API_URL, params=tools._search_params(query)).json()
+        titles = [hit["title"] for hit in search.get("query", {}).get("search", [])]
+        extracts = client.get(tools.WIKI_API_URL, params=tools._extract_params(titles)).json()
+        return tools._format_pages(titles, extracts)
+    return run
+
+
+def bench_async_load(args):
+    import main
+
+    main.RESEARCH_MODE = args.research_mode
+    main.WRITER_MODE = args.writer_mode
+    main.llm = FakeChatModel(latency=args.llm_latency, tokens_per_second=args.tps)
+    tools.wiki_rate_limiter = tools.TokenBucket(1000, 1000)
+    tools.wiki_cache.path = None
+    topics = [f"{args.topic} {i}" for i in range(args.generations)]
+
+    peak_threads = [0]
+    sampling = threading.Event()
+
+    def sample_threads():
+        while not sampling.wait(0.05):
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+    def run_threads():
+        def one(topic):
+            start = time.perf_counter()
+            main.create_enhanced_assignment(topic)
+            return time.perf_counter() - start
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            return list(pool.map(one, topics))
+
+    def run_async():
+        async def all_generations():
+            limit = asyncio.Semaphore(args.concurrency)
+
+            async def one(topic):
+                async with limit:
+                    start = time.perf_counter()
+                    await main.acreate_enhanced_assignment(topic)
+                    return time.perf_counter() - start
+            try:
+                return await asyncio.gather(*(one(topic) for topic in topics))
+            finally:
+                await tools.aclose_wikipedia_client()
+        return asyncio.run(all_generations())
+
+    # Serve the stub from its own process so its handler threads do not compete for this one's GIL.
+    # Each async lookup is a search request plus an extracts request, so they split the latency.
+    urls = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve_stub_wikipedia, args=(args.latency / 2, urls), daemon=True)
+    server.start()
+    tools.WIKI_API_URL = urls.get(timeout=10)
+    http = httpx.Client(limits=httpx.Limits(max_connections=None, max_keepalive_connections=50))
+    tools._run_wikipedia_query = blocking_stub_query(http)
+
+    results = {}
+    try:
+        for name, run in (("threads", run_threads), ("async", run_async)):
+            tools.wiki_cache.clear()
+            peak_threads[0] = threading.active_count()
+            sampling.clear()
+            sampler = threading.Thread(target=sample_threads, daemon=True)
+            sampler.start()
+            start = time.perf_counter()
+            # AgentExecutor(verbose=True) prints every step; keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencies = run()
+            wall = time.perf_counter() - start
+            sampling.set()
+            sampler.join()
+            results[name] = {"wall_seconds": wall, "peak_threads": peak_threads[0],
+                             "generations_per_minute": len(latencies) / wall * 60}
+            print(f"{name:>8}: {wall:6.2f}s wall, {len(latencies) / wall * 60:6.1f} generations/min, "
+                  f"p50 {statistics.median(latencies):.2f}s, p95 {percentile(latencies, 95):.2f}s, "
+                  f"peak {peak_threads[0]} threads")
+    finally:
+        http.close()
+        server.terminate()
+
+    print(f"{args.generations} generations, {args.concurrency} at a time, research={args.research_mode}, "
+          f"writer={args.writer_mode}")
+    return results
+
+
+def bench_isolation(args):
+    import main
+
+    main.RESEARCH_MODE = args.research_mode
+    main.WRITER_MODE = "single"
+    main.SOURCE_VERIFY = False
+    main.llm = FakeChatModel(latency=0.01, tokens_per_second=1e6)
+    tools.wiki_rate_limiter = tools.TokenBucket(1e6, 1e6)
+    tools.wiki_cache.path = None
+    tools.wiki_cache.clear()
+
+    # Random lookup latency so the generations' research interleaves differently on every run
+    def lookup(query):
+        time.sleep(random.uniform(0, args.latency))
+        return stub_article(query, 800)
+
+    async def alookup(query):
+        await asyncio.sleep(random.uniform(0, args.latency))
+        return stub_article(query, 800)
+
+    tools._run_wikipedia_query = lookup
+    tools._arun_wikipedia_query = alookup
+    topics = [f"Isolation{i:03d}" for i in range(args.generations)]
+
+    def leaked(topic, result):
+        """Sources in a generation's output that belong to another generation's research."""
+        sources = json.loads(result["output"])["sources"]
+        return [source for source in sources if topic not in source], len(sources)
+
+    def run_threads():
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            return list(pool.map(main.create_enhanced_assignment, topics))
+
+    def run_async():
+        async def all_generations():
+            return await asyncio.gather(*(main.acreate_enhanced_assignment(topic) for topic in topics))
+        return asyncio.run(all_generations())
+
+    failures = 0
+    results = {}
+    for name, run in (("threads", run_threads), ("async", run_async)):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            outputs = run()
+        wall = time.perf_counter() - start
+        checks = [leaked(topic, result) for topic, result in zip(topics, outputs)]
+        foreign = sum(len(wrong) for wrong, _ in checks)
+        empty = sum(1 for _, count in checks if not count)
+        failures += foreign + empty
+        results[name] = {"seconds": round(wall, 3), "foreign_sources": foreign, "without_sources": empty}
+        print(f"{name:>8}: {len(topics)} generations in {wall:.2f}s, "
+              f"{sum(count for _, count in checks)} sources, {foreign} from other generations, "
+              f"{empty} generations without sources")
+    if failures:
+        raise SystemExit(f"research state leaked between concurrent generations ({failures} problems)")
+    print("no cross-talk between concurrent generations")
+    return results
+
+
+def bench_llm_cache(args):
+    import main
+    from cache import ResultCache
+    from llmcache import LLMResponseCache
+
+    llm_cache = LLMResponseCache(ResultCache("llm_responses", max_entries=4096))
+    main.llm_cache = llm_cache
+    main.RESEARCH_MODE = args.research_mode
+    main.WRITER_MODE = args.writer_mode
+    main.SOURCE_VERIFY = False
+    main.llm = FakeChatModel(latency=args.llm_latency, tokens_per_second=args.tps, cache=llm_cache)
+    tools._run_wikipedia_query = stub_wikipedia(latency=0)
+    tools.wiki_cache.path = None
+
+    results = {}
+    for name, force_fresh in (("cold", False), ("cached", False), ("force_fresh", True)):
+        main.result_cache.clear()
+        before = llm_cache.stats()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = main.get_or_create_assignment(args.topic, force_fresh=force_fresh)
+        wall = time.perf_counter() - start
+        after = llm_cache.stats()
+        json.loads(result["output"])
+        print(f"{name:>12}: {wall:6.2f}s, {result['llm_calls']} LLM calls, "
+              f"{after['hits'] - before['hits']} cache hits, {after['misses'] - before['misses']} misses, "
+              f"{after['bypassed'] - before['bypassed']} bypassed")
+        results[name] = {"seconds": round(wall, 3), "hits": after["hits"] - before["hits"],
+                         "misses": after["misses"] - before["misses"]}
+    return results
+
+
+def bench_writer_stream(args):
+    import main
+    from jsonstream import IncrementalJSONParser, parse_json_object
+
+    text = json.dumps(sample_assignment(args.topic), indent=2)
+    parse_seconds = timed(lambda: [parse_json_object(text) for _ in range(100)])
+    print(f"parse_json_object: {parse_seconds * 10:.2f} ms for {len(text)} chars")
+    results = {"parse_ms": round(parse_seconds * 10, 3), "recovered_sections": {}}
+
+    # Feed the document in token-sized pieces and note where each part became available
+    parser = IncrementalJSONParser()
+    available = []
+    for i in range(0, len(text), 4):
+        for event in parser.feed(text[i:i + 4]):
+            if event[1] in ("introduction", "conclusion") or event[0] == "item" and event[1] == "main_sections":
+                available.append(f"{event[1]}{'' if event[0] == 'field' else f'[{event[2]}]'} {(i + 4) / len(text):.0%}")
+    print("parts complete after this much of the stream: " + ", ".join(available))
+
+    print("recovery from output truncated at:")
+    for cut in (0.1, 0.3, 0.5, 0.7, 0.9, 0.99):
+        recovered, complete = parse_json_object(text[:int(len(text) * cut)])
+        sections = [s for s in recovered.get("main_sections", []) if isinstance(s, dict)]
+        print(f"  {cut:4.0%}: {len(sections)} of 4 sections, fields {sorted(recovered)}")
+        results["recovered_sections"][f"{cut:.0%}"] = len(sections)
+
+    main.RESEARCH_MODE = "template"
+    main.WRITER_MODE = "single"
+    main.SOURCE_VERIFY = False
+    main.llm = FakeChatModel(latency=args.llm_latency, tokens_per_second=args.tps, streaming=True)
+    tools._run_wikipedia_query = stub_wikipedia(latency=0)
+    tools.wiki_cache.path = None
+
+    arrivals = []
+    start = time.perf_counter()
+
+    def on_event(event):
+        if event["type"] == "section":
+            arrivals.append((time.perf_counter() - start, event["part"]))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.create_enhanced_assignment(args.topic, on_event=on_event)
+    total = time.perf_counter() - start
+    print(f"streamed single-shot writer: first part ({arrivals[0][1]}) at {arrivals[0][0]:.2f}s, "
+          f"{len(arrivals)} parts, full document at {total:.2f}s")
+    results.update(first_part_seconds=round(arrivals[0][0], 3), document_seconds=round(total, 3))
+    return results
+
+
+def bench_pipeline(args):
+    import main
+
+    main.RESEARCH_MODE = args.research_mode
+    main.SOURCE_VERIFY = False
+    main.llm = FakeChatModel(latency=args.llm_latency, tokens_per_second=args.tps)
+    tools.wiki_rate_limiter = tools.TokenBucket(1000, 1000)
+    tools.wiki_cache.path = None
+
+    # Each query gets its own fixed latency, so lookups land one after another as they would live
+    def delay(query):
+        return args.latency * random.Random(query).uniform(0.5, 1.5)
+
+    def lookup(query):
+        time.sleep(delay(query))
+        return stub_article(query)
+
+    async def alookup(query):
+        await asyncio.sleep(delay(query))
+        return stub_article(query)
+
+    tools._run_wikipedia_query = lookup
+    tools._arun_wikipedia_query = alookup
+
+    def measure(topic, writer_mode, run_async):
+        main.WRITER_MODE = writer_mode
+        tools.wiki_cache.clear()
+        marks = {}
+        start = time.perf_counter()
+
+        def on_event(event):
+            elapsed = time.perf_counter() - start
+            if event["type"] == "research_complete":
+                marks.setdefault("research", elapsed)
+            elif event["type"] == "section" and event.get("part") == "section":
+                marks.setdefault("first_section", elapsed)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            if run_async:
+                result = asyncio.run(main.acreate_enhanced_assignment(topic, on_event=on_event))
+            else:
+                result = main.create_enhanced_assignment(topic, on_event=on_event)
+        total = time.perf_counter() - start
+        assert not result.get("error") and len(json.loads(result["output"])["main_sections"]) == 4, result
+        return {"research_seconds": round(marks["research"], 3),
+                "first_section_seconds": round(marks["first_section"], 3), "total_seconds": round(total, 3)}
+
+    results = {}
+    for run_async in (False, True):
+        for writer_mode in ("parallel", "pipelined"):
+            name = f"{writer_mode}{' async' if run_async else ''}"
+            # A different topic per run varies which lookup lands first
+            samples = [measure(f"{args.topic} {run}", writer_mode, run_async) for run in range(args.runs)]
+            results[name] = {key: round(statistics.median(sample[key] for sample in samples), 3)
+                             for key in samples[0]}
+            print(f"{name:>16}: research done {results[name]['research_seconds']:5.2f}s, first section "
+                  f"{results[name]['first_section_seconds']:5.2f}s, total {results[name]['total_seconds']:5.2f}s")
+    print(f"research={args.research_mode}, lookups {args.latency * 0.5:.2f}-{args.latency * 1.5:.2f}s, "
+          f"median of {args.runs} runs")
+    return results
+
+
+# Imported on first use (see app.preload); importing the app must not load any of them
+LAZY_MODULES = ("reportlab", "docx", "langchain_groq", "groq", "langchain.agents", "langchain_community")
+
+
+def _import_in_subprocess(module, env, importtime=False):
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "seconds = time.perf_counter() - start\n"
+        f"print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    done = subprocess.run(command, capture_output=True, text=True, env=env, check=True)
+    return json.loads(done.stdout.strip().splitlines()[-1]), done.stderr
+
+
+def _self_time_by_package(importtime_log):
+    """Sum -X importtime self times (microseconds) per top-level package."""
+    totals = {}
+    for line in importtime_log.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+\d+ \|\s+(\S+)", line)
+        if match:
+            package = match.group(2).split(".")[0]
+            totals[package] = totals.get(package, 0) + int(match.group(1))
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+
+def bench_startup(args):
+    """Import time of each entry point in fresh interpreters, as a gunicorn worker or cold start sees it."""
+    env = dict(os.environ, GROQ_API_KEY=os.getenv("GROQ_API_KEY", "benchmark"), METRICS_LOG="0",
+               PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    env.pop("PRELOAD", None)
+    results = {}
+    failures = []
+    for name, module, extra in (
+        ("import main", "main", {}),
+        ("import app", "app", {}),
+        ("import app, PRELOAD=1", "app", {"PRELOAD": "1"}),
+    ):
+        runs = [_import_in_subprocess(module, dict(env, **extra))[0] for _ in range(args.runs)]
+        seconds = [run["seconds"] for run in runs]
+        loaded = runs[0]["loaded"]
+        results[name] = {"p50_ms": round(statistics.median(seconds) * 1000, 1),
+                         "max_ms": round(max(seconds) * 1000, 1)}
+        print(f"{name:>22}: p50 {results[name]['p50_ms']:7.1f} ms  max {results[name]['max_ms']:7.1f} ms"
+              f"{'  loads ' + ', '.join(loaded) if loaded else ''}")
+        if not extra and loaded:
+            failures.append(f"{name} loads {', '.join(loaded)}")
+        if not extra and args.budget and statistics.median(seconds) > args.budget:
+            failures.append(f"{name} took {statistics.median(seconds):.2f}s (budget {args.budget:.2f}s)")
+
+    _, log = _import_in_subprocess("app", env, importtime=True)
+    print("largest self import times for `import app`:")
+    for package, micros in _self_time_by_package(log)[:args.top]:
+        print(f"  {package:<28} {micros / 1000:7.1f} ms")
+    if failures:
+        raise SystemExit("startup regressed: " + "; ".join(failures))
+    return results
+
+
+def bench_micro(args):
+    import app as web
+    from jsonstream import parse_json_object
+
+    assignment = sample_assignment(args.topic)
+    text = json.dumps(assignment, indent=2)
+    fenced = f"Here is the assignment:\n```json\n{text}\n```"
+    cases = (
+        ("parse_json_object", lambda: parse_json_object(fenced)),
+        ("format_content_as_text", lambda: web.format_content_as_text(assignment)),
+        ("render_cache_key", lambda: web.render_cache_key(assignment, "pdf")),
+        ("create_txt_file", lambda: web.create_txt_file(assignment)),
+        ("create_pdf_file", lambda: web.create_pdf_file(assignment)),
+        ("create_docx_file", lambda: web.create_docx_file(assignment)),
+    )
+    results = {}
+    for name, func in cases:
+        if args.only and name not in args.only:
+            continue
+        func()
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            latencies.append(timed(func))
+        wall = time.perf_counter() - start
+        results[name] = report(name, latencies, wall)
+    print(f"{args.iterations} calls each on a {len(text)}-char assignment")
+    return results
+
+
+def bench_load(args):
+    """End-to-end load on the Flask routes, served over real HTTP, with a fake LLM and stub Wikipedia."""
+    # The job queue is built when app is imported, so size it first
+    os.environ["JOB_WORKERS"] = str(args.workers)
+    os.environ["JOB_QUEUE_MAX_DEPTH"] = str(max(args.generations, 20))
+    import main
+    import app as web
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    main.RESEARCH_MODE = args.research_mode
+    main.WRITER_MODE = args.writer_mode
+    main.SOURCE_VERIFY = False
+    main.llm = FakeChatModel(latency=args.llm_latency, tokens_per_second=args.tps)
+    tools.wiki_rate_limiter = tools.TokenBucket(1000, 1000)
+    tools.wiki_cache.path = None
+    tools.wiki_cache.clear()
+
+    urls = multiprocessing.Queue()
+    stub = multiprocessing.Process(target=_serve_stub_wikipedia, args=(args.latency / 2, urls), daemon=True)
+    stub.start()
+    tools.WIKI_API_URL = urls.get(timeout=10)
+    wiki_http = httpx.Client(limits=httpx.Limits(max_connections=None, max_keepalive_connections=50))
+    tools._run_wikipedia_query = blocking_stub_query(wiki_http)
+
+    server = make_server("127.0.0.1", 0, web.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    latencies = {route: [] for route in ("POST /generate", "GET /jobs/<id>", "GET /jobs/<id>/result",
+                                          "GET /download/<format>")}
+    lock = threading.Lock()
+    topics = [f"{args.topic} {i % args.distinct_topics}" for i in range(args.generations)]
+
+    def call(client, route, method, url, **kwargs):
+        start = time.perf_counter()
+        response = client.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies[route].append(elapsed)
+        return response
+
+    def user(topic):
+        """One browser session: submit, poll until done, fetch the result, download every format."""
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            start = time.perf_counter()
+            response = call(client, "POST /generate", "POST", "/generate", json={"topic": topic})
+            assert response.status_code == 202, response.text
+            job_id = response.json()["job_id"]
+            while call(client, "GET /jobs/<id>", "GET", f"/jobs/{job_id}").json()["status"] not in ("done", "failed"):
+                time.sleep(args.poll_interval)
+            response = call(client, "GET /jobs/<id>/result", "GET", f"/jobs/{job_id}/result")
+            assert response.status_code == 200, response.text
+            generation = time.perf_counter() - start
+            for format in args.formats:
+                response = call(client, "GET /download/<format>", "GET", f"/download/{format}",
+                                params={"assignment_id": job_id})
+                assert response.status_code == 200, response.status_code
+            return generation
+
+    results = {}
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=args.users) as pool:
+                generations = list(pool.map(user, topics))
+        wall = time.perf_counter() - start
+        for route, samples in latencies.items():
+            results[route] = report(route, samples, wall)
+        results["generations"] = {
+            "count": len(generations),
+            "wall_seconds": round(wall, 3),
+            "generations_per_minute": round(len(generations) / wall * 60, 2),
+            "p50_seconds": round(statistics.median(generations), 3),
+            "p95_seconds": round(percentile(generations, 95), 3),
+        }
+        print(f"{len(generations)} generations ({len(set(topics))} distinct topics) from {args.users} users "
+              f"in {wall:.2f}s: {results['generations']['generations_per_minute']:.1f} generations/min, "
+              f"p50 {statistics.median(generations):.2f}s, p95 {percentile(generations, 95):.2f}s submit-to-result")
+    finally:
+        server.shutdown()
+        wiki_http.close()
+        stub.terminate()
+    return results
+
+
+def _numeric_leaves(value, prefix=""):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _numeric_leaves(item, f"{prefix}.{key}" if prefix else str(key))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def _last_record(path, benchmark, skip=0):
+    records = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record["benchmark"] == benchmark:
+                    records.append(record)
+    return records[-1 - skip] if len(records) > skip else None
+
+
+def write_record(path, benchmark, args, results):
+    """Append one JSON line per run so results can be compared across commits."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    params = {key: value for key, value in vars(args).items() if key not in ("func", "json", "command")}
+    record = {
+        "benchmark": benchmark,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "params": params,
+        "results": results,
+    }
+    with open(path, "a") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+    print(f"results appended to {path}")
+
+
+def compare_results(args):
+    """Diff the numeric results of a benchmark's last run against a baseline run."""
+    current = _last_record(args.current or args.baseline, args.benchmark)
+    baseline = _last_record(args.baseline, args.benchmark, skip=0 if args.current else 1)
+    if current is None or baseline is None:
+        raise SystemExit(f"need two '{args.benchmark}' runs to compare")
+    before = dict(_numeric_leaves(baseline["results"]))
+    regressions = 0
+    print(f"{args.benchmark}: {baseline['commit']} ({baseline['timestamp']}) -> {current['commit']} ({current['timestamp']})")
+    for name, value in _numeric_leaves(current["results"]):
+        if name not in before or name.endswith(("requests", "count")):
+            continue
+        old = before[name]
+        change = (value - old) / old * 100 if old else 0.0
+        # Latencies and durations regress upwards, throughput regresses downwards
+        higher_is_worse = not name.endswith(("rps", "per_minute"))
+        worse = change > args.threshold if higher_is_worse else change < -args.threshold
+        regressions += worse
+        print(f"  {name:<48} {old:>12.3f} -> {value:>12.3f}  {change:+7.1f}%{'  REGRESSION' if worse else ''}")
+    if regressions and args.fail:
+        raise SystemExit(f"{regressions} results regressed by more than {args.threshold}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--json", metavar="PATH", help="append the results as a JSON line to PATH")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    research = commands.add_parser("research", help="serial vs parallel comprehensive_topic_research")
+    research.add_argument("--topic", default="Photosynthesis")
+    research.add_argument("--latency", type=float, default=0.3, help="stubbed Wikipedia latency in seconds")
+    research.add_argument("--runs", type=int, default=3)
+    research.set_defaults(func=bench_research)
+
+    downloads = commands.add_parser("downloads", help="download latency/throughput under concurrent requests")
+    downloads.add_argument("--formats", nargs="+", default=["txt", "pdf", "docx"])
+    downloads.add_argument("--requests", type=int, default=200)
+    downloads.add_argument("--concurrency", type=int, default=8)
+    downloads.set_defaults(func=bench_downloads)
+
+    context = commands.add_parser("context", help="writer research context: size vs. raw research, prompt tokens and latency with and without it")
+    context.add_argument("--topic", default="Photosynthesis")
+    context.add_argument("--budget", type=int, default=tools.RESEARCH_CONTEXT_TOKENS)
+    context.add_argument("--writer-mode", default="single", choices=["single", "parallel"])
+    context.add_argument("--llm-latency", type=float, default=0.2)
+    context.add_argument("--tps", type=float, default=2000.0, help="fake LLM output tokens per second")
+    context.add_argument("--prompt-tps", type=float, default=5000.0, help="fake LLM prompt tokens read per second")
+    context.add_argument("--runs", type=int, default=3)
+    context.set_defaults(func=bench_context)
+
+    writer = commands.add_parser("writer", help="single-shot vs section-parallel writing with a fake LLM")
+    writer.add_argument("--topic", default="Photosynthesis")
+    writer.add_argument("--latency", type=float, default=0.3)
+    writer.add_argument("--tps", type=float, default=100.0, help="fake LLM output tokens per second")
+    writer.add_argument("--workers", type=int, default=6)
+    writer.set_defaults(func=bench_writer)
+
+    modes = commands.add_parser("research-modes", help="agent loop vs planner vs template research")
+    modes.add_argument("--topic", default="Photosynthesis")
+    modes.add_argument("--queries", type=int, default=5, help="lookups the fake research agent makes")
+    modes.add_argument("--latency", type=float, default=0.3, help="stubbed Wikipedia latency in seconds")
+    modes.add_argument("--llm-latency", type=float, default=0.5)
+    modes.add_argument("--tps", type=float, default=200.0)
+    modes.set_defaults(func=bench_research_modes)
+
+    overhead = commands.add_parser("overhead", help="per-request object construction cost with zero-latency stubs")
+    overhead.add_argument("--topic", default="Photosynthesis")
+    overhead.add_argument("--queries", type=int, default=5, help="lookups the fake research agent makes")
+    overhead.add_argument("--runs", type=int, default=50)
+    overhead.set_defaults(func=bench_overhead)
+
+    http = commands.add_parser("http", help="fresh connections vs the shared keep-alive session")
+    http.add_argument("--topic", default="Photosynthesis")
+    http.add_argument("--requests", type=int, default=500)
+    http.add_argument("--concurrency", type=int, default=8)
+    http.set_defaults(func=bench_http)
+
+    backends = commands.add_parser("backends", help="live API (stub server) vs local FTS5 index lookups")
+    backends.add_argument("--articles", type=int, default=20000)
+    backends.add_argument("--requests", type=int, default=400)
+    backends.add_argument("--concurrency", type=int, default=8)
+    backends.add_argument("--latency", type=float, default=0.3, help="stubbed Wikipedia latency per lookup")
+    backends.set_defaults(func=bench_backends)
+
+    load = commands.add_parser("async-load", help="concurrent generations on threads vs one event loop")
+    load.add_argument("--topic", default="Photosynthesis")
+    load.add_argument("--generations", type=int, default=32)
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--research-mode", default="planner", choices=["agent", "planner", "template"])
+    load.add_argument("--writer-mode", default="parallel", choices=["single", "parallel"])
+    load.add_argument("--latency", type=float, default=0.3, help="stubbed Wikipedia latency in seconds")
+    load.add_argument("--llm-latency", type=float, default=0.3)
+    load.add_argument("--tps", type=float, default=400.0)
+    load.set_defaults(func=bench_async_load)
+
+    isolation = commands.add_parser("isolation", help="stress check: concurrent generations keep their own sources")
+    isolation.add_argument("--generations", type=int, default=50)
+    isolation.add_argument("--concurrency", type=int, default=25)
+    isolation.add_argument("--research-mode", default="template", choices=["agent", "planner", "template"])
+    isolation.add_argument("--latency", type=float, default=0.05, help="max stubbed Wikipedia latency in seconds")
+    isolation.set_defaults(func=bench_isolation)
+
+    llm_cache = commands.add_parser("llm-cache", help="regenerating a topic with and without cached LLM responses")
+    llm_cache.add_argument("--topic", default="Photosynthesis")
+    llm_cache.add_argument("--research-mode", default="agent", choices=["agent", "planner", "template"])
+    llm_cache.add_argument("--writer-mode", default="single", choices=["single", "parallel"])
+    llm_cache.add_argument("--llm-latency", type=float, default=0.3)
+    llm_cache.add_argument("--tps", type=float, default=400.0)
+    llm_cache.set_defaults(func=bench_llm_cache)
+
+    writer_stream = commands.add_parser("writer-stream", help="incremental JSON parsing of the writer's output")
+    writer_stream.add_argument("--topic", default="Photosynthesis")
+    writer_stream.add_argument("--llm-latency", type=float, default=0.3)
+    writer_stream.add_argument("--tps", type=float, default=400.0)
+    writer_stream.set_defaults(func=bench_writer_stream)
+
+    micro = commands.add_parser("micro", help="output parsing, text formatting and the txt/pdf/docx renderers")
+    micro.add_argument("--topic", default="Photosynthesis")
+    micro.add_argument("--iterations", type=int, default=50)
+    micro.add_argument("--only", nargs="*", help="run only these cases")
+    micro.set_defaults(func=bench_micro)
+
+    http_load = commands.add_parser("load", help="end-to-end load on the Flask routes over HTTP")
+    http_load.add_argument("--topic", default="Photosynthesis")
+    http_load.add_argument("--generations", type=int, default=16)
+    http_load.add_argument("--distinct-topics", type=int, default=8,
+                           help="repeated topics are served from the result cache")
+    http_load.add_argument("--users", type=int, default=8, help="concurrent simulated users")
+    http_load.add_argument("--workers", type=int, default=4, help="JOB_WORKERS for the app under test")
+    http_load.add_argument("--formats", nargs="+", default=["txt", "pdf", "docx"])
+    http_load.add_argument("--poll-interval", type=float, default=0.2)
+    http_load.add_argument("--research-mode", default="planner", choices=["agent", "planner", "template"])
+    http_load.add_argument("--writer-mode", default="single", choices=["single", "parallel"])
+    http_load.add_argument("--llm-latency", type=float, default=0.3)
+    http_load.add_argument("--tps", type=float, default=400.0)
+    http_load.add_argument("--latency", type=float, default=0.2, help="stubbed Wikipedia latency per lookup")
+    http_load.set_defaults(func=bench_load)
+
+    pipeline = commands.add_parser("pipeline", help="writing after all research vs pipelined with the lookups")
+    pipeline.add_argument("--topic", default="Photosynthesis")
+    pipeline.add_argument("--research-mode", default="template", choices=["planner", "template"])
+    pipeline.add_argument("--runs", type=int, default=5)
+    pipeline.add_argument("--llm-latency", type=float, default=0.3)
+    pipeline.add_argument("--tps", type=float, default=400.0)
+    pipeline.add_argument("--latency", type=float, default=1.5, help="mean stubbed Wikipedia latency per lookup")
+    pipeline.set_defaults(func=bench_pipeline)
+
+    startup = commands.add_parser("startup", help="import time of main and app in fresh interpreters")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--top", type=int, default=10, help="packages listed by import self time")
+    startup.add_argument("--budget", type=float, help="fail if a plain import takes longer (seconds)")
+    startup.set_defaults(func=bench_startup)
+
+    compare = commands.add_parser("compare", help="compare the last two recorded runs of a benchmark")
+    compare.add_argument("benchmark", help="benchmark name, e.g. load or micro")
+    compare.add_argument("baseline", help="JSON lines file written with --json")
+    compare.add_argument("current", nargs="?", help="second results file (default: the baseline file's last run)")
+    compare.add_argument("--threshold", type=float, default=10.0, help="percent change reported as a regression")
+    compare.add_argument("--fail", action="store_true", help="exit non-zero when anything regressed")
+    compare.set_defaults(func=compare_results)
+
+    args = parser.parse_args()
+    results = args.func(args)
+    if args.json and results is not None:
+        write_record(args.json, args.command, args, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """In-process LRU cache with TTL and size eviction, optionally backed by SQLite.
+
+    The memory tier holds any value. When ``path`` is set, values are also written
+    to a SQLite table (as JSON) so they survive restarts and can be shared by
+    several processes; every ``evict_every`` writes the disk tier evicts expired rows
+    and, when it holds more than ``max_disk_entries``, the oldest rows past that.
+    """
+
+    def __init__(self, name, max_entries=1024, ttl=None, path=None, max_bytes=None,
+                 max_disk_entries=None, sizeof=None, evict_every=100):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path or None
+        self.max_bytes = max_bytes
+        self.max_disk_entries = max_disk_entries or max_entries * 20
+        self.evict_every = evict_every
+        self.sizeof = sizeof or (lambda value: len(value) if isinstance(value, (str, bytes)) else 0)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._db = None
+        self._db_pid = None
+        self._writes_since_evict = 0
+
+    def _connection(self):
+        if not self.path:
+            return None
+        if self._db is None or self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "stored_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+            )
+            # Lets eviction find expired and oldest rows without scanning the namespace
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS cache_entries_age ON cache_entries (namespace, stored_at)"
+            )
+            self._db.commit()
+            self._db_pid = os.getpid()
+            # Check the table once per process before counting writes
+            self._writes_since_evict = self.evict_every
+        return self._db
+
+    def _expired(self, stored_at, now=None):
+        return self.ttl is not None and (now or time.time()) - stored_at > self.ttl
+
+    def _remember(self, key, value, stored_at):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[2]
+        self._entries[key] = (stored_at, value, size)
+        self._bytes += size
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[2]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._forget(key)
+
+            db = self._connection()
+            if db is not None:
+                row = db.execute(
+                    "SELECT value, stored_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.name, key),
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[1]):
+                        value = json.loads(row[0])
+                        self._remember(key, value, row[1])
+                        self.hits += 1
+                        return value
+                    db.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.name, key))
+                    db.commit()
+
+            self.misses += 1
+            return default
+
+    async def aget(self, key, default=None):
+        """get() for coroutines: memory hits answer inline, the SQLite tier is read on a worker thread."""
+        if self.path is None or self._in_memory(key):
+            return self.get(key, default)
+        return await asyncio.to_thread(self.get, key, default)
+
+    def _in_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._expired(entry[0])
+
+    def age(self, key):
+        """Seconds since `key` was stored, even past the TTL, or None if it is not stored.
+
+        Unlike get() this does not count as a lookup or refresh the LRU order.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return time.time() - entry[0]
+            db = self._connection()
+            if db is not None:
+                row = db.execute(
+                    "SELECT stored_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.name, key),
+                ).fetchone()
+                if row is not None:
+                    return time.time() - row[0]
+            return None
+
+    def set(self, key, value):
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, value, stored_at)
+
+            db = self._connection()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, stored_at) VALUES (?, ?, ?, ?)",
+                    (self.name, key, json.dumps(value), stored_at),
+                )
+                self._writes_since_evict += 1
+                if self._writes_since_evict >= self.evict_every:
+                    self._evict_disk(db, stored_at)
+                db.commit()
+
+    async def aset(self, key, value):
+        """set() for coroutines: the SQLite write runs on a worker thread."""
+        if self.path is None:
+            self.set(key, value)
+        else:
+            await asyncio.to_thread(self.set, key, value)
+
+    def _evict_disk(self, db, now):
+        self._writes_since_evict = 0
+        if self.ttl is not None:
+            db.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND stored_at < ?",
+                (self.name, now - self.ttl),
+            )
+        count = db.execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.name,)).fetchone()[0]
+        if count <= self.max_disk_entries:
+            return
+        db.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+            "SELECT key FROM cache_entries WHERE namespace = ? ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.name, self.name, self.max_disk_entries),
+        )
+
+    def delete(self, key):
+        with self._lock:
+            self._forget(key)
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.name, key))
+                db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.name,))
+                db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+                "persistent": self.path is not None,
+            }
@@ -0,0 +1,6 @@
+import os
+
+# Tests run offline and must not leave cache files behind or log every pipeline stage
+os.environ.setdefault("WIKI_CACHE_PATH", "")
+os.environ.setdefault("LLM_CACHE", "0")
+os.environ.setdefault("METRICS_LOG", "0")
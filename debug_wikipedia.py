@@ -1,19 +1,14 @@
 # First, let's test if Wikipedia is working at all
-from langchain_community.tools import WikipediaQueryRun
-from langchain_community.utilities import WikipediaAPIWrapper
-import requests
+from httpclient import get_session, get_http_stats
+from tools import wikipedia_lookup
 
 def test_wikipedia_basic():
     """Test basic Wikipedia functionality"""
     print("🧪 Testing Basic Wikipedia Access...")
     
     try:
-        # Test direct Wikipedia API
-        api_wrapper = WikipediaAPIWrapper(top_k_results=1, doc_content_chars_max=500)
-        wiki_tool = WikipediaQueryRun(api_wrapper=api_wrapper)
-        
-        # Test with a simple, well-known topic
-        result = wiki_tool.run("Liverpool Football Club")
+        # Test the same lookup the research tools use
+        result = wikipedia_lookup("Liverpool Football Club", top_k_results=1, chars_max=500)
         
         print("✅ Wikipedia API is working!")
         print(f"Sample result (first 200 chars): {result[:200]}...")
@@ -29,7 +24,7 @@ def test_wikipedia_requests():
     
     try:
         url = "https://en.wikipedia.org/api/rest_v1/page/summary/Liverpool_F.C."
-        response = requests.get(url, timeout=10)
+        response = get_session().get(url, timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -50,25 +45,21 @@ def test_comprehensive_liverpool_facts():
     print("\n📊 Getting Comprehensive Liverpool FC Facts...")
     
     try:
-        api_wrapper = WikipediaAPIWrapper(
-            top_k_results=1, 
-            doc_content_chars_max=3000,
-            load_all_available_meta=True
-        )
-        wiki_tool = WikipediaQueryRun(api_wrapper=api_wrapper)
+        def lookup(query):
+            return wikipedia_lookup(query, top_k_results=1, chars_max=3000)
         
         # Get main Liverpool FC page
-        main_result = wiki_tool.run("Liverpool Football Club")
+        main_result = lookup("Liverpool Football Club")
         print("📄 Main Liverpool FC Page:")
         print(main_result[:500] + "...")
         
         # Get specific historical info
-        history_result = wiki_tool.run("Liverpool F.C. European Cup history")
+        history_result = lookup("Liverpool F.C. European Cup history")
         print("\n🏆 European Cup History:")
         print(history_result[:500] + "...")
         
         # Get manager info
-        managers_result = wiki_tool.run("Liverpool F.C. managers")
+        managers_result = lookup("Liverpool F.C. managers")
         print("\n👨‍💼 Managers Info:")
         print(managers_result[:500] + "...")
         
@@ -147,6 +138,11 @@ if __name__ == "__main__":
         print("❌ Wikipedia integration completely broken")
         print("🔧 Need to fix basic Wikipedia access first")
     
+    print("\n🔌 CONNECTION REUSE:")
+    for host, counts in get_http_stats().items():
+        print(f"{host}: {counts['requests']} requests over {counts['connections_opened']} connections "
+              f"({counts['reuse_rate']:.0%} reused)")
+    
     print("\n📋 NEXT STEPS:")
     print("1. If Wikipedia works: Fix agent tool calling")
     print("2. If Wikipedia broken: Install dependencies")
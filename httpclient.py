@@ -0,0 +1,111 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+USER_AGENT = "AssignmentAgent/1.0 (https://github.com/hari8github/Assignment-Agent)"
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _count(host, field):
+    with _stats_lock:
+        counts = _stats.setdefault(host, {"requests": 0, "connections_opened": 0})
+        counts[field] += 1
+
+
+class _CountingPoolMixin:
+    """Counts HTTP exchanges and new connections, so reuse is requests - connections_opened."""
+
+    def _new_conn(self):
+        _count(self.host, "connections_opened")
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        _count(self.host, "requests")
+        return super()._make_request(*args, **kwargs)
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+class TimeoutSession(requests.Session):
+    """requests.Session that applies a default timeout to every call."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def create_session(pool_size=None, timeout=None, retries=None, backoff=None):
+    """A keep-alive session with a bounded connection pool and retry with exponential backoff.
+
+    Idempotent requests (GET/HEAD) are retried on connection errors and on 429/5xx,
+    honouring Retry-After.
+    """
+    retry = Retry(
+        total=HTTP_RETRIES if retries is None else retries,
+        backoff_factor=HTTP_BACKOFF if backoff is None else backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+    )
+    pool_size = pool_size or HTTP_POOL_SIZE
+    adapter = PooledAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = TimeoutSession(timeout or HTTP_TIMEOUT)
+    session.headers["User-Agent"] = USER_AGENT
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """The process-wide shared session; recreated after fork so children do not share sockets."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = create_session()
+                _session_pid = os.getpid()
+    return _session
+
+
+def get_http_stats():
+    """Per-host request and connection counts for this process."""
+    with _stats_lock:
+        hosts = {host: dict(counts) for host, counts in _stats.items()}
+    for counts in hosts.values():
+        counts["connections_reused"] = max(0, counts["requests"] - counts["connections_opened"])
+        counts["reuse_rate"] = round(counts["connections_reused"] / counts["requests"], 3) if counts["requests"] else 0.0
+    return hosts
@@ -0,0 +1,415 @@
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import log_event
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+# Pause after a failed claim (e.g. a locked database) before the worker tries again
+CLAIM_RETRY_SECONDS = 1.0
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class InMemoryJobBackend:
+    """Job storage local to one process."""
+
+    def __init__(self, max_depth=20, result_ttl=3600):
+        self.max_depth = max_depth
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._events = {}
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, payload):
+        with self._lock:
+            self._purge()
+            if self._depth() >= self.max_depth:
+                raise JobQueueFull(f"Job queue is full ({self.max_depth} jobs waiting)")
+            self._jobs[job_id] = {
+                "id": job_id,
+                "status": QUEUED,
+                "payload": payload,
+                "result": None,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+            }
+            self._events[job_id] = []
+        self._pending.put(job_id)
+
+    def claim(self, timeout=1.0):
+        try:
+            job_id = self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != QUEUED:
+                return None
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+            return job_id, job["payload"]
+
+    def finish(self, job_id, result=None, error=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job["status"] = FAILED if error else DONE
+                job["result"] = result
+                job["error"] = error
+                job["finished_at"] = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def add_event(self, job_id, event):
+        with self._lock:
+            events = self._events.get(job_id)
+            if events is not None:
+                events.append(event)
+
+    def events(self, job_id, after=0):
+        """Events with sequence number greater than `after`, as (seq, event) pairs."""
+        with self._lock:
+            events = self._events.get(job_id, [])
+            return list(enumerate(events[after:], after + 1))
+
+    def depth(self):
+        with self._lock:
+            return self._depth()
+
+    def _depth(self):
+        return sum(1 for job in self._jobs.values() if job["status"] == QUEUED)
+
+    def _purge(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id in [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < cutoff
+        ]:
+            del self._jobs[job_id]
+            self._events.pop(job_id, None)
+
+
+class SQLiteJobBackend:
+    """Job storage in a local SQLite file, shared by every process that opens it."""
+
+    def __init__(self, path, max_depth=20, result_ttl=3600, poll_interval=0.5, running_timeout=900):
+        self.path = path
+        self.max_depth = max_depth
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.running_timeout = running_timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, "
+                "result TEXT, error TEXT, created_at REAL NOT NULL, "
+                "started_at REAL, finished_at REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, event TEXT NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, seq)")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def submit(self, job_id, payload):
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            cutoff = time.time() - self.result_ttl
+            db.execute(
+                "DELETE FROM job_events WHERE job_id IN ("
+                "SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?)",
+                (cutoff,),
+            )
+            db.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+            waiting = db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+            if waiting >= self.max_depth:
+                raise JobQueueFull(f"Job queue is full ({self.max_depth} jobs waiting)")
+            db.execute(
+                "INSERT INTO jobs (id, status, payload, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(payload), time.time()),
+            )
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def _fail_abandoned(self, db, now):
+        """Fail jobs left running by a worker process that was killed or recycled mid-job."""
+        error = f"worker stopped before finishing (no result after {self.running_timeout:.0f}s)"
+        abandoned = db.execute(
+            "SELECT id FROM jobs WHERE status = ? AND started_at < ?", (RUNNING, now - self.running_timeout)
+        ).fetchall()
+        for row in abandoned:
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (FAILED, error, now, row["id"]),
+            )
+            db.execute(
+                "INSERT INTO job_events (job_id, event) VALUES (?, ?)",
+                (row["id"], json.dumps({"type": "status", "status": FAILED, "error": error})),
+            )
+
+    def claim(self, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        db = self._connection()
+        while True:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._fail_abandoned(db, now)
+                row = db.execute(
+                    "SELECT id, payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                        (RUNNING, now, row["id"]),
+                    )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            if row is not None:
+                return row["id"], json.loads(row["payload"])
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def finish(self, job_id, result=None, error=None):
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (FAILED if error else DONE, json.dumps(result), error, time.time(), job_id),
+        )
+
+    def get(self, job_id):
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def add_event(self, job_id, event):
+        self._connection().execute(
+            "INSERT INTO job_events (job_id, event) VALUES (?, ?)", (job_id, json.dumps(event))
+        )
+
+    def events(self, job_id, after=0):
+        """Events with sequence number greater than `after`, as (seq, event) pairs."""
+        rows = self._connection().execute(
+            "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after),
+        ).fetchall()
+        return [(row["seq"], json.loads(row["event"])) for row in rows]
+
+    def depth(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)
+        ).fetchone()[0]
+
+
+class JobQueue:
+    """Runs `handler(payload, emit)` for submitted jobs on a bounded pool of worker threads.
+
+    `emit(event_dict)` appends a progress event to the job, readable with `events()`.
+
+    With `async_handler`, jobs instead run as `await async_handler(payload, emit)` on one
+    event loop thread, up to `async_concurrency` at a time, so slow network waits do not
+    each hold a thread. Their events and outcomes are written to the backend in order on
+    one writer thread, so a SQLite backend never blocks the loop.
+
+    Workers are started lazily on first use in each process, so the queue is safe
+    to create at import time under a forking server. `stop()` shuts them down again.
+    """
+
+    def __init__(self, backend, handler=None, workers=1, async_handler=None, async_concurrency=1):
+        self.backend = backend
+        self.handler = handler
+        self.workers = workers
+        self.async_handler = async_handler
+        self.async_concurrency = async_concurrency
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        self._event_writer = None
+        self._loop = None
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def ensure_workers(self):
+        if self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self._stopping = threading.Event()
+            if self.async_handler is not None:
+                self._event_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-events")
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="job-event-loop", daemon=True).start()
+                self._threads = [
+                    threading.Thread(target=self._dispatch, args=(self._loop,), name="job-dispatcher", daemon=True)
+                ]
+            else:
+                self._threads = [
+                    threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                    for i in range(self.workers)
+                ]
+            for thread in self._threads:
+                thread.start()
+            self._started_pid = os.getpid()
+
+    def stop(self, timeout=5.0):
+        """Stop the workers once their current job ends; async jobs still running are abandoned.
+
+        A later submit() starts new workers.
+        """
+        with self._start_lock:
+            if self._started_pid != os.getpid():
+                return
+            self._stopping.set()
+            for thread in self._threads:
+                thread.join(timeout)
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._event_writer.shutdown(wait=True)
+                self._loop = self._event_writer = None
+            self._threads = []
+            self._started_pid = None
+
+    def submit(self, payload):
+        self.ensure_workers()
+        job_id = uuid.uuid4().hex
+        self.backend.submit(job_id, payload)
+        return job_id
+
+    def get(self, job_id):
+        self.ensure_workers()
+        return self.backend.get(job_id)
+
+    def events(self, job_id, after=0):
+        return self.backend.events(job_id, after)
+
+    def _emitter(self, job_id):
+        def emit(event):
+            self.backend.add_event(job_id, event)
+        return emit
+
+    def _finish(self, job_id, emit, result=None, error=None):
+        self.backend.finish(job_id, result=result, error=error)
+        if error:
+            emit({"type": "status", "status": FAILED, "error": error})
+        else:
+            emit({"type": "status", "status": DONE})
+
+    def _claim(self):
+        """backend.claim(), logging storage errors (e.g. a locked database) so the loop keeps draining."""
+        try:
+            return self.backend.claim()
+        except Exception as e:
+            log_event("job_claim_failed", error=str(e) or e.__class__.__name__)
+            self._stopping.wait(CLAIM_RETRY_SECONDS)
+            return None
+
+    def _work(self):
+        while not self._stopping.is_set():
+            claimed = self._claim()
+            if claimed is None:
+                continue
+            job_id, payload = claimed
+            try:
+                self._run(job_id, payload)
+            except Exception as e:
+                # Recording the outcome failed; the job is failed later as abandoned
+                log_event("job_finish_failed", job_id=job_id, error=str(e) or e.__class__.__name__)
+
+    def _run(self, job_id, payload):
+        emit = self._emitter(job_id)
+        emit({"type": "status", "status": RUNNING})
+        try:
+            result = self.handler(payload, emit)
+        except Exception as e:
+            self._finish(job_id, emit, error=str(e) or e.__class__.__name__)
+        else:
+            self._finish(job_id, emit, result=result)
+
+    def _dispatch(self, loop):
+        # Only claim a job once a slot is free, so queued jobs stay visible in depth()
+        slots = threading.BoundedSemaphore(self.async_concurrency)
+        while not self._stopping.is_set():
+            if not slots.acquire(timeout=1.0):
+                continue
+            claimed = self._claim()
+            if claimed is None:
+                slots.release()
+                continue
+            future = asyncio.run_coroutine_threadsafe(self._arun(*claimed), loop)
+            future.add_done_callback(lambda _: slots.release())
+
+    async def _arun(self, job_id, payload):
+        write = self._emitter(job_id)
+
+        def emit(event):
+            self._event_writer.submit(self._write_event, job_id, write, event)
+
+        emit({"type": "status", "status": RUNNING})
+        try:
+            result = await self.async_handler(payload, emit)
+        except Exception as e:
+            outcome = {"error": str(e) or e.__class__.__name__}
+        else:
+            outcome = {"result": result}
+        try:
+            # Queued behind the job's events, so the final status is always the last one
+            await asyncio.wrap_future(self._event_writer.submit(self._finish, job_id, write, **outcome))
+        except Exception as e:
+            log_event("job_finish_failed", job_id=job_id, error=str(e) or e.__class__.__name__)
+
+    @staticmethod
+    def _write_event(job_id, write, event):
+        try:
+            write(event)
+        except Exception as e:
+            log_event("job_event_failed", job_id=job_id, error=str(e) or e.__class__.__name__)
+
+
+def create_backend():
+    max_depth = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "20"))
+    result_ttl = float(os.getenv("JOB_RESULT_TTL", "3600"))
+    if os.getenv("JOB_BACKEND", "memory") == "sqlite":
+        return SQLiteJobBackend(
+            os.getenv("JOB_DB_PATH", "jobs.sqlite3"), max_depth=max_depth, result_ttl=result_ttl,
+            running_timeout=float(os.getenv("JOB_RUNNING_TIMEOUT", "900"))
+        )
+    return InMemoryJobBackend(max_depth=max_depth, result_ttl=result_ttl)
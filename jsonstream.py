@@ -0,0 +1,196 @@
+import json
+import re
+
+
+class IncrementalJSONParser:
+    """Tolerant incremental parser for one JSON object arriving in chunks.
+
+    `feed()` returns the events completed by each chunk: ("field", key, value) when a
+    top-level field closes and ("item", key, index, value) for each element of a
+    top-level array as it closes, so `main_sections` entries are available before the
+    array (or the document) is finished. Text before the first "{" (prose, markdown
+    fences) and after the object is ignored. A field that does not parse is skipped
+    rather than failing the document, so `result()` recovers the fields that closed
+    cleanly from truncated or malformed output.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self.items = {}
+        self.complete = False
+        self.start = None
+        self.end = None
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._expect = "key"
+        self._key = None
+        self._value_start = None
+        self._item_start = None
+
+    def feed(self, chunk: str) -> list:
+        self.buffer += chunk
+        events = []
+        text = self.buffer
+        n = len(text)
+        i = self._pos
+        if self.start is None:
+            i = text.find("{", i)
+            if i < 0:
+                self._pos = n
+                return events
+            self.start = i
+            self._stack.append("{")
+            i += 1
+        while i < n and not self.complete:
+            if self._in_string:
+                # Most of the text is string content: jump straight to the next quote or escape
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                match = _STRING_SPECIAL.search(text, i)
+                if match is None:
+                    i = n
+                    break
+                i = match.start()
+                if text[i] == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                    self._string_closed(text, i, events)
+            else:
+                self._step(text, i, text[i], events)
+            i += 1
+        self._pos = i
+        return events
+
+    def _step(self, text, i, c, events):
+        stack = self._stack
+        depth = len(stack)
+        in_array = depth == 2 and stack[1] == "["
+        if c == '"':
+            self._in_string = True
+            self._string_start = i
+            if depth == 1 and self._expect == "value" and self._value_start is not None:
+                # A number, boolean or null followed by a key with the comma missing: close the scalar first
+                self._close_scalar(text, i, events)
+                self._expect = "key"
+            elif depth == 1 and self._expect in ("key", "comma"):
+                self._expect = "key"
+            elif depth == 1 and self._expect == "value":
+                self._value_start = i
+            elif in_array and self._item_start is None:
+                self._item_start = i
+        elif c in "{[":
+            if depth == 1 and self._expect == "value":
+                self._value_start = i
+            elif in_array and self._item_start is None:
+                self._item_start = i
+            stack.append(c)
+        elif c in "}]":
+            if depth == 1:
+                self._close_scalar(text, i, events)
+                self.complete = True
+                self.end = i + 1
+                return
+            if in_array and self._item_start is not None and text[self._item_start] not in '{["':
+                self._close_item(text, self._item_start, i, events)
+            stack.pop()
+            if len(stack) == 1:
+                self._close_value(text, self._value_start, i + 1, events)
+            elif len(stack) == 2 and stack[1] == "[":
+                self._close_item(text, self._item_start, i + 1, events)
+        elif c == ":":
+            if depth == 1 and self._expect == "colon":
+                self._expect = "value"
+        elif c == ",":
+            if depth == 1:
+                self._close_scalar(text, i, events)
+                self._expect = "key"
+            elif in_array and self._item_start is not None:
+                self._close_item(text, self._item_start, i, events)
+        elif not c.isspace():
+            if depth == 1 and self._expect == "value" and self._value_start is None:
+                self._value_start = i
+            elif in_array and self._item_start is None:
+                self._item_start = i
+
+    def _string_closed(self, text, i, events):
+        depth = len(self._stack)
+        if depth == 1 and self._expect == "key":
+            self._key = _loads(text[self._string_start:i + 1])
+            self._expect = "colon"
+        elif depth == 1 and self._value_start == self._string_start:
+            self._close_value(text, self._value_start, i + 1, events)
+        elif depth == 2 and self._stack[1] == "[" and self._item_start == self._string_start:
+            self._close_item(text, self._item_start, i + 1, events)
+
+    def _close_scalar(self, text, end, events):
+        # Numbers, booleans and null end at the next "," or "}" rather than a closing character
+        if self._value_start is not None and self._expect == "value":
+            self._close_value(text, self._value_start, end, events)
+
+    def _close_value(self, text, start, end, events):
+        self._value_start = None
+        self._expect = "comma"
+        key = self._key
+        if start is None or not isinstance(key, str):
+            return
+        value = _loads(text[start:end].strip())
+        if value is _INVALID:
+            return
+        self.fields[key] = value
+        events.append(("field", key, value))
+
+    def _close_item(self, text, start, end, events):
+        self._item_start = None
+        if start is None or not isinstance(self._key, str):
+            return
+        value = _loads(text[start:end].strip())
+        if value is _INVALID:
+            return
+        items = self.items.setdefault(self._key, [])
+        items.append(value)
+        events.append(("item", self._key, len(items) - 1, value))
+
+    def result(self) -> dict:
+        """Every field that closed, with arrays cut off mid-way holding the items that closed."""
+        result = {key: items for key, items in self.items.items() if key not in self.fields}
+        result.update(self.fields)
+        return result
+
+
+_INVALID = object()
+_STRING_SPECIAL = re.compile(r'["\\]')
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+def _loads(text):
+    # strict=False accepts raw newlines and tabs inside strings, which LLMs often emit
+    try:
+        return json.loads(text, strict=False)
+    except ValueError:
+        pass
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text), strict=False)
+    except ValueError:
+        return _INVALID
+
+
+def parse_json_object(text: str):
+    """Parse the first JSON object in `text`, tolerating surrounding prose and damage.
+
+    Returns (data, complete): the whole object when it parses, otherwise the fields
+    recovered from it and False.
+    """
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    if parser.complete:
+        data = _loads(text[parser.start:parser.end])
+        if isinstance(data, dict):
+            return data, True
+    return parser.result(), False
@@ -0,0 +1,130 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import threading
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+
+from cache import ResultCache
+
+# Lookups are skipped (responses are still stored) while set, e.g. for force_fresh generations and retries
+_bypass = contextvars.ContextVar("llm_cache_bypass", default=False)
+# Keys stored inside record_llm_cache_writes(), so a generation can discard responses that failed to parse
+_writes = contextvars.ContextVar("llm_cache_writes", default=None)
+_UNKEYED_FIELDS = ("id", "usage_metadata", "response_metadata")
+# Set in the generation_info of responses served from the cache, so callbacks can tell them from real calls
+CACHE_HIT = "llm_cache_hit"
+
+
+class LLMResponseCache(BaseCache):
+    """LangChain cache of chat model responses on top of a ResultCache.
+
+    Keys hash the serialized prompt messages together with LangChain's llm_string,
+    which covers the model name, sampling parameters and bound tools. Message ids and
+    usage/response metadata are left out of the key: LangChain stamps each response with
+    a fresh run id (and cached ones with a zero cost) after caching, so an agent's
+    follow-up prompts, which include its earlier responses, would otherwise never match.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.bypassed = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(prompt, llm_string):
+        messages = json.loads(prompt)
+        for message in messages:
+            for field in _UNKEYED_FIELDS:
+                message.get("kwargs", {}).pop(field, None)
+        prompt = json.dumps(messages, sort_keys=True)
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt, llm_string):
+        if _bypass.get():
+            with self._lock:
+                self.bypassed += 1
+            return None
+        value = self.store.get(self._key(prompt, llm_string))
+        if value is None:
+            return None
+        return [
+            ChatGeneration(message=messages_from_dict([entry["message"]])[0],
+                           generation_info={**(entry["info"] or {}), CACHE_HIT: True})
+            for entry in value
+        ]
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._key(prompt, llm_string)
+        self.store.set(key, [
+            {"message": message_to_dict(generation.message), "info": generation.generation_info}
+            for generation in return_val
+        ])
+        written = _writes.get()
+        if written is not None:
+            written.append(key)
+
+    def discard(self, keys):
+        for key in keys:
+            self.store.delete(key)
+
+    def clear(self, **kwargs):
+        self.store.clear()
+
+    def stats(self):
+        stats = self.store.stats()
+        with self._lock:
+            stats["bypassed"] = self.bypassed
+        return stats
+
+
+@contextlib.contextmanager
+def llm_cache_bypass(enabled=True):
+    """LLM calls inside the block (and threads/tasks started from it) skip cache lookups.
+
+    With enabled=False the surrounding setting is left as it is.
+    """
+    if not enabled:
+        yield
+        return
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+@contextlib.contextmanager
+def record_llm_cache_writes():
+    """Yield the list of cache keys stored by LLM calls inside the block."""
+    written = []
+    token = _writes.set(written)
+    try:
+        yield written
+    finally:
+        _writes.reset(token)
+
+
+def create_llm_cache():
+    """The LLM response cache configured by LLM_CACHE_*, or None when LLM_CACHE=0."""
+    if os.getenv("LLM_CACHE", "1") == "0":
+        return None
+    return LLMResponseCache(ResultCache(
+        "llm_responses",
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+        ttl=float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+        path=os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3"),
+        max_disk_entries=int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "20000")),
+        sizeof=lambda generations: sum(len(str(generation["message"])) for generation in generations),
+    ))
+
+
+llm_cache = create_llm_cache()
+
+
+def get_llm_cache_stats():
+    return llm_cache.stats() if llm_cache is not None else None
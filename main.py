@@ -1,11 +1,23 @@
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from tools import search_tool, wiki_tool, save_tool, get_all_sources, search_tracker, wiki_tracker, clear_research_cache  
+from tools import search_tool, wiki_tool, save_tool, get_all_sources, clear_research_cache, build_research_context
+from tools import SOURCE_VERIFY, SOURCE_VERIFY_WAIT, WIKI_MAX_WORKERS, start_source_verification
+from progress import ProgressCallbackHandler, LLMCallCounter, SectionStreamHandler
+from jsonstream import parse_json_object
+from coalesce import AsyncSingleFlight, SingleFlight
+from cache import ResultCache
+from llmcache import llm_cache, llm_cache_bypass, record_llm_cache_writes
+from metrics import MetricsCallbackHandler, stage, log_event
+from writing import awrite_assignment_parallel, write_assignment_parallel
+from writing import awrite_assignment_pipelined, write_assignment_pipelined
+from research import arun_planned_research, run_planned_research
+from research import astart_planned_research, start_planned_research
+import asyncio
 import json
-import re
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 
 load_dotenv()
@@ -20,7 +32,30 @@ class AssignmentResponse(BaseModel):
     sources: list[str]
     tools_used: list[str]
 
-llm = ChatGroq(model="llama-3.3-70b-versatile")
+WRITER_RESEARCH_CONTEXT = os.getenv("WRITER_RESEARCH_CONTEXT", "1") != "0"
+# "single": one writing-agent call produces the whole JSON document
+# "parallel": outline first, then sections written concurrently (falls back to "single" on failure)
+# "pipelined": "parallel" started while planner/template research is still arriving ("parallel" after agent research)
+WRITER_MODE = os.getenv("WRITER_MODE", "single")
+# "agent": tool-calling agent decides each Wikipedia query (one LLM round-trip per lookup)
+# "planner": one LLM call plans all queries, fetched concurrently
+# "template": the fixed subtopic templates, fetched concurrently with no LLM calls
+RESEARCH_MODE = os.getenv("RESEARCH_MODE", "agent")
+
+# Built by get_llm() on the first generation, so importing the app stays fast; benchmarks assign their own
+llm = None
+_llm_lock = threading.Lock()
+
+def get_llm():
+    global llm
+    if llm is None:
+        with _llm_lock:
+            if llm is None:
+                from langchain_groq import ChatGroq
+                # streaming=True makes token callbacks fire; invoke() still returns the complete message.
+                # Identical prompts to the same model and params (regenerations, retried jobs) are answered from llm_cache
+                llm = ChatGroq(model="llama-3.3-70b-versatile", streaming=True, cache=llm_cache)
+    return llm
 
 research_prompt = ChatPromptTemplate.from_messages([
     (
@@ -94,6 +129,9 @@ writing_prompt = ChatPromptTemplate.from_messages([
             "tools_used": ["wikipedia"]
         }}
         
+        RESEARCH NOTES (collected from Wikipedia during the research phase; draw your facts from these):
+        {research_context}
+        
         RESPOND WITH ONLY THE JSON OBJECT. NO OTHER TEXT BEFORE OR AFTER.
         """
     ),
@@ -102,78 +140,435 @@ writing_prompt = ChatPromptTemplate.from_messages([
     ("placeholder", "{agent_scratchpad}")
 ])
 
-def create_enhanced_assignment(topic: str):
-    clear_research_cache()
+# Finished assignments keyed by normalized topic; set RESULT_CACHE_PATH to share them between processes
+result_cache = ResultCache(
+    "generations",
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256")),
+    ttl=float(os.getenv("RESULT_CACHE_TTL", "3600")),
+    path=os.getenv("RESULT_CACHE_PATH") or None
+)
+generation_flight = SingleFlight()
+async_generation_flight = AsyncSingleFlight()
+
+_generation_stats = {
+    "generations": 0,
+    "coalesced": 0,
+    "result_cache_hits": 0,
+    "llm_calls_made": 0,
+    "llm_calls_saved": 0
+}
+_stats_lock = threading.Lock()
+
+def _count(**increments):
+    with _stats_lock:
+        for name, amount in increments.items():
+            _generation_stats[name] += amount
+
+def get_generation_stats():
+    with _stats_lock:
+        stats = dict(_generation_stats)
+    stats["in_flight"] = generation_flight.in_flight() + async_generation_flight.in_flight()
+    return stats
+
+def normalize_topic(topic: str) -> str:
+    return " ".join(topic.lower().split())
+
+def _callback_config(on_event, phase, llm_counter=None):
+    callbacks = [MetricsCallbackHandler(phase)]
+    if llm_counter:
+        callbacks.append(llm_counter)
+    if on_event is not None:
+        callbacks.append(ProgressCallbackHandler(on_event, phase=phase))
+        if phase == "writing":
+            callbacks.append(SectionStreamHandler(on_event, phase=phase))
+    return {"callbacks": callbacks}
+
+def _serve_cached(cached, on_event):
+    _count(result_cache_hits=1, llm_calls_saved=cached["llm_calls"])
+    if on_event:
+        on_event({"type": "cached"})
+    return cached
+
+def _record_generation(result) -> bool:
+    """Count a finished generation; True if the result may be cached."""
+    _count(generations=1, llm_calls_made=result["llm_calls"])
+    return not result.get("error") and not result.get("partial")
+
+def _shared_result(result, shared, on_event):
+    if shared:
+        _count(coalesced=1, llm_calls_saved=result["llm_calls"])
+        if on_event:
+            on_event({"type": "coalesced"})
+    return result
+
+def get_or_create_assignment(topic: str, force_fresh=False, on_event=None):
+    """create_enhanced_assignment with result caching and coalescing of identical in-flight topics."""
+    key = normalize_topic(topic)
+    
+    if not force_fresh:
+        cached = result_cache.get(key)
+        if cached is not None:
+            return _serve_cached(cached, on_event)
+    
+    def run():
+        # force_fresh also skips cached LLM responses, so the regenerated text is actually new
+        with stage("generation", topic=key), llm_cache_bypass(force_fresh):
+            result = create_enhanced_assignment(topic, on_event=on_event)
+        if _record_generation(result):
+            result_cache.set(key, result)
+        return result
+    
+    return _shared_result(*generation_flight.do(key, run), on_event)
+
+async def aget_or_create_assignment(topic: str, force_fresh=False, on_event=None):
+    """Async get_or_create_assignment; shares the result cache and counters with the sync path."""
+    key = normalize_topic(topic)
+    
+    if not force_fresh:
+        cached = await result_cache.aget(key)
+        if cached is not None:
+            return _serve_cached(cached, on_event)
     
+    async def run():
+        with stage("generation", topic=key), llm_cache_bypass(force_fresh):
+            result = await acreate_enhanced_assignment(topic, on_event=on_event)
+        if _record_generation(result):
+            await result_cache.aset(key, result)
+        return result
+    
+    return _shared_result(*(await async_generation_flight.do(key, run)), on_event)
+
+# AgentExecutors keep no per-run state, so each (kind, llm) pair is built once and shared by
+# every request and thread; per-request values (topic, date, research notes) are invoke inputs
+_agent_executors = {}
+_agent_executors_lock = threading.Lock()
+
+def _build_writing_executor(llm):
+    from langchain.agents import create_tool_calling_agent, AgentExecutor
+    writing_agent = create_tool_calling_agent(llm=llm, prompt=writing_prompt, tools=[save_tool])
+    return AgentExecutor(agent=writing_agent, tools=[save_tool], verbose=True)
+
+def _build_research_executor(llm):
+    from langchain.agents import create_tool_calling_agent, AgentExecutor
     research_agent = create_tool_calling_agent(llm=llm, prompt=research_prompt, tools=[wiki_tool])
-    research_executor = AgentExecutor(agent=research_agent, tools=[wiki_tool], verbose=True)
+    return AgentExecutor(agent=research_agent, tools=[wiki_tool], verbose=True)
+
+_EXECUTOR_BUILDERS = {"writing": _build_writing_executor, "research": _build_research_executor}
+
+def preload():
+    """Build the LLM and both agent executors now rather than on the first generation."""
+    llm = get_llm()
+    for kind in _EXECUTOR_BUILDERS:
+        get_agent_executor(kind, llm)
+
+def get_agent_executor(kind, llm):
+    key = (kind, id(llm))
+    with _agent_executors_lock:
+        entry = _agent_executors.get(key)
+        # Holding the llm in the entry keeps its id from being reused by another object
+        if entry is None or entry[0] is not llm:
+            entry = _agent_executors[key] = (llm, _EXECUTOR_BUILDERS[kind](llm))
+        return entry[1]
+
+def write_single_shot(llm, topic, research_context, current_date, config):
+    """The writing agent producing the whole assignment as one JSON document."""
+    writing_executor = get_agent_executor("writing", llm)
     
-    research_result = research_executor.invoke({"topic": topic})
+    with stage("writing_agent"):
+        writing_result = writing_executor.invoke(
+            {"query": topic, "research_context": research_context, "current_date": current_date},
+            config=config
+        )
     
-    current_date = datetime.now().strftime("%B %d, %Y")
+    return writing_result.get("output", "")
+
+async def awrite_single_shot(llm, topic, research_context, current_date, config):
+    writing_executor = get_agent_executor("writing", llm)
     
-    writing_agent = create_tool_calling_agent(
-        llm=llm, 
-        prompt=writing_prompt.partial(current_date=current_date), 
-        tools=[save_tool]
-    )
-    writing_executor = AgentExecutor(agent=writing_agent, tools=[save_tool], verbose=True)
+    with stage("writing_agent"):
+        writing_result = await writing_executor.ainvoke(
+            {"query": topic, "research_context": research_context, "current_date": current_date},
+            config=config
+        )
     
-    writing_result = writing_executor.invoke({"query": topic})
+    return writing_result.get("output", "")
+
+def run_research_agent(llm, topic, config):
+    """The tool-calling research agent; each Wikipedia lookup is chosen by an LLM call."""
+    research_executor = get_agent_executor("research", llm)
     
-    output = writing_result.get("output", "")
+    with stage("research_agent"):
+        return research_executor.invoke({"topic": topic}, config=config).get("output", "")
+
+async def arun_research_agent(llm, topic, config):
+    research_executor = get_agent_executor("research", llm)
     
-    cleaned_output = clean_json_output(output)
+    with stage("research_agent"):
+        return (await research_executor.ainvoke({"topic": topic}, config=config)).get("output", "")
+
+def _writer_research_context(topic):
+    if not WRITER_RESEARCH_CONTEXT:
+        return "(none collected)"
+    with stage("research_context") as fields:
+        context, context_stats = build_research_context(topic)
+        fields.update(context_stats)
+    return context or "(none collected)"
+
+def _validated_parallel_output(parsed):
+    return AssignmentResponse.model_validate(parsed).model_dump_json()
+
+def _pipelined():
+    # The agent decides its next lookup as it goes, so there is nothing to write from until it finishes
+    return WRITER_MODE == "pipelined" and RESEARCH_MODE in ("planner", "template")
+
+class _Generation:
+    """State of one generation, shared by the sync and async pipelines below."""
+
+    def __init__(self, topic, on_event, wrap_future=None):
+        clear_research_cache()
+        self.topic = topic
+        self.on_event = on_event
+        self.llm = get_llm()
+        self.llm_counter = LLMCallCounter()
+        self.research_config = _callback_config(on_event, "research", self.llm_counter)
+        self.writing_config = _callback_config(on_event, "writing", self.llm_counter)
+        self.current_date = datetime.now().strftime("%B %d, %Y")
+        self.sources_future = None
+        self._wrap_future = wrap_future or (lambda future: future)
+        self._research_finished = False
+
+    def research_done(self):
+        """Start source verification and announce the research; later calls do nothing."""
+        if self._research_finished:
+            return
+        self._research_finished = True
+        # Checked against Wikipedia while the writer runs, so it adds no latency of its own
+        if SOURCE_VERIFY:
+            self.sources_future = self._wrap_future(start_source_verification())
+        if self.on_event:
+            self.on_event({"type": "research_complete", "sources": len(get_all_sources())})
+
+    def research_context(self):
+        return _writer_research_context(self.topic)
+
+    def finish(self, output, sources, writer_cache_keys):
+        result = finalize_assignment(self.topic, output, self.current_date, self.llm_counter.calls, sources)
+        discard_unparsed_output(result, writer_cache_keys)
+        return result
+
+def create_enhanced_assignment(topic: str, on_event=None):
+    if _pipelined():
+        return create_pipelined_assignment(topic, on_event=on_event)
+    run = _Generation(topic, on_event)
     
-    try:
-        parsed_data = json.loads(cleaned_output)
-        
-        collected_sources = get_all_sources()
-        parsed_data['sources'] = collected_sources
-        
-        if not parsed_data.get('tools_used'):
-            parsed_data['tools_used'] = ["wikipedia"]
+    if RESEARCH_MODE in ("planner", "template"):
+        run_planned_research(run.llm, topic, mode=RESEARCH_MODE, config=run.research_config, on_event=on_event)
+    else:
+        run_research_agent(run.llm, topic, run.research_config)
+    run.research_done()
+    research_context = run.research_context()
+    output = None
+    
+    with record_llm_cache_writes() as writer_cache_keys:
+        if WRITER_MODE in ("parallel", "pipelined"):
+            try:
+                with stage("writing_parallel"):
+                    parsed = write_assignment_parallel(
+                        run.llm, topic, research_context, run.current_date, config=run.writing_config,
+                        on_event=on_event
+                    )
+                output = _validated_parallel_output(parsed)
+            except Exception as e:
+                log_event("writer_fallback", error=str(e))
         
-        final_output = json.dumps(parsed_data, indent=2)
+        if output is None:
+            output = write_single_shot(run.llm, topic, research_context, run.current_date, run.writing_config)
+    
+    return run.finish(output, verified_sources(run.sources_future), writer_cache_keys)
+
+async def acreate_enhanced_assignment(topic: str, on_event=None):
+    """create_enhanced_assignment on the event loop: LLM calls use ainvoke, Wikipedia uses httpx."""
+    if _pipelined():
+        return await acreate_pipelined_assignment(topic, on_event=on_event)
+    run = _Generation(topic, on_event, wrap_future=asyncio.wrap_future)
+    
+    if RESEARCH_MODE in ("planner", "template"):
+        await arun_planned_research(run.llm, topic, mode=RESEARCH_MODE, config=run.research_config, on_event=on_event)
+    else:
+        await arun_research_agent(run.llm, topic, run.research_config)
+    run.research_done()
+    research_context = run.research_context()
+    output = None
+    
+    with record_llm_cache_writes() as writer_cache_keys:
+        if WRITER_MODE in ("parallel", "pipelined"):
+            try:
+                with stage("writing_parallel"):
+                    parsed = await awrite_assignment_parallel(
+                        run.llm, topic, research_context, run.current_date, config=run.writing_config,
+                        on_event=on_event
+                    )
+                output = _validated_parallel_output(parsed)
+            except Exception as e:
+                log_event("writer_fallback", error=str(e))
         
-        return {"output": final_output}
+        if output is None:
+            output = await awrite_single_shot(run.llm, topic, research_context, run.current_date, run.writing_config)
+    
+    return run.finish(output, await averified_sources(run.sources_future), writer_cache_keys)
+
+def create_pipelined_assignment(topic: str, on_event=None):
+    """WRITER_MODE=pipelined: the parallel writer starts on research as it arrives.
+
+    Lookups are submitted up front; the outline and introduction wait only for the main
+    topic's article and each section for one more subtopic (writing.write_assignment_pipelined).
+    On a writer failure the single-shot writer runs on the complete research instead.
+    """
+    run = _Generation(topic, on_event)
+    output = None
+    
+    with ThreadPoolExecutor(max_workers=WIKI_MAX_WORKERS) as lookups:
+        research = start_planned_research(
+            run.llm, topic, lookups, mode=RESEARCH_MODE, config=run.research_config, on_event=on_event
+        )
+        with record_llm_cache_writes() as writer_cache_keys:
+            try:
+                with stage("writing_pipelined"):
+                    parsed = write_assignment_pipelined(
+                        run.llm, topic, research, run.research_context, run.current_date,
+                        config=run.writing_config, on_event=on_event, on_research_done=run.research_done
+                    )
+                output = _validated_parallel_output(parsed)
+            except Exception as e:
+                log_event("writer_fallback", error=str(e))
+            
+            if output is None:
+                wait(research)
+                run.research_done()
+                output = write_single_shot(run.llm, topic, run.research_context(), run.current_date, run.writing_config)
+    
+    return run.finish(output, verified_sources(run.sources_future), writer_cache_keys)
+
+async def acreate_pipelined_assignment(topic: str, on_event=None):
+    run = _Generation(topic, on_event, wrap_future=asyncio.wrap_future)
+    output = None
+    
+    research = await astart_planned_research(
+        run.llm, topic, mode=RESEARCH_MODE, config=run.research_config, on_event=on_event
+    )
+    with record_llm_cache_writes() as writer_cache_keys:
+        try:
+            with stage("writing_pipelined"):
+                parsed = await awrite_assignment_pipelined(
+                    run.llm, topic, research, run.research_context, run.current_date,
+                    config=run.writing_config, on_event=on_event, on_research_done=run.research_done
+                )
+            output = _validated_parallel_output(parsed)
+        except Exception as e:
+            log_event("writer_fallback", error=str(e))
         
-    except json.JSONDecodeError as e:
-        error_response = {
+        if output is None:
+            await asyncio.gather(*research)
+            run.research_done()
+            output = await awrite_single_shot(
+                run.llm, topic, run.research_context(), run.current_date, run.writing_config
+            )
+    
+    return run.finish(output, await averified_sources(run.sources_future), writer_cache_keys)
+
+def verified_sources(sources_future):
+    """The verified source list, or the unverified one if verification is off, failed or is too slow."""
+    if sources_future is None:
+        return get_all_sources()
+    try:
+        return sources_future.result(timeout=SOURCE_VERIFY_WAIT)
+    except Exception as e:
+        log_event("source_verify_fallback", error=str(e) or e.__class__.__name__)
+        return get_all_sources()
+
+async def averified_sources(sources_future):
+    if sources_future is None:
+        return get_all_sources()
+    try:
+        return await asyncio.wait_for(sources_future, SOURCE_VERIFY_WAIT)
+    except Exception as e:
+        log_event("source_verify_fallback", error=str(e) or e.__class__.__name__)
+        return get_all_sources()
+
+def discard_unparsed_output(result, writer_cache_keys):
+    """Drop the writer's cached responses when its output did not fully parse, so a retry asks the LLM again."""
+    if (result.get("error") or result.get("partial")) and llm_cache is not None:
+        llm_cache.discard(writer_cache_keys)
+        log_event("llm_cache_discard", entries=len(writer_cache_keys))
+
+def _usable_sections(sections):
+    if not isinstance(sections, list):
+        return []
+    return [
+        section for section in sections
+        if isinstance(section, dict) and isinstance(section.get("content"), str) and section["content"].strip()
+    ]
+
+def finalize_assignment(topic, output, current_date, llm_calls, sources):
+    """Parse the writer's output and attach the sources.
+
+    Truncated or malformed output, or an object missing some of the introduction, main
+    sections and conclusion, keeps every field that parsed (the defaults fill the rest) and
+    is flagged partial; output with none of them becomes the error stub.
+    """
+    with stage("json_parse", chars=len(output or "")) as fields:
+        parsed_data, complete = parse_json_object(output or "")
+        fields.update(complete=complete)
+    
+    parsed_data["main_sections"] = _usable_sections(parsed_data.get("main_sections"))
+    recovered = [
+        name for name in ("introduction", "main_sections", "conclusion")
+        if parsed_data.get(name)
+    ]
+    
+    if recovered:
+        defaults = {
             "topic": topic,
             "author": "AI Research Assistant",
             "date": current_date,
-            "introduction": "Error occurred during assignment generation.",
-            "main_sections": [
-                {
-                    "title": "Error Section",
-                    "content": f"An error occurred while generating the assignment: {str(e)}"
-                }
-            ],
-            "conclusion": "Please try again.",
-            "sources": get_all_sources(),
-            "tools_used": ["wikipedia"]
+            "introduction": "",
+            "main_sections": [],
+            "conclusion": "",
         }
-        return {"output": json.dumps(error_response, indent=2)}
-
-def clean_json_output(output: str) -> str:
-    if not output:
-        raise ValueError("Empty output received")
-    
-    cleaned = output.strip()
-    
-    if "```json" in cleaned:
-        cleaned = cleaned.split("```json")[1].split("```")[0].strip()
-    elif "```" in cleaned:
-        cleaned = cleaned.split("```")[1].split("```")[0].strip()
-    
-    json_pattern = r'\{.*\}'
-    json_match = re.search(json_pattern, cleaned, re.DOTALL)
+        missing = [name for name in defaults if name not in parsed_data]
+        for name in missing:
+            parsed_data[name] = defaults[name]
+        
+        parsed_data['sources'] = sources
+        
+        if not parsed_data.get('tools_used'):
+            parsed_data['tools_used'] = ["wikipedia"]
+        
+        result = {"output": json.dumps(parsed_data, indent=2), "llm_calls": llm_calls}
+        # Valid JSON that lacks part of the content is as incomplete as truncated output
+        if not complete or len(recovered) < 3:
+            log_event("writer_output_recovered", recovered=recovered, missing=missing,
+                      sections=len(parsed_data["main_sections"]))
+            result["partial"] = True
+        return result
     
-    if json_match:
-        return json_match.group()
-    else:
-        return cleaned
+    error = "writer output contained no parseable assignment JSON"
+    error_response = {
+        "topic": topic,
+        "author": "AI Research Assistant",
+        "date": current_date,
+        "introduction": "Error occurred during assignment generation.",
+        "main_sections": [
+            {
+                "title": "Error Section",
+                "content": f"An error occurred while generating the assignment: {error}"
+            }
+        ],
+        "conclusion": "Please try again.",
+        "sources": sources,
+        "tools_used": ["wikipedia"]
+    }
+    return {"output": json.dumps(error_response, indent=2), "llm_calls": llm_calls, "error": error}
 
 def main():
     query = input("Enter the topic for the assignment: ")
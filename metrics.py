@@ -0,0 +1,201 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+trace_id_var = contextvars.ContextVar("trace_id", default=None)
+
+logger = logging.getLogger("assignment.metrics")
+if os.getenv("METRICS_LOG", "1") != "0" and not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def set_trace_id(trace_id):
+    trace_id_var.set(trace_id)
+    return trace_id
+
+
+def get_trace_id():
+    return trace_id_var.get()
+
+
+def log_event(event, **fields):
+    """Emit one structured JSON log line tagged with the current trace ID."""
+    record = {"ts": round(time.time(), 3), "event": event, "trace_id": get_trace_id()}
+    record.update(fields)
+    logger.info(json.dumps(record, default=str))
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f"{self.name}_bucket{_labels(key, le=bound)} {count}")
+                lines.append(f"{self.name}_bucket{_labels(key, le='+Inf')} {series['count']}")
+                lines.append(f"{self.name}_sum{_labels(key)} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{_labels(key)} {series['count']}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(key)} {value}")
+        return lines
+
+
+def _labels(key, **extra):
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+stage_seconds = Histogram("assignment_stage_seconds", "Duration of generation pipeline stages")
+wikipedia_seconds = Histogram("assignment_wikipedia_request_seconds", "Wikipedia lookup latency")
+wikipedia_bytes = Counter("assignment_wikipedia_bytes_total", "Characters returned by Wikipedia lookups")
+llm_seconds = Histogram("assignment_llm_request_seconds", "LLM call latency")
+llm_tokens = Counter("assignment_llm_tokens_total", "LLM tokens by kind (prompt, completion)")
+render_not_modified = Counter("assignment_render_not_modified_total", "Downloads answered 304 from the client's ETag")
+
+REGISTRY = [stage_seconds, wikipedia_seconds, wikipedia_bytes, llm_seconds, llm_tokens, render_not_modified]
+
+
+@contextmanager
+def stage(name, **fields):
+    """Time a pipeline stage into assignment_stage_seconds and log it as JSON."""
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        stage_seconds.observe(seconds, stage=name)
+        log_event("stage", stage=name, seconds=round(seconds, 4), status=status, **fields)
+
+
+def record_wikipedia_call(query, seconds, chars, cache_hit):
+    outcome = "hit" if cache_hit else "miss"
+    wikipedia_seconds.observe(seconds, cache=outcome)
+    wikipedia_bytes.inc(chars, cache=outcome)
+    log_event("wikipedia", query=query, seconds=round(seconds, 4), chars=chars, cache=outcome)
+
+
+def render_prometheus(gauges=None):
+    """Prometheus text exposition of all metrics, plus optional {name: [(labels, value)]} gauges."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for name, samples in (gauges or {}).items():
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Records latency and token usage for every LLM call in a run."""
+
+    # Cheap and thread-safe, so async runs call it directly instead of via the default executor
+    run_inline = True
+
+    def __init__(self, phase):
+        self.phase = phase
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        seconds = time.perf_counter() - started if started is not None else 0.0
+        prompt_tokens, completion_tokens = _token_usage(response)
+        llm_seconds.observe(seconds, phase=self.phase)
+        llm_tokens.inc(prompt_tokens, phase=self.phase, kind="prompt")
+        llm_tokens.inc(completion_tokens, phase=self.phase, kind="completion")
+        log_event(
+            "llm",
+            phase=self.phase,
+            seconds=round(seconds, 4),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+        log_event("llm_error", phase=self.phase, error=str(error))
+
+
+def _token_usage(response):
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    if not (prompt_tokens or completion_tokens):
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt_tokens += metadata.get("input_tokens", 0)
+                completion_tokens += metadata.get("output_tokens", 0)
+    return prompt_tokens, completion_tokens
@@ -0,0 +1,173 @@
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from jsonstream import IncrementalJSONParser
+from llmcache import CACHE_HIT
+
+
+class ProgressCallbackHandler(BaseCallbackHandler):
+    """Forwards agent tool calls and streamed LLM tokens to `emit(event_dict)`.
+
+    Tokens are coalesced into chunks of at least `min_chars` characters (or
+    `max_delay` seconds) so listeners are not flooded with one event per token.
+    Each LLM call keeps its own buffer, so the concurrent calls of the parallel
+    writer never interleave; their token events carry the `part` (and `title`)
+    from the call's `writer_part` / `section_title` metadata.
+    """
+
+    def __init__(self, emit, phase, min_chars=80, max_delay=0.25):
+        self.emit = emit
+        self.phase = phase
+        self.min_chars = min_chars
+        self.max_delay = max_delay
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.emit({
+            "type": "tool_start",
+            "phase": self.phase,
+            "tool": (serialized or {}).get("name"),
+            "input": input_str,
+        })
+
+    def on_tool_end(self, output, **kwargs):
+        self.emit({
+            "type": "tool_end",
+            "phase": self.phase,
+            "tool": kwargs.get("name"),
+            "chars": len(str(output)),
+        })
+
+    def on_tool_error(self, error, **kwargs):
+        self.emit({"type": "tool_error", "phase": self.phase, "tool": kwargs.get("name"), "error": str(error)})
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start_run(run_id, metadata)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start_run(run_id, metadata)
+
+    def _start_run(self, run_id, metadata):
+        metadata = metadata or {}
+        tags = {}
+        if metadata.get("writer_part"):
+            tags["part"] = metadata["writer_part"]
+            if metadata.get("section_title"):
+                tags["title"] = metadata["section_title"]
+        with self._lock:
+            self._runs[run_id] = {"tags": tags, "buffer": [], "buffered": 0, "last_flush": time.monotonic()}
+
+    def on_llm_new_token(self, token, *, run_id=None, **kwargs):
+        if not token:
+            return
+        with self._lock:
+            run = self._runs.get(run_id)
+            if run is None:
+                # A model that streams without a start callback still gets a buffer of its own
+                run = self._runs[run_id] = {"tags": {}, "buffer": [], "buffered": 0, "last_flush": time.monotonic()}
+            run["buffer"].append(token)
+            run["buffered"] += len(token)
+            if run["buffered"] >= self.min_chars or time.monotonic() - run["last_flush"] >= self.max_delay:
+                self._flush(run)
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs):
+        self._end_run(run_id)
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs):
+        self._end_run(run_id)
+
+    def _end_run(self, run_id):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if run is not None:
+                self._flush(run)
+
+    def flush(self):
+        with self._lock:
+            for run in self._runs.values():
+                self._flush(run)
+
+    def _flush(self, run):
+        if run["buffer"]:
+            self.emit({"type": "token", "phase": self.phase, "text": "".join(run["buffer"]), **run["tags"]})
+            run["buffer"] = []
+            run["buffered"] = 0
+        run["last_flush"] = time.monotonic()
+
+
+class SectionStreamHandler(BaseCallbackHandler):
+    """Parses the writer's JSON as it streams and emits each part as soon as it closes.
+
+    Emits the same "section" events as the section-parallel writer, so listeners can
+    render the introduction and each main section before the whole document arrives.
+    """
+
+    def __init__(self, emit, phase="writing"):
+        self.emit = emit
+        self.phase = phase
+        self._parsers = {}
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        with self._lock:
+            self._parsers[run_id] = IncrementalJSONParser()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        with self._lock:
+            self._parsers[run_id] = IncrementalJSONParser()
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        parser = self._parsers.get(run_id)
+        if parser is not None and token:
+            self._emit_parts(parser.feed(token))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            parser = self._parsers.pop(run_id, None)
+        if parser is not None and not parser.buffer:
+            # Nothing was streamed (e.g. a cached response): parse the whole message at once
+            generations = response.generations[0] if response.generations else []
+            self._emit_parts(parser.feed(generations[0].text if generations else ""))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._parsers.pop(run_id, None)
+
+    def _emit_parts(self, events):
+        for event in events:
+            if event[0] == "field" and event[1] in ("introduction", "conclusion") and isinstance(event[2], str):
+                self.emit({"type": "section", "phase": self.phase, "part": event[1], "title": None,
+                           "content": event[2]})
+            elif event[0] == "item" and event[1] == "main_sections" and isinstance(event[3], dict):
+                self.emit({"type": "section", "phase": self.phase, "part": "section", "index": event[2],
+                           "title": event[3].get("title"), "content": event[3].get("content")})
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Counts the LLM calls made during a run; responses served by the LLM cache count as `cached`."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.calls = 0
+        self.cached = 0
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response, **kwargs):
+        hit = any(
+            (generation.generation_info or {}).get(CACHE_HIT)
+            for generations in response.generations for generation in generations
+        )
+        with self._lock:
+            if hit:
+                self.cached += 1
+            else:
+                self.calls += 1
+
+    def on_llm_error(self, error, **kwargs):
+        # A failed request still reached the model
+        with self._lock:
+            self.calls += 1
@@ -0,0 +1,153 @@
+import asyncio
+import contextvars
+import os
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from jsonstream import parse_json_object
+from metrics import log_event, stage
+from tools import (
+    acomprehensive_topic_research, aforced_wikipedia_research, build_search_terms,
+    comprehensive_topic_research, forced_wikipedia_research, wikipedia_research_tool,
+)
+
+RESEARCH_MAX_QUERIES = int(os.getenv("RESEARCH_MAX_QUERIES", "6"))
+
+plan_prompt = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        """
+        You are a thorough academic researcher planning Wikipedia research.
+
+        PLAN: List between 4 and {max_queries} Wikipedia search queries that together cover the topic's
+        main concept and definitions, historical development, current applications and examples,
+        different perspectives, and recent developments. Prefer queries that match Wikipedia article titles.
+        Respond with ONLY a JSON object of the form {{"queries": ["query 1", "query 2", ...]}}.
+        """
+    ),
+    ("human", "Plan the research for the topic: {topic}")
+])
+
+
+def _planned_queries(text: str) -> list:
+    # Prose around the plan may hold braces of its own, so try each object until one has queries
+    start = text.find("{")
+    while start >= 0:
+        queries = parse_json_object(text[start:])[0].get("queries")
+        if isinstance(queries, list):
+            return queries
+        start = text.find("{", start + 1)
+    return []
+
+
+def parse_queries(text: str, topic: str, max_queries=RESEARCH_MAX_QUERIES) -> list:
+    queries = _planned_queries(text)
+    queries = [str(query).strip() for query in queries if str(query).strip()]
+    if not queries:
+        raise ValueError("planner returned no queries")
+    # Always research the main topic itself first
+    if topic.lower() not in (query.lower() for query in queries):
+        queries.insert(0, topic)
+    return list(dict.fromkeys(queries))[:max_queries]
+
+
+def plan_queries(llm, topic: str, config=None) -> list:
+    """One LLM call producing every research query up front; template queries on failure."""
+    with stage("research_plan"):
+        try:
+            message = (plan_prompt | llm).invoke(
+                {"topic": topic, "max_queries": RESEARCH_MAX_QUERIES}, config=config
+            )
+            return parse_queries(message.content, topic)
+        except Exception as e:
+            log_event("research_plan_fallback", error=str(e))
+            return build_search_terms(topic)
+
+
+async def aplan_queries(llm, topic: str, config=None) -> list:
+    with stage("research_plan"):
+        try:
+            message = await (plan_prompt | llm).ainvoke(
+                {"topic": topic, "max_queries": RESEARCH_MAX_QUERIES}, config=config
+            )
+            return parse_queries(message.content, topic)
+        except Exception as e:
+            log_event("research_plan_fallback", error=str(e))
+            return build_search_terms(topic)
+
+
+def _tracked_lookup(on_event):
+    """forced_wikipedia_research reporting tool_start/tool_end like the agent's Wikipedia tool."""
+    if on_event is None:
+        return forced_wikipedia_research
+
+    def lookup(query):
+        on_event({"type": "tool_start", "phase": "research", "tool": wikipedia_research_tool.name, "input": query})
+        research = forced_wikipedia_research(query)
+        on_event({"type": "tool_end", "phase": "research", "tool": wikipedia_research_tool.name,
+                  "chars": len(research)})
+        return research
+    return lookup
+
+
+def _atracked_lookup(on_event):
+    if on_event is None:
+        return aforced_wikipedia_research
+
+    async def lookup(query):
+        on_event({"type": "tool_start", "phase": "research", "tool": wikipedia_research_tool.name, "input": query})
+        research = await aforced_wikipedia_research(query)
+        on_event({"type": "tool_end", "phase": "research", "tool": wikipedia_research_tool.name,
+                  "chars": len(research)})
+        return research
+    return lookup
+
+
+def run_planned_research(llm, topic: str, mode="planner", config=None, on_event=None) -> str:
+    """Research without an agent loop: plan the queries (LLM or template), then fetch them concurrently."""
+    queries = plan_queries(llm, topic, config) if mode == "planner" else build_search_terms(topic)
+    if on_event:
+        on_event({"type": "research_plan", "queries": queries})
+
+    with stage("research_fetch", queries=len(queries)):
+        return comprehensive_topic_research(topic, search_terms=queries, lookup=_tracked_lookup(on_event))
+
+
+async def arun_planned_research(llm, topic: str, mode="planner", config=None, on_event=None) -> str:
+    queries = await aplan_queries(llm, topic, config) if mode == "planner" else build_search_terms(topic)
+    if on_event:
+        on_event({"type": "research_plan", "queries": queries})
+
+    with stage("research_fetch", queries=len(queries)):
+        return await acomprehensive_topic_research(topic, search_terms=queries, lookup=_atracked_lookup(on_event))
+
+
+def _main_topic_first(queries: list, topic: str) -> list:
+    main = [query for query in queries if query.lower() == topic.lower()] or [topic]
+    return main[:1] + [query for query in queries if query.lower() != topic.lower()]
+
+
+def start_planned_research(llm, topic: str, pool, mode="planner", config=None, on_event=None) -> list:
+    """Plan the queries and submit every lookup to `pool` without waiting for them.
+
+    Returns the lookup futures with the main topic's first, so writing can start on
+    whatever has arrived (see writing.write_assignment_pipelined).
+    """
+    queries = plan_queries(llm, topic, config) if mode == "planner" else build_search_terms(topic)
+    queries = _main_topic_first(queries, topic)
+    if on_event:
+        on_event({"type": "research_plan", "queries": queries})
+
+    context = contextvars.copy_context()
+    lookup = _tracked_lookup(on_event)
+    return [pool.submit(context.copy().run, lookup, query) for query in queries]
+
+
+async def astart_planned_research(llm, topic: str, mode="planner", config=None, on_event=None) -> list:
+    queries = await aplan_queries(llm, topic, config) if mode == "planner" else build_search_terms(topic)
+    queries = _main_topic_first(queries, topic)
+    if on_event:
+        on_event({"type": "research_plan", "queries": queries})
+
+    lookup = _atracked_lookup(on_event)
+    return [asyncio.ensure_future(lookup(query)) for query in queries]
@@ -0,0 +1,273 @@
+"""Offline stand-ins for the external services used by the generator (for benchmarks)."""
+import asyncio
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+def stub_article(query: str, chars=2000) -> str:
+    """Text shaped like WikipediaAPIWrapper output: two pages, several paragraphs, some overlap."""
+    topic = query.split()[0].title()
+    paragraphs = [
+        f"{query.title()} is studied as part of {topic} and has been documented since {1800 + len(query) * 7}.",
+        f"Early work on {query} was carried out by researchers in Europe, with major milestones in {1900 + len(query)}.",
+        f"Modern applications of {topic} include education, industry and public policy, as described in many sources.",
+        f"Critics of {query} point to open questions about measurement, ethics and long-term effects on society.",
+        f"{topic} is a broad subject with a long and varied history across many different countries and cultures.",
+    ]
+    pages = [
+        f"Page: {query.title()}\nSummary: " + "\n".join(paragraphs),
+        f"Page: {topic}\nSummary: " + "\n".join(reversed(paragraphs[2:])),
+    ]
+    text = "\n\n".join(pages)
+    while len(text) < chars:
+        text += "\n" + paragraphs[len(text) % len(paragraphs)] + f" (note {len(text)})"
+    return text[:chars]
+
+
+def _strip_page_headers(text: str) -> str:
+    return re.sub(r"^Page: .*\nSummary: ", "", text, flags=re.MULTILINE)
+
+
+class StubWikipediaServer:
+    """Local HTTP server answering the MediaWiki search and extracts queries used by tools.py.
+
+    Use as a context manager; `url` is the api.php endpoint to point WIKI_API_URL at.
+    Every response is delayed by `latency` seconds; `redirects` maps page titles to their targets.
+    """
+
+    def __init__(self, latency=0.3, chars=2000, redirects=None):
+        self.latency = latency
+        self.chars = chars
+        self.redirects = redirects or {}
+        self.requests = 0
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/w/api.php"
+
+    def respond(self, params):
+        if params.get("list") == "search":
+            query = params.get("srsearch", "")
+            limit = int(params.get("srlimit", 2))
+            titles = [query.title(), query.split()[0].title()][:limit] if query else []
+            return {"query": {"search": [{"title": title} for title in dict.fromkeys(titles)]}}
+        if "titles" in params and params.get("prop") != "extracts":
+            # Title resolution: pages "exist" when their title is title-cased, like the search results
+            titles = [title for title in params["titles"].split("|") if title]
+            normalized = [{"from": t, "to": t[:1].upper() + t[1:]} for t in titles if t[:1].islower()]
+            redirects, pages = [], []
+            for title in titles:
+                title = title[:1].upper() + title[1:]
+                if title in self.redirects:
+                    redirects.append({"from": title, "to": self.redirects[title]})
+                    title = self.redirects[title]
+                pages.append({"title": title} if title == title.title() else {"title": title, "missing": True})
+            return {"query": {"normalized": normalized, "redirects": redirects, "pages": pages}}
+        if params.get("prop") == "extracts":
+            titles = [title for title in params.get("titles", "").split("|") if title]
+            return {"query": {"pages": [
+                {"title": title, "extract": _strip_page_headers(stub_article(title, self.chars // 2))}
+                for title in titles
+            ]}}
+        return {}
+
+    def __enter__(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes; with Nagle on, keep-alive
+            # clients stall ~40 ms per response on the delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.latency)
+                params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                body = json.dumps(stub.respond(params)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_HEAD(self):
+                stub.requests += 1
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            # The default backlog of 5 drops bursts of concurrent connects into SYN retries
+            request_queue_size = 1024
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def stub_wikipedia(latency=0.3, chars=2000):
+    """Return a drop-in for tools._run_wikipedia_query that sleeps instead of hitting the network."""
+    def run(query: str) -> str:
+        time.sleep(latency)
+        return stub_article(query, chars)
+    return run
+
+
+def sample_assignment(topic="Photosynthesis", section_words=350):
+    """A realistically sized assignment dict in the AssignmentResponse shape."""
+    def words(count, seed):
+        text = f"{topic} {seed} evidence analysis history development application context "
+        return " ".join((text * (count // 8 + 1)).split()[:count]) + "."
+
+    return {
+        "topic": topic,
+        "author": "AI Research Assistant",
+        "date": "January 01, 2025",
+        "introduction": words(180, "introduction"),
+        "main_sections": [
+            {"title": f"{topic} Section {i}", "content": words(section_words, f"section{i}")}
+            for i in range(1, 5)
+        ],
+        "conclusion": words(180, "conclusion"),
+        "sources": [f"Wikipedia: '{topic} {i}' - https://en.wikipedia.org/wiki/{topic}_{i}" for i in range(5)],
+        "tools_used": ["wikipedia"]
+    }
+
+
+class FakeChatModel(BaseChatModel):
+    """Local chat model that answers the generator's prompts with plausible canned output.
+
+    Each call sleeps `latency` seconds plus the time to "generate" its output at
+    `tokens_per_second`, so wall-clock comparisons between pipelines are meaningful.
+    Bound with tools, it plays the research agent: it requests `research_queries`
+    Wikipedia lookups one at a time before answering. With `streaming`, text answers
+    arrive through `on_llm_new_token` at `tokens_per_second`, like ChatGroq(streaming=True).
+    With `prompt_tokens_per_second`, reading the prompt adds to the latency, so longer
+    prompts answer later; by default prompt size does not affect timing.
+    """
+
+    latency: float = 0.2
+    tokens_per_second: float = 400.0
+    prompt_tokens_per_second: float = 0.0
+    research_queries: int = 3
+    streaming: bool = False
+
+    _calls: int = 0
+    _lock: threading.Lock = None
+
+    def model_post_init(self, __context):
+        self._lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, first_token, delay = self._prepare(messages, kwargs.get("tools"))
+        if self._streams(message, run_manager):
+            time.sleep(first_token)
+            for piece in self._pieces(message.content):
+                time.sleep(len(piece) / 4 / self.tokens_per_second)
+                run_manager.on_llm_new_token(piece)
+        else:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message, first_token, delay = self._prepare(messages, kwargs.get("tools"))
+        if self._streams(message, run_manager):
+            await asyncio.sleep(first_token)
+            for piece in self._pieces(message.content):
+                await asyncio.sleep(len(piece) / 4 / self.tokens_per_second)
+                await run_manager.on_llm_new_token(piece)
+        else:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _streams(self, message, run_manager):
+        return self.streaming and run_manager is not None and not message.tool_calls
+
+    @staticmethod
+    def _pieces(text, size=64):
+        # ~16 tokens per callback keeps the sleep granularity sane at high token rates
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def _prepare(self, messages, tools):
+        with self._lock:
+            self._calls += 1
+        message = self.respond(messages, tools)
+        completion_tokens = max(1, len(message.content) // 4)
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        message.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        first_token = self.latency
+        if self.prompt_tokens_per_second:
+            first_token += prompt_tokens / self.prompt_tokens_per_second
+        return message, first_token, first_token + completion_tokens / self.tokens_per_second
+
+    def respond(self, messages, tools=None):
+        system = str(messages[0].content)
+        prompt = "\n".join(str(m.content) for m in messages)
+        human = [str(m.content) for m in messages if m.type == "human"]
+        topic = human[-1].rsplit(":", 1)[-1].strip() if human else "Topic"
+
+        # Match the research prompt's opening line: the writer's prompt embeds research notes,
+        # which can mention "researchers" too
+        if tools and system.strip().lower().startswith("you are a thorough academic researcher"):
+            done = sum(1 for m in messages if isinstance(m, ToolMessage))
+            if done < self.research_queries:
+                suffix = ["", " history", " applications", " examples", " development"][done % 5]
+                return AIMessage("", tool_calls=[{
+                    "name": tools[0]["function"]["name"],
+                    "args": {"__arg1": f"{topic}{suffix}"},
+                    "id": f"call_{done}",
+                }])
+            return AIMessage(f"Research on {topic} is complete.")
+
+        if "PLAN:" in prompt:
+            return AIMessage(json.dumps({"queries": [
+                topic, f"History of {topic}", f"{topic} applications", f"{topic} examples", f"{topic} research",
+            ]}))
+
+        if "OUTLINE" in prompt:
+            return AIMessage(json.dumps({"sections": [
+                f"Origins of {topic}", f"Core Concepts of {topic}",
+                f"Applications of {topic}", f"Debates and Future of {topic}",
+            ]}))
+
+        if "JSON FORMAT" in system:
+            return AIMessage(json.dumps(sample_assignment(topic)))
+
+        match = re.search(r"(\d+)-(\d+) words", prompt)
+        words = int(match.group(2)) if match else 200
+        return AIMessage(" ".join([f"{topic} evidence analysis history context."] * (words // 5)))
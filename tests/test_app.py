@@ -0,0 +1,111 @@
+import json
+import threading
+
+import pytest
+
+import app as web
+from jobs import DONE, FAILED
+
+
+@pytest.fixture
+def client():
+    return web.app.test_client()
+
+
+def stream_events(response):
+    return [json.loads(line[len("data: "):]) for line in response.get_data(as_text=True).splitlines()
+            if line.startswith("data: ")]
+
+
+def test_event_stream_ends_when_job_finished_without_status_event(client, monkeypatch):
+    job = {"id": "j", "status": DONE, "error": None, "payload": {}}
+    monkeypatch.setattr(web.job_queue, "get", lambda job_id: job)
+    monkeypatch.setattr(web.job_queue, "events", lambda job_id, after=0: [])
+    assert stream_events(client.get("/jobs/j/events")) == [{"type": "status", "status": DONE, "error": None}]
+
+
+def test_event_stream_ends_when_job_disappears(client, monkeypatch):
+    jobs = iter([{"id": "j", "status": "running", "error": None, "payload": {}}])
+    monkeypatch.setattr(web.job_queue, "get", lambda job_id: next(jobs, None))
+    monkeypatch.setattr(web.job_queue, "events", lambda job_id, after=0: [])
+    assert stream_events(client.get("/jobs/j/events"))[-1]["status"] == FAILED
+
+
+def test_event_stream_has_a_maximum_duration(client, monkeypatch):
+    monkeypatch.setattr(web, "SSE_MAX_SECONDS", 0.3)
+    monkeypatch.setattr(web.job_queue, "get", lambda job_id: {"id": "j", "status": "running", "error": None})
+    monkeypatch.setattr(web.job_queue, "events", lambda job_id, after=0: [])
+    assert stream_events(client.get("/jobs/j/events")) == []
+
+
+@pytest.mark.parametrize("headers, query, after", [
+    ({"Last-Event-ID": "7"}, "", 7),
+    ({}, "?after=3", 3),
+    ({"Last-Event-ID": "not-a-number"}, "", 0),
+    ({}, "?after=1.5", 0),
+    ({"Last-Event-ID": "-4"}, "", 0),
+])
+def test_event_stream_resumes_after_last_event_id(client, monkeypatch, headers, query, after):
+    requested = []
+
+    def events(job_id, after=0):
+        requested.append(after)
+        return [(after + 1, {"type": "status", "status": DONE})]
+
+    monkeypatch.setattr(web.job_queue, "get", lambda job_id: {"id": "j", "status": DONE, "error": None})
+    monkeypatch.setattr(web.job_queue, "events", events)
+    response = client.get(f"/jobs/j/events{query}", headers=headers)
+    assert response.status_code == 200
+    assert stream_events(response) == [{"type": "status", "status": DONE}]
+    assert requested == [after]
+
+
+def test_batch_queues_up_to_capacity_and_reports_the_rest(client, monkeypatch):
+    submitted = []
+
+    def submit(payload):
+        if len(submitted) == 2:
+            raise web.JobQueueFull("full")
+        submitted.append(payload["topic"])
+        return f"job-{len(submitted)}"
+
+    monkeypatch.setattr(web.job_queue, "submit", submit)
+    response = client.post("/generate-batch", json={"topics": ["A", "B", "C", " ", "D"]})
+    assert response.status_code == 202
+    assert [job["topic"] for job in response.get_json()["jobs"]] == ["A", "B"]
+    assert response.get_json()["rejected"] == ["C", "D"]
+    assert response.headers["Retry-After"] == "30"
+
+
+def test_batch_answers_429_when_nothing_fits(client, monkeypatch):
+    def submit(payload):
+        raise web.JobQueueFull("full")
+
+    monkeypatch.setattr(web.job_queue, "submit", submit)
+    response = client.post("/generate-batch", json={"topics": ["A", "B"]})
+    assert response.status_code == 429
+    assert response.get_json()["rejected"] == ["A", "B"]
+
+
+def test_not_modified_downloads_are_counted_across_threads(monkeypatch):
+    monkeypatch.setattr(web, "render_cache_key", lambda data, format: "abc")
+    before = web.render_not_modified.value()
+
+    def download():
+        for _ in range(200):
+            with web.app.test_request_context(headers={"If-None-Match": '"abc"'}):
+                assert web.send_rendered({}, "txt", "a.txt").status_code == 304
+
+    threads = [threading.Thread(target=download) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert web.render_not_modified.value() - before == 800
+
+
+def test_error_stub_fails_the_job():
+    result = {"output": json.dumps({"introduction": "Error occurred during assignment generation."}),
+              "llm_calls": 1, "error": "writer output contained no parseable assignment JSON"}
+    with pytest.raises(RuntimeError, match="no parseable"):
+        web.parse_generation_result(result)
@@ -0,0 +1,41 @@
+import json
+
+import batch
+from stubs import sample_assignment
+
+
+def fake_generation(failing):
+    def get_or_create_assignment(topic):
+        if topic in failing:
+            return {"output": json.dumps(sample_assignment(topic)), "llm_calls": 1,
+                    "error": "writer output contained no parseable assignment JSON"}
+        return {"output": json.dumps(sample_assignment(topic)), "llm_calls": 1}
+    return get_or_create_assignment
+
+
+def test_error_stub_is_recorded_as_an_error(monkeypatch):
+    monkeypatch.setattr(batch, "get_or_create_assignment", fake_generation({"Gravity"}))
+    record = batch.generate_topic("Gravity")
+    assert record["status"] == "error"
+    assert "no parseable" in record["error"]
+
+
+def test_partial_assignment_is_recorded_as_an_error(monkeypatch):
+    monkeypatch.setattr(batch, "get_or_create_assignment",
+                        lambda topic: {"output": json.dumps(sample_assignment(topic)), "partial": True})
+    assert batch.generate_topic("Gravity")["status"] == "error"
+
+
+def test_resume_regenerates_failed_topics(tmp_path, monkeypatch):
+    output = str(tmp_path / "results.jsonl")
+    monkeypatch.setattr(batch, "get_or_create_assignment", fake_generation({"Gravity"}))
+    first = batch.run_batch(["Photosynthesis", "Gravity"], output, workers=2)
+    assert (first["succeeded"], first["failed"]) == (1, 1)
+
+    generated = []
+    working = fake_generation(set())
+    monkeypatch.setattr(batch, "get_or_create_assignment", lambda topic: generated.append(topic) or working(topic))
+    second = batch.run_batch(["Photosynthesis", "  gravity "], output, workers=2)
+    assert generated == ["  gravity "]
+    assert (second["succeeded"], second["failed"]) == (1, 0)
+    assert batch.completed_topics(output) == {"photosynthesis", "gravity"}
@@ -0,0 +1,52 @@
+import asyncio
+import sqlite3
+
+from cache import ResultCache
+
+
+def disk_rows(path, namespace="c"):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+
+def test_disk_tier_is_trimmed_every_evict_every_writes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache("c", max_entries=2, path=path, max_disk_entries=5, evict_every=4)
+    for i in range(12):
+        cache.set(f"k{i}", i)
+    # The first write checks the table, then every fourth: after writes 1, 5 and 9
+    assert disk_rows(path) == 8
+    cache.set("k12", 12)
+    assert disk_rows(path) == 5
+    fresh = ResultCache("c", path=path)
+    assert [fresh.get(f"k{i}") for i in (7, 8, 12)] == [None, 8, 12]
+
+
+def test_expired_rows_are_ignored_between_evictions(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResultCache("c", max_entries=1, ttl=60, path=path, evict_every=100)
+    cache.set("old", 1)
+    cache.set("new", 2)
+    with sqlite3.connect(path) as db:
+        db.execute("UPDATE cache_entries SET stored_at = stored_at - 120 WHERE key = 'old'")
+    assert ResultCache("c", ttl=60, path=path).get("old") is None
+
+
+def test_age_index_exists(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    ResultCache("c", path=path).set("k", 1)
+    with sqlite3.connect(path) as db:
+        plan = db.execute("EXPLAIN QUERY PLAN SELECT key FROM cache_entries WHERE namespace = 'c' "
+                          "ORDER BY stored_at DESC").fetchall()
+    assert "cache_entries_age" in str(plan)
+
+
+def test_async_get_and_set_use_the_disk_tier(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def roundtrip():
+        await ResultCache("c", path=path).aset("k", {"v": 1})
+        fresh = ResultCache("c", path=path)
+        return await fresh.aget("k"), await fresh.aget("k"), await fresh.aget("missing", "default")
+
+    assert asyncio.run(roundtrip()) == ({"v": 1}, {"v": 1}, "default")
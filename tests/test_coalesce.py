@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cache import ResultCache
+from coalesce import AsyncSingleFlight, SingleFlight
+from llmcache import LLMResponseCache
+from progress import LLMCallCounter
+from stubs import FakeChatModel
+
+
+def test_concurrent_identical_calls_share_one_run():
+    flight = SingleFlight()
+    runs = []
+    start = threading.Barrier(8)
+
+    def compute():
+        runs.append(1)
+        time.sleep(0.2)
+        return {"value": 42}
+
+    def call(_):
+        start.wait()
+        return flight.do("topic", compute)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        outcomes = list(pool.map(call, range(8)))
+    assert len(runs) == 1
+    assert all(result is outcomes[0][0] for result, _ in outcomes)
+    assert sorted(shared for _, shared in outcomes) == [False] + [True] * 7
+    assert flight.in_flight() == 0
+
+
+def test_an_error_reaches_every_waiter_and_is_not_cached():
+    flight = SingleFlight()
+    start = threading.Barrier(4)
+
+    def fail():
+        time.sleep(0.2)
+        raise RuntimeError("writer failed")
+
+    def call(_):
+        start.wait()
+        try:
+            flight.do("topic", fail)
+        except RuntimeError as e:
+            return str(e)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert list(pool.map(call, range(4))) == ["writer failed"] * 4
+    assert flight.do("topic", lambda: "retried") == ("retried", False)
+
+
+def test_async_identical_calls_share_one_run_and_its_error():
+    flight = AsyncSingleFlight()
+    runs = []
+
+    async def compute():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise RuntimeError("writer failed")
+
+    async def scenario():
+        outcomes = await asyncio.gather(*(flight.do("a", compute) for _ in range(5)))
+        errors = await asyncio.gather(*(flight.do("b", fail) for _ in range(3)), return_exceptions=True)
+        return outcomes, errors
+
+    outcomes, errors = asyncio.run(scenario())
+    assert len(runs) == 1
+    assert [result for result, _ in outcomes] == ["done"] * 5
+    assert sorted(shared for _, shared in outcomes) == [False] + [True] * 4
+    assert [str(error) for error in errors] == ["writer failed"] * 3
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_llm_cache_hits_are_not_counted_as_calls(asynchronous):
+    llm = FakeChatModel(latency=0, tokens_per_second=1e9, cache=LLMResponseCache(ResultCache("llm", max_entries=16)))
+    counter = LLMCallCounter()
+    config = {"callbacks": [counter]}
+    for _ in range(3):
+        if asynchronous:
+            asyncio.run(llm.ainvoke("Write about Gravity", config=config))
+        else:
+            llm.invoke("Write about Gravity", config=config)
+    assert (counter.calls, counter.cached) == (1, 2)
+    assert llm.calls == 1
@@ -0,0 +1,34 @@
+import json
+
+from main import finalize_assignment
+from stubs import sample_assignment
+
+
+def finalize(output):
+    return finalize_assignment("Topic", output, "January 01, 2026", 3, ["Wikipedia: 'Topic'"])
+
+
+def test_complete_assignment():
+    result = finalize(json.dumps(sample_assignment("Topic")))
+    assert not result.get("error") and not result.get("partial")
+    assert json.loads(result["output"])["sources"] == ["Wikipedia: 'Topic'"]
+
+
+def test_valid_json_without_content_is_an_error():
+    result = finalize('{"topic": "x"}')
+    assert result["error"]
+    assert json.loads(result["output"])["main_sections"][0]["title"] == "Error Section"
+
+
+def test_valid_json_missing_some_content_is_partial():
+    result = finalize('{"introduction": "Intro", "main_sections": []}')
+    assert result["partial"] and not result.get("error")
+    data = json.loads(result["output"])
+    assert data["introduction"] == "Intro" and data["conclusion"] == ""
+
+
+def test_truncated_output_keeps_closed_sections():
+    text = json.dumps(sample_assignment("Topic"))
+    result = finalize(text[:text.index('"conclusion"')])
+    assert result["partial"]
+    assert len(json.loads(result["output"])["main_sections"]) == 4
@@ -0,0 +1,23 @@
+import argparse
+
+import pytest
+
+import benchmark
+import main
+import tools
+
+
+@pytest.mark.parametrize("research_mode", ["template", "planner", "agent"])
+def test_concurrent_generations_keep_their_own_sources(research_mode, monkeypatch):
+    # bench_isolation replaces these module globals; setting them here first restores them afterwards
+    for module, name in ((main, "RESEARCH_MODE"), (main, "WRITER_MODE"), (main, "SOURCE_VERIFY"), (main, "llm"),
+                         (tools, "wiki_rate_limiter"), (tools, "_run_wikipedia_query"),
+                         (tools, "_arun_wikipedia_query")):
+        monkeypatch.setattr(module, name, getattr(module, name))
+    monkeypatch.setattr(tools.wiki_cache, "path", None)
+
+    args = argparse.Namespace(research_mode=research_mode, generations=20, concurrency=10, latency=0.02)
+    results = benchmark.bench_isolation(args)
+    for execution in ("threads", "async"):
+        assert results[execution]["foreign_sources"] == 0, execution
+        assert results[execution]["without_sources"] == 0, execution
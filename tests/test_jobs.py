@@ -0,0 +1,127 @@
+import time
+
+import pytest
+
+import jobs
+from jobs import DONE, FAILED, InMemoryJobBackend, JobQueue, RUNNING, SQLiteJobBackend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteJobBackend(str(tmp_path / "jobs.sqlite3"), poll_interval=0.01, running_timeout=60)
+
+
+@pytest.fixture
+def start_queue():
+    queues = []
+
+    def start(*args, **kwargs):
+        queues.append(JobQueue(*args, **kwargs))
+        return queues[-1]
+
+    yield start
+    for queue in queues:
+        threads = list(queue._threads)
+        queue.stop()
+        assert not any(thread.is_alive() for thread in threads)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_claim_rolls_back_when_a_statement_fails(backend, monkeypatch):
+    backend.submit("a", {"topic": "x"})
+
+    def broken(db, now):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(backend, "_fail_abandoned", broken)
+    with pytest.raises(RuntimeError):
+        backend.claim(timeout=0)
+    monkeypatch.undo()
+    # No transaction was left open, so the job can still be claimed
+    assert backend.claim(timeout=0) == ("a", {"topic": "x"})
+
+
+def test_jobs_abandoned_by_a_dead_worker_are_failed(backend):
+    backend.submit("a", {"topic": "x"})
+    assert backend.claim(timeout=0)[0] == "a"
+    backend._connection().execute("UPDATE jobs SET started_at = ? WHERE id = 'a'", (time.time() - 120,))
+
+    backend.submit("b", {"topic": "y"})
+    assert backend.claim(timeout=0)[0] == "b"
+    job = backend.get("a")
+    assert job["status"] == FAILED and "worker stopped" in job["error"]
+    assert backend.events("a")[-1][1]["status"] == FAILED
+    assert backend.get("b")["status"] == RUNNING
+
+
+def test_worker_survives_claim_errors(backend, monkeypatch, start_queue):
+    claim = backend.claim
+    failures = iter([RuntimeError("database is locked")])
+
+    def flaky_claim(timeout=1.0):
+        for error in failures:
+            raise error
+        return claim(timeout=0.05)
+
+    monkeypatch.setattr(backend, "claim", flaky_claim)
+    monkeypatch.setattr(jobs, "CLAIM_RETRY_SECONDS", 0)
+    queue = start_queue(backend, handler=lambda payload, emit: {"topic": payload["topic"]})
+    job_id = queue.submit({"topic": "x"})
+    assert wait_for(lambda: backend.get(job_id)["status"] == DONE)
+
+
+def test_async_jobs_write_events_off_the_event_loop(start_queue):
+    backend = InMemoryJobBackend()
+    add_event = backend.add_event
+
+    def slow_add_event(job_id, event):
+        # A SQLite backend waiting on a locked database
+        time.sleep(0.02)
+        add_event(job_id, event)
+
+    backend.add_event = slow_add_event
+    handler_seconds = []
+
+    async def handler(payload, emit):
+        start = time.perf_counter()
+        for i in range(20):
+            emit({"type": "token", "text": str(i)})
+        handler_seconds.append(time.perf_counter() - start)
+        return {"topic": payload["topic"]}
+
+    queue = start_queue(backend, async_handler=handler, async_concurrency=2)
+    job_id = queue.submit({"topic": "x"})
+    assert wait_for(lambda: len(backend.events(job_id)) == 22)
+    assert handler_seconds[0] < 0.1
+    events = [event for _, event in backend.events(job_id)]
+    assert events[0] == {"type": "status", "status": RUNNING}
+    assert [event["text"] for event in events[1:-1]] == [str(i) for i in range(20)]
+    assert events[-1] == {"type": "status", "status": DONE}
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_stopped_queue_restarts_on_submit(start_queue, asynchronous):
+    async def ahandler(payload, emit):
+        return {"topic": payload["topic"]}
+
+    def handler(payload, emit):
+        return {"topic": payload["topic"]}
+
+    handlers = {"async_handler": ahandler} if asynchronous else {"handler": handler}
+    queue = start_queue(InMemoryJobBackend(), workers=2, **handlers)
+    first = queue.submit({"topic": "x"})
+    assert wait_for(lambda: queue.get(first)["status"] == DONE)
+    threads = list(queue._threads)
+    queue.stop()
+    assert not any(thread.is_alive() for thread in threads)
+
+    second = queue.submit({"topic": "y"})
+    assert wait_for(lambda: queue.get(second)["status"] == DONE)
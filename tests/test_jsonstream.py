@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from jsonstream import IncrementalJSONParser, parse_json_object
+from stubs import sample_assignment
+
+
+def test_complete_object_with_surrounding_prose():
+    text = 'Here it is:\n```json\n{"a": 1, "b": [1, {"c": "}"}], "d": "x\\"y"}\n```\nDone.'
+    assert parse_json_object(text) == ({"a": 1, "b": [1, {"c": "}"}], "d": 'x"y'}, True)
+
+
+def test_raw_newlines_and_trailing_commas():
+    data, complete = parse_json_object('{"a": "line one\nline two", "b": [1, 2,],}')
+    assert data == {"a": "line one\nline two", "b": [1, 2]}
+
+
+@pytest.mark.parametrize("scalar, value", [("5", 5), ("-1.5e3", -1500.0), ("true", True), ("false", False),
+                                           ("null", None)])
+def test_missing_comma_after_scalar_keeps_the_next_field(scalar, value):
+    data, complete = parse_json_object(f'{{"n": {scalar} "introduction": "B", "conclusion": "C"}}')
+    assert not complete
+    assert data == {"n": value, "introduction": "B", "conclusion": "C"}
+
+
+def test_missing_comma_after_string_array_and_object():
+    data, _ = parse_json_object('{"a": "x" "b": [1, 2] "c": {"d": 1} "e": 2}')
+    assert data == {"a": "x", "b": [1, 2], "c": {"d": 1}, "e": 2}
+
+
+def test_nested_arrays_and_objects_inside_items():
+    text = '{"main_sections": [{"title": "A", "content": "x", "tags": [[1, 2], [3]]}, ' \
+           '{"title": "B", "content": "y", "refs": {"n": [4, {"m": []}]}}], "conclusion": "C"}'
+    parser = IncrementalJSONParser()
+    events = parser.feed(text)
+    items = [event for event in events if event[0] == "item"]
+    assert [event[3]["title"] for event in items] == ["A", "B"]
+    assert items[0][3]["tags"] == [[1, 2], [3]]
+    assert parser.result() == json.loads(text)
+
+
+def test_scalar_array_items_are_reported_as_they_close():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"sources": ["a", 2, tr') == [("item", "sources", 0, "a"), ("item", "sources", 1, 2)]
+    assert parser.feed('ue]}') == [("item", "sources", 2, True), ("field", "sources", ["a", 2, True])]
+    assert parser.complete
+
+
+def test_truncation_at_every_offset_never_returns_wrong_data():
+    document = sample_assignment("Photosynthesis", section_words=20)
+    text = json.dumps(document, indent=2)
+    sections_seen = 0
+    for end in range(len(text) + 1):
+        data, complete = parse_json_object(text[:end])
+        assert complete == (end == len(text))
+        for key, value in data.items():
+            if isinstance(document[key], list) and value != document[key]:
+                # An array cut off mid-way holds the items that closed, in order
+                assert value == document[key][:len(value)], (end, key)
+            else:
+                assert value == document[key], (end, key)
+        sections = len(data.get("main_sections", []))
+        assert sections >= sections_seen, end
+        sections_seen = sections
+    assert sections_seen == len(document["main_sections"])
+
+
+def test_chunked_feed_matches_whole_feed():
+    text = json.dumps(sample_assignment("Gravity", section_words=30))
+    whole = IncrementalJSONParser()
+    expected = whole.feed(text)
+    for size in (1, 3, 17, 64):
+        parser = IncrementalJSONParser()
+        events = []
+        for i in range(0, len(text), size):
+            events += parser.feed(text[i:i + size])
+        assert events == expected
+        assert parser.result() == whole.result() == json.loads(text)
+
+
+def test_text_without_an_object():
+    assert parse_json_object("Sorry, I cannot help with that.") == ({}, False)
+    assert parse_json_object("") == ({}, False)
@@ -0,0 +1,79 @@
+import pytest
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration
+
+import main
+from cache import ResultCache
+from llmcache import LLMResponseCache, llm_cache_bypass, record_llm_cache_writes
+from stubs import FakeChatModel
+
+LLM_STRING = "fake-chat temperature=0"
+
+
+@pytest.fixture
+def llm_cache():
+    return LLMResponseCache(ResultCache("llm", max_entries=16))
+
+
+def prompt(reply_id="run-1", usage=None):
+    reply = AIMessage(content="Let me look that up.", id=reply_id, usage_metadata=usage,
+                      response_metadata={"model_name": "fake", "finish_reason": "stop"})
+    return dumps([HumanMessage(content="Research Gravity"), reply, HumanMessage(content="Now write it")])
+
+
+def test_key_ignores_message_ids_and_metadata():
+    usage = {"input_tokens": 10, "output_tokens": 5, "total_tokens": 15}
+    assert LLMResponseCache._key(prompt("run-1"), LLM_STRING) == LLMResponseCache._key(prompt("run-2", usage), LLM_STRING)
+
+
+def test_key_depends_on_the_model_and_the_messages():
+    key = LLMResponseCache._key(prompt(), LLM_STRING)
+    assert key != LLMResponseCache._key(prompt(), "fake-chat temperature=0.7")
+    assert key != LLMResponseCache._key(dumps([HumanMessage(content="Research Gravity")]), LLM_STRING)
+
+
+def test_bypass_skips_lookups_but_stores_responses(llm_cache):
+    llm = FakeChatModel(latency=0, tokens_per_second=1e9, cache=llm_cache)
+    first = llm.invoke("Write about Gravity")
+    with llm_cache_bypass():
+        llm.invoke("Write about Gravity")
+    with llm_cache_bypass(False):
+        cached = llm.invoke("Write about Gravity")
+    assert llm.calls == 2
+    assert cached.content == first.content
+    assert llm_cache.stats()["bypassed"] == 1
+
+
+def test_force_fresh_generation_bypasses_the_cache(llm_cache, monkeypatch):
+    seen = []
+
+    def generate(topic, on_event=None):
+        seen.append(llm_cache.lookup(prompt(), LLM_STRING))
+        return {"title": topic, "llm_calls": 1}
+
+    llm_cache.update(prompt(), LLM_STRING, [ChatGeneration(message=AIMessage(content="Gravity pulls."))])
+    assert llm_cache.lookup(prompt(), LLM_STRING)[0].message.content == "Gravity pulls."
+    monkeypatch.setattr(main, "create_enhanced_assignment", generate)
+    monkeypatch.setattr(main.result_cache, "path", None)
+    main.result_cache.clear()
+    main.get_or_create_assignment("Gravity", force_fresh=True)
+    assert seen == [None]
+    assert llm_cache.stats()["bypassed"] == 1
+
+
+def test_unparsed_writer_output_is_discarded(llm_cache, monkeypatch):
+    monkeypatch.setattr(main, "llm_cache", llm_cache)
+    llm = FakeChatModel(latency=0, tokens_per_second=1e9, cache=llm_cache)
+    llm.invoke("Research Gravity")
+    with record_llm_cache_writes() as written:
+        llm.invoke("Write about Gravity")
+        llm.invoke("Write about Gravity")  # cache hit, not a second write
+    assert len(written) == 1
+
+    main.discard_unparsed_output({"title": "Gravity"}, written)
+    assert llm_cache.stats()["entries"] == 2
+    main.discard_unparsed_output({"title": "Gravity", "partial": True}, written)
+    assert llm_cache.stats()["entries"] == 1
+    llm.invoke("Write about Gravity")
+    assert llm.calls == 3
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+import main
+import tools
+from stubs import FakeChatModel, stub_wikipedia
+
+
+@pytest.fixture
+def offline_pipeline(monkeypatch):
+    monkeypatch.setattr(main, "RESEARCH_MODE", "template")
+    monkeypatch.setattr(main, "SOURCE_VERIFY", False)
+    monkeypatch.setattr(main, "llm", FakeChatModel(latency=0.01, tokens_per_second=20000, streaming=True))
+    monkeypatch.setattr(tools, "_run_wikipedia_query", stub_wikipedia(latency=0))
+    monkeypatch.setattr(tools.wiki_cache, "path", None)
+
+
+@pytest.mark.parametrize("writer_mode", ["parallel", "pipelined"])
+def test_concurrent_writer_parts_stream_separately(writer_mode, offline_pipeline, monkeypatch):
+    monkeypatch.setattr(main, "WRITER_MODE", writer_mode)
+    events = []
+    result = main.create_enhanced_assignment("Gravity", on_event=events.append)
+    assignment = json.loads(result["output"])
+
+    streamed = {}
+    for event in events:
+        if event["type"] == "token" and event["phase"] == "writing":
+            key = (event["part"], event.get("title"))
+            streamed[key] = streamed.get(key, "") + event["text"]
+    assert streamed[("introduction", None)].strip() == assignment["introduction"]
+    assert streamed[("conclusion", None)].strip() == assignment["conclusion"]
+    for section in assignment["main_sections"]:
+        assert streamed[("section", section["title"])].strip() == section["content"]
+
+
+def test_single_writer_tokens_are_untagged(offline_pipeline, monkeypatch):
+    monkeypatch.setattr(main, "WRITER_MODE", "single")
+    events = []
+    main.create_enhanced_assignment("Gravity", on_event=events.append)
+    tokens = [event for event in events if event["type"] == "token" and event["phase"] == "writing"]
+    assert tokens and not any("part" in event for event in tokens)
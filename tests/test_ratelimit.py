@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+
+import tools
+from tools import TokenBucket
+
+
+class Clock:
+    """Stands in for the time module inside tools only, so sleeping advances it instantly."""
+
+    perf_counter = staticmethod(time.perf_counter)
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tools, "time", clock)
+    return clock
+
+
+def test_burst_is_available_at_once(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.now == 1000.0
+
+
+def test_tokens_refill_at_the_rate(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    bucket.acquire()
+    assert clock.now == pytest.approx(1000.5)
+    bucket.acquire()
+    assert clock.now == pytest.approx(1001.0)
+
+
+def test_idle_time_banks_at_most_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.acquire()
+    clock.now += 60
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.now == pytest.approx(1060.0)
+    bucket.acquire()
+    assert clock.now == pytest.approx(1060.5)
+
+
+def test_async_acquire_waits_for_a_token():
+    bucket = TokenBucket(rate=20, capacity=1)
+
+    async def take(count):
+        start = time.perf_counter()
+        for _ in range(count):
+            await bucket.acquire_async()
+        return time.perf_counter() - start
+
+    # One token banked, then one every 50 ms
+    assert 0.09 <= asyncio.run(take(3)) < 0.5
+
+
+def test_zero_rate_is_unlimited(clock):
+    bucket = TokenBucket(rate=0, capacity=0)
+    for _ in range(100):
+        bucket.acquire()
+    asyncio.run(bucket.acquire_async())
+    assert clock.now == 1000.0
+
+
+@pytest.mark.parametrize("rate, capacity", [(-1, 5), (5, 0), (5, 0.5)])
+def test_invalid_settings_are_rejected(rate, capacity):
+    with pytest.raises(ValueError):
+        TokenBucket(rate=rate, capacity=capacity)
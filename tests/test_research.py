@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import research
+import tools
+from research import parse_queries
+from stubs import stub_article, stub_wikipedia
+
+
+@pytest.fixture
+def stub_lookups(monkeypatch):
+    async def alookup(query):
+        return stub_article(query, 200)
+
+    monkeypatch.setattr(tools, "_run_wikipedia_query", stub_wikipedia(latency=0))
+    monkeypatch.setattr(tools, "_arun_wikipedia_query", alookup)
+    monkeypatch.setattr(tools.wiki_cache, "path", None)
+    tools.wiki_cache.clear()
+    tools.clear_research_cache()
+
+
+def lookups_reported(events):
+    started = [event["input"] for event in events if event["type"] == "tool_start"]
+    ended = [event for event in events if event["type"] == "tool_end"]
+    assert all(event["phase"] == "research" and event["tool"] == "wikipedia_research" for event in ended)
+    assert all(event["chars"] > 0 for event in ended)
+    assert len(ended) == len(started)
+    return sorted(started)
+
+
+def test_queries_from_prose_with_braces():
+    text = 'Plan (see {notes}): {"queries": ["Photosynthesis history", "Chlorophyll"]} and {"other": 1}'
+    assert parse_queries(text, "Photosynthesis") == ["Photosynthesis", "Photosynthesis history", "Chlorophyll"]
+
+
+def test_main_topic_is_not_duplicated():
+    assert parse_queries('{"queries": ["photosynthesis", "Calvin cycle"]}', "Photosynthesis") == [
+        "photosynthesis", "Calvin cycle"]
+
+
+def test_no_queries_raises():
+    with pytest.raises(ValueError):
+        parse_queries("I could not plan this.", "Photosynthesis")
+
+
+def test_template_research_reports_each_lookup(stub_lookups):
+    events = []
+    research.run_planned_research(None, "Gravity", mode="template", on_event=events.append)
+    assert lookups_reported(events) == sorted(tools.build_search_terms("Gravity"))
+
+
+def test_async_template_research_reports_each_lookup(stub_lookups):
+    events = []
+    asyncio.run(research.arun_planned_research(None, "Gravity", mode="template", on_event=events.append))
+    assert lookups_reported(events) == sorted(tools.build_search_terms("Gravity"))
+
+
+def test_pipelined_research_reports_each_lookup(stub_lookups):
+    events = []
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = research.start_planned_research(None, "Gravity", pool, mode="template", on_event=events.append)
+        [future.result() for future in futures]
+    assert lookups_reported(events) == sorted(tools.build_search_terms("Gravity"))
@@ -0,0 +1,61 @@
+import pytest
+
+import tools
+from stubs import StubWikipediaServer
+
+
+@pytest.fixture
+def wiki_server(monkeypatch):
+    monkeypatch.setattr(tools.title_cache, "path", None)
+    tools.title_cache.clear()
+    with StubWikipediaServer(latency=0, redirects={"Gravitation": "Gravity"}) as server:
+        monkeypatch.setattr(tools, "WIKI_API_URL", server.url)
+        yield server
+    tools.title_cache.clear()
+
+
+class PartialIndex:
+    name = "local"
+    path = "partial.sqlite3"
+
+    def resolve_titles(self, titles):
+        return {title: None for title in titles}
+
+
+def test_resolve_titles_follows_normalization_and_redirects(wiki_server):
+    assert tools._resolve_titles(["photosynthesis", "gravitation", "Gravity"]) == {
+        "photosynthesis": "Photosynthesis", "gravitation": "Gravity", "Gravity": "Gravity"}
+    assert wiki_server.requests == 1
+
+
+def test_resolve_titles_marks_missing_pages(wiki_server):
+    assert tools._resolve_titles(["Calvin Cycle", "Calvin cycle"]) == {
+        "Calvin Cycle": "Calvin Cycle", "Calvin cycle": None}
+
+
+def test_verify_sources_batches_titles_and_caches_them(wiki_server, monkeypatch):
+    monkeypatch.setattr(tools, "TITLES_PER_REQUEST", 2)
+    candidates = [
+        ("gravitation", ["gravitation", "Gravity"], "https://en.wikipedia.org/wiki/gravitation"),
+        ("light", ["light", "Speed of light", "Light"], "https://en.wikipedia.org/wiki/light"),
+        ("no such page", ["no such page"], "https://en.wikipedia.org/wiki/no_such_page"),
+    ]
+    expected = [
+        "Wikipedia: 'Gravity' - https://en.wikipedia.org/wiki/Gravity",
+        "Wikipedia: 'Light' - https://en.wikipedia.org/wiki/Light",
+    ]
+    assert tools.verify_sources(candidates) == expected
+    assert wiki_server.requests == 3  # 6 distinct titles, 2 per query
+
+    assert tools.verify_sources(candidates) == expected
+    assert wiki_server.requests == 3
+
+
+def test_backends_do_not_share_resolved_titles(wiki_server, monkeypatch):
+    candidate = [("gravity", ["gravity"], "https://en.wikipedia.org/wiki/gravity")]
+    monkeypatch.setattr(tools, "research_backend", PartialIndex())
+    assert tools.verify_sources(candidate) == []
+
+    monkeypatch.setattr(tools, "research_backend", tools.WikipediaAPIBackend())
+    assert tools.verify_sources(candidate) == ["Wikipedia: 'Gravity' - https://en.wikipedia.org/wiki/Gravity"]
+    assert wiki_server.requests == 1
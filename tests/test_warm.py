@@ -0,0 +1,20 @@
+import main
+import research
+import tools
+import warm
+
+
+def test_template_mode_warms_the_template_queries(monkeypatch):
+    monkeypatch.setattr(main, "RESEARCH_MODE", "template")
+    assert warm.research_queries("Gravity") == tools.build_search_terms("Gravity")
+
+
+def test_planner_mode_warms_the_planned_queries(monkeypatch):
+    monkeypatch.setattr(main, "RESEARCH_MODE", "planner")
+    monkeypatch.setattr(main, "get_llm", lambda: "llm")
+    monkeypatch.setattr(research, "plan_queries", lambda llm, topic: [topic, f"{topic} in physics"])
+    monkeypatch.setattr(tools.wiki_cache, "path", None)
+    tools.wiki_cache.clear()
+    status = warm.topic_staleness("Gravity")
+    assert status["wikipedia_stale"] == ["Gravity", "Gravity in physics"]
+    assert status["wikipedia_lookups"] == 2
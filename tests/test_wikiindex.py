@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from wikiindex import LocalIndexBackend, build_index
+
+ARTICLES = [
+    {"title": "Photosynthesis", "text": "Photosynthesis converts light energy into chemical energy in plants."},
+    {"title": "Calvin_cycle", "text": "The Calvin cycle fixes carbon dioxide into sugars during photosynthesis."},
+    {"title": "Chlorophyll", "text": "Chlorophyll is the green pigment that absorbs light in chloroplasts."},
+    {"title": "Gravity", "text": "Gravity is the attraction between masses, described by general relativity."},
+    {"title": "Gravitation", "redirect": "Gravity"},
+    {"title": "Empty page", "text": ""},
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    source = tmp_path / "articles.jsonl"
+    source.write_text("\n".join(json.dumps(article) for article in ARTICLES) + "\n\n", encoding="utf-8")
+    path = str(tmp_path / "wiki_index.sqlite3")
+    assert build_index([str(source)], path, batch_size=2) == (4, 1)
+    return LocalIndexBackend(path, top_k_results=2, chars_max=4000)
+
+
+def test_missing_index_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        LocalIndexBackend(str(tmp_path / "missing.sqlite3"))
+
+
+def test_exact_title_lookup(index):
+    assert [title for title, _ in index.search("photosynthesis")][0] == "Photosynthesis"
+    assert index.lookup("Chlorophyll").startswith(
+        "Page: Chlorophyll\nSummary: Chlorophyll is the green pigment")
+
+
+def test_full_text_lookup(index):
+    assert [title for title, _ in index.search("carbon dioxide sugars")] == ["Calvin cycle"]
+    assert [title for title, _ in index.search("chloroplasts")] == ["Chlorophyll"]
+
+
+def test_missing_pages(index):
+    assert index.search("quantum chromodynamics") == []
+    assert index.lookup("quantum chromodynamics") == "No good Wikipedia Search Result was found"
+    assert index.resolve_title("Empty page") is None
+
+
+def test_resolve_titles_follows_redirects(index):
+    assert index.resolve_titles(["gravitation", "calvin_cycle", "Photosynthesis", "Osmosis"]) == {
+        "gravitation": "Gravity", "calvin_cycle": "Calvin cycle", "Photosynthesis": "Photosynthesis", "Osmosis": None}
+
+
+def test_rebuild_updates_articles(index, tmp_path):
+    update = tmp_path / "update.jsonl"
+    update.write_text(json.dumps({"title": "Gravity", "text": "Gravity bends spacetime."}), encoding="utf-8")
+    assert build_index([str(update)], index.path) == (1, 0)
+    reopened = LocalIndexBackend(index.path)
+    assert reopened.search("Gravity", limit=1) == [("Gravity", "Gravity bends spacetime.")]
+    assert [title for title, _ in reopened.search("spacetime")] == ["Gravity"]
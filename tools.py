@@ -1,103 +1,369 @@
-from langchain_community.tools import WikipediaQueryRun, DuckDuckGoSearchRun
-from langchain_community.utilities import WikipediaAPIWrapper, DuckDuckGoSearchAPIWrapper
-from langchain.tools import Tool
+from langchain_core.tools import Tool
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import httpx
 import json
-import requests
-from urllib.parse import urlparse
+import threading
+import time
+import weakref
+from urllib.parse import quote, urlparse
+import os
 import re
+from cache import ResultCache
+from metrics import log_event, record_wikipedia_call, stage
+from httpclient import USER_AGENT, get_session
 
-WIKIPEDIA_SOURCES = []
-SEARCH_SOURCES = []
-RESEARCH_FACTS = {}
+WIKI_PARAMS = {
+    "top_k_results": 2,
+    "doc_content_chars_max": 4000,
+    "load_all_available_meta": True
+}
+
+# Survives clear_research_cache(): only the per-request source tracking is reset
+wiki_cache = ResultCache(
+    "wikipedia",
+    max_entries=int(os.getenv("WIKI_CACHE_MAX_ENTRIES", "512")),
+    ttl=float(os.getenv("WIKI_CACHE_TTL", str(7 * 24 * 3600))),
+    path=os.getenv("WIKI_CACHE_PATH", "wiki_cache.sqlite3")
+)
+
+DEFAULT_SUBTOPIC_TEMPLATES = [
+    "{topic}",
+    "{topic} history",
+    "{topic} applications",
+    "{topic} examples",
+    "{topic} development"
+]
+
+RESEARCH_SUBTOPICS = [
+    template.strip() for template in os.getenv("RESEARCH_SUBTOPICS", "").split(",") if template.strip()
+] or DEFAULT_SUBTOPIC_TEMPLATES
+
+WIKI_MAX_WORKERS = int(os.getenv("WIKI_MAX_WORKERS", "5"))
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `capacity` banked.
+
+    A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        if rate < 0:
+            raise ValueError(f"rate must be 0 (unlimited) or positive, got {rate}")
+        if rate and capacity < 1:
+            raise ValueError(f"capacity must be at least 1 token, got {capacity}")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> float:
+        """Take a token if one is available; otherwise return the seconds to wait for one."""
+        if not self.rate:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+wiki_rate_limiter = TokenBucket(
+    rate=float(os.getenv("WIKI_RATE_LIMIT", "5")),
+    capacity=float(os.getenv("WIKI_RATE_BURST", "5"))
+)
 
 class Tracker:
     def __init__(self):
         self.found_sources = []
 
-search_tracker = Tracker()
-wiki_tracker = Tracker()
+class ResearchContext:
+    """Sources and facts collected by one generation."""
+
+    def __init__(self):
+        self.wikipedia_sources = []
+        self.search_sources = []
+        self.facts = {}
+        self.search_tracker = Tracker()
+        self.wiki_tracker = Tracker()
+        self.lock = threading.Lock()
+
+# clear_research_cache() gives each generation its own ResearchContext. Threads and tasks started
+# with a copy of the generation's context share it; callers that never cleared share the default.
+_research_var = contextvars.ContextVar("research", default=None)
+_default_research = ResearchContext()
+
+def current_research() -> ResearchContext:
+    return _research_var.get() or _default_research
 
 def verify_url(url: str) -> bool:
     try:
-        response = requests.head(url, timeout=5, allow_redirects=True)
+        response = get_session().head(url, timeout=5, allow_redirects=True)
         return response.status_code == 200
     except:
         return False
 
 def clear_research_cache():
-    global WIKIPEDIA_SOURCES, SEARCH_SOURCES, RESEARCH_FACTS
-    WIKIPEDIA_SOURCES = []
-    SEARCH_SOURCES = []
-    RESEARCH_FACTS = {}
-    search_tracker.found_sources = []
-    wiki_tracker.found_sources = []
+    """Start a fresh research context for the calling thread or task."""
+    _research_var.set(ResearchContext())
 
-def forced_wikipedia_research(query: str) -> str:
-    global WIKIPEDIA_SOURCES, RESEARCH_FACTS
-    
-    try:
-        api_wrapper = WikipediaAPIWrapper(
-            top_k_results=2, 
-            doc_content_chars_max=4000,
-            load_all_available_meta=True
+def clear_wikipedia_cache():
+    wiki_cache.clear()
+
+def get_wikipedia_cache_stats():
+    return wiki_cache.stats()
+
+def _wiki_cache_key(query: str) -> str:
+    normalized = " ".join(query.lower().split())
+    return json.dumps([normalized, WIKI_PARAMS], sort_keys=True)
+
+WIKI_API_URL = os.getenv("WIKI_API_URL", "https://en.wikipedia.org/w/api.php")
+WIKI_TIMEOUT = float(os.getenv("WIKI_TIMEOUT", "10"))
+
+# One AsyncClient per event loop, so connections are reused across lookups on that loop
+_async_clients = weakref.WeakKeyDictionary()
+
+def _async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=WIKI_TIMEOUT,
+            headers={"User-Agent": USER_AGENT},
+            # wiki_rate_limiter already bounds concurrent lookups; a connection cap only makes
+            # httpcore queue requests, and its queue scan gets expensive under load
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=50)
+        )
+        _async_clients[loop] = client
+    return client
+
+async def aclose_wikipedia_client():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+def _search_params(query: str, top_k_results=None) -> dict:
+    return {
+        "action": "query", "list": "search", "srsearch": query,
+        "srlimit": top_k_results or WIKI_PARAMS["top_k_results"], "format": "json", "formatversion": 2
+    }
+
+def _extract_params(titles: list) -> dict:
+    return {
+        "action": "query", "prop": "extracts", "exintro": 1, "explaintext": 1, "redirects": 1,
+        "titles": "|".join(titles), "format": "json", "formatversion": 2
+    }
+
+def _format_pages(titles: list, extracts_response: dict, chars_max=None) -> str:
+    """Render MediaWiki extracts the way WikipediaAPIWrapper does ("Page: ...\nSummary: ...")."""
+    query = extracts_response.get("query", {})
+    redirects = {r["from"]: r["to"] for r in query.get("redirects", []) + query.get("normalized", [])}
+    summaries = {page["title"]: page.get("extract", "") for page in query.get("pages", [])}
+    pages = []
+    for title in titles:
+        resolved = redirects.get(title, title)
+        summary = summaries.get(resolved, "").strip()
+        if summary:
+            pages.append(f"Page: {resolved}\nSummary: {summary}")
+    if not pages:
+        return "No good Wikipedia Search Result was found"
+    return "\n\n".join(pages)[:chars_max or WIKI_PARAMS["doc_content_chars_max"]]
+
+def wikipedia_lookup(query: str, top_k_results=None, chars_max=None) -> str:
+    """Search Wikipedia and return the top pages' intros, over the shared keep-alive session.
+
+    One search request plus one batched extracts request, instead of the wikipedia
+    package's fresh connection per search and per page.
+    """
+    session = get_session()
+    search = session.get(WIKI_API_URL, params=_search_params(query, top_k_results), timeout=WIKI_TIMEOUT)
+    search.raise_for_status()
+    titles = [hit["title"] for hit in search.json().get("query", {}).get("search", [])]
+    if not titles:
+        return "No good Wikipedia Search Result was found"
+    extracts = session.get(WIKI_API_URL, params=_extract_params(titles), timeout=WIKI_TIMEOUT)
+    extracts.raise_for_status()
+    return _format_pages(titles, extracts.json(), chars_max)
+
+async def awikipedia_lookup(query: str) -> str:
+    client = _async_client()
+    search = await client.get(WIKI_API_URL, params=_search_params(query))
+    search.raise_for_status()
+    titles = [hit["title"] for hit in search.json().get("query", {}).get("search", [])]
+    if not titles:
+        return "No good Wikipedia Search Result was found"
+    extracts = await client.get(WIKI_API_URL, params=_extract_params(titles))
+    extracts.raise_for_status()
+    return _format_pages(titles, extracts.json())
+
+class WikipediaAPIBackend:
+    """Research backend that queries the live MediaWiki API (rate limited, results cached)."""
+
+    name = "api"
+    remote = True
+
+    def lookup(self, query: str) -> str:
+        return wikipedia_lookup(query)
+
+    async def alookup(self, query: str) -> str:
+        return await awikipedia_lookup(query)
+
+    def resolve_titles(self, titles: list) -> dict:
+        return _resolve_titles(titles)
+
+def create_research_backend():
+    """The backend named by WIKI_BACKEND: "api" (live Wikipedia) or "local" (index built by wikiindex.py)."""
+    if os.getenv("WIKI_BACKEND", "api") == "local":
+        from wikiindex import LocalIndexBackend
+        return LocalIndexBackend(
+            os.getenv("WIKI_INDEX_PATH", "wiki_index.sqlite3"),
+            top_k_results=WIKI_PARAMS["top_k_results"],
+            chars_max=WIKI_PARAMS["doc_content_chars_max"]
         )
-        wiki_tool = WikipediaQueryRun(api_wrapper=api_wrapper)
+    return WikipediaAPIBackend()
+
+research_backend = create_research_backend()
+
+def _run_wikipedia_query(query: str) -> str:
+    return research_backend.lookup(query)
+
+async def _arun_wikipedia_query(query: str) -> str:
+    return await research_backend.alookup(query)
+
+def _record_research(query: str, result: str) -> str:
+    """Track a lookup's source and facts for the current generation and format it for the agent."""
+    research = current_research()
+    
+    if result and len(result) > 100:
+        clean_query = query.replace(' ', '_').replace(',', '').replace(':', '').replace('(', '').replace(')', '')
+        wiki_url = f"https://en.wikipedia.org/wiki/{clean_query}"
         
-        result = wiki_tool.run(query)
+        source_entry = f"Wikipedia: '{query}' - {wiki_url}"
         
-        if result and len(result) > 100:
-            clean_query = query.replace(' ', '_').replace(',', '').replace(':', '').replace('(', '').replace(')', '')
-            wiki_url = f"https://en.wikipedia.org/wiki/{clean_query}"
-            
-            source_entry = f"Wikipedia: '{query}' - {wiki_url}"
+        with research.lock:
+            if source_entry not in research.wikipedia_sources:
+                research.wikipedia_sources.append(source_entry)
             
-            if source_entry not in WIKIPEDIA_SOURCES:
-                WIKIPEDIA_SOURCES.append(source_entry)
-            
-            RESEARCH_FACTS[query] = {
+            research.facts[query] = {
                 'content': result,
                 'source': wiki_url,
                 'length': len(result)
             }
             
-            if source_entry not in wiki_tracker.found_sources:
-                wiki_tracker.found_sources.append(source_entry)
-            
-            return f"WIKIPEDIA RESEARCH ON '{query.upper()}':\n\n{result}\n\n[VERIFIED SOURCE: {wiki_url}]"
-            
-        else:
-            return f"Limited Wikipedia information found for '{query}'. Please try a more specific search term."
-            
+            if source_entry not in research.wiki_tracker.found_sources:
+                research.wiki_tracker.found_sources.append(source_entry)
+        
+        return f"WIKIPEDIA RESEARCH ON '{query.upper()}':\n\n{result}\n\n[VERIFIED SOURCE: {wiki_url}]"
+        
+    else:
+        return f"Limited Wikipedia information found for '{query}'. Please try a more specific search term."
+
+def _lookup_cache_key(query: str):
+    # A local index answers in milliseconds, so only remote lookups are cached and rate limited
+    return _wiki_cache_key(query) if research_backend.remote else None
+
+def _should_cache(cache_key, result) -> bool:
+    return cache_key is not None and bool(result) and len(result) > 100
+
+def _finish_lookup(query: str, result: str, started: float, cache_hit: bool) -> str:
+    record_wikipedia_call(query, time.perf_counter() - started, len(result or ""), cache_hit)
+    return _record_research(query, result)
+
+def _failed_lookup(query: str, error: Exception) -> str:
+    return f"Wikipedia research failed for '{query}': {str(error)}"
+
+def forced_wikipedia_research(query: str) -> str:
+    try:
+        started = time.perf_counter()
+        cache_key = _lookup_cache_key(query)
+        result = wiki_cache.get(cache_key) if cache_key else None
+        cache_hit = result is not None
+        
+        if result is None:
+            if cache_key:
+                wiki_rate_limiter.acquire()
+            result = _run_wikipedia_query(query)
+            if _should_cache(cache_key, result):
+                wiki_cache.set(cache_key, result)
+        
+        return _finish_lookup(query, result, started, cache_hit)
     except Exception as e:
-        return f"Wikipedia research failed for '{query}': {str(e)}"
+        return _failed_lookup(query, e)
 
-def comprehensive_topic_research(main_topic: str) -> str:
-    global RESEARCH_FACTS
-    
-    search_terms = [
-        main_topic,
-        f"{main_topic} history",
-        f"{main_topic} applications",
-        f"{main_topic} examples",
-        f"{main_topic} development"
-    ]
+async def aforced_wikipedia_research(query: str) -> str:
+    """forced_wikipedia_research on the event loop; the cache's SQLite tier is used off the loop."""
+    try:
+        started = time.perf_counter()
+        cache_key = _lookup_cache_key(query)
+        result = await wiki_cache.aget(cache_key) if cache_key else None
+        cache_hit = result is not None
+        
+        if result is None:
+            if cache_key:
+                await wiki_rate_limiter.acquire_async()
+            result = await _arun_wikipedia_query(query)
+            if _should_cache(cache_key, result):
+                await wiki_cache.aset(cache_key, result)
+        
+        return _finish_lookup(query, result, started, cache_hit)
+    except Exception as e:
+        return _failed_lookup(query, e)
+
+def build_search_terms(main_topic: str, templates=None) -> list:
+    return [template.format(topic=main_topic) for template in (templates or RESEARCH_SUBTOPICS)]
+
+def comprehensive_topic_research(main_topic: str, search_terms=None, max_workers=None, lookup=None) -> str:
+    search_terms = search_terms or build_search_terms(main_topic)
+    lookup = lookup or forced_wikipedia_research
     
-    all_research = []
+    # forced_wikipedia_research never raises, so one failing term cannot sink the others;
+    # pool.map keeps results in search_terms order regardless of completion order.
+    # Each call runs in a copy of the caller's context so the trace ID follows it.
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=max_workers or WIKI_MAX_WORKERS) as pool:
+        results = list(pool.map(lambda term: context.copy().run(lookup, term), search_terms))
     
-    for term in search_terms:
-        research = forced_wikipedia_research(term)
-        all_research.append(f"### Research on '{term}':\n{research}\n")
-        
-        import time
-        time.sleep(0.5)
+    all_research = [
+        f"### Research on '{term}':\n{research}\n" for term, research in zip(search_terms, results)
+    ]
     
     comprehensive_result = "\n".join(all_research)
     
     return comprehensive_result
 
+async def acomprehensive_topic_research(main_topic: str, search_terms=None, lookup=None) -> str:
+    search_terms = search_terms or build_search_terms(main_topic)
+    lookup = lookup or aforced_wikipedia_research
+    
+    results = await asyncio.gather(*(lookup(term) for term in search_terms))
+    
+    return "\n".join(
+        f"### Research on '{term}':\n{research}\n" for term, research in zip(search_terms, results)
+    )
+
 def save_to_txt_with_real_sources(data: str, filename: str = "assignment.txt"):
-    global WIKIPEDIA_SOURCES, RESEARCH_FACTS
+    research = current_research()
+    with research.lock:
+        research_facts = dict(research.facts)
     
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
@@ -131,13 +397,13 @@ def save_to_txt_with_real_sources(data: str, filename: str = "assignment.txt"):
         
         formatted_text += f"## Research Methodology\n\n"
         formatted_text += f"Tools Used: {', '.join(assignment_data.get('tools_used', ['wikipedia']))}\n"
-        formatted_text += f"Wikipedia Articles Researched: {len(RESEARCH_FACTS)}\n"
-        formatted_text += f"Total Research Content: {sum(facts['length'] for facts in RESEARCH_FACTS.values())} characters\n"
+        formatted_text += f"Wikipedia Articles Researched: {len(research_facts)}\n"
+        formatted_text += f"Total Research Content: {sum(facts['length'] for facts in research_facts.values())} characters\n"
         formatted_text += f"Generated: {timestamp}\n\n"
         
-        if RESEARCH_FACTS:
+        if research_facts:
             formatted_text += f"## Research Sources Detail\n\n"
-            for topic, facts in RESEARCH_FACTS.items():
+            for topic, facts in research_facts.items():
                 formatted_text += f"**{topic}**: {facts['length']} characters from {facts['source']}\n"
             formatted_text += "\n"
         
@@ -159,28 +425,223 @@ def save_to_txt_with_real_sources(data: str, filename: str = "assignment.txt"):
     return f"Academic assignment saved to {filename} with {len(get_all_sources())} Wikipedia sources"
 
 def get_research_summary():
-    global WIKIPEDIA_SOURCES, RESEARCH_FACTS
+    research = current_research()
     
-    return {
-        'sources_count': len(WIKIPEDIA_SOURCES),
-        'research_topics': list(RESEARCH_FACTS.keys()),
-        'total_content_length': sum(facts['length'] for facts in RESEARCH_FACTS.values()),
-        'sources_list': WIKIPEDIA_SOURCES.copy()
-    }
+    with research.lock:
+        return {
+            'sources_count': len(research.wikipedia_sources),
+            'research_topics': list(research.facts.keys()),
+            'total_content_length': sum(facts['length'] for facts in research.facts.values()),
+            'sources_list': research.wikipedia_sources.copy()
+        }
 
 def get_all_sources():
-    global WIKIPEDIA_SOURCES
-    return WIKIPEDIA_SOURCES.copy()
+    research = current_research()
+    with research.lock:
+        return research.wikipedia_sources.copy()
+
+SOURCE_VERIFY = os.getenv("SOURCE_VERIFY", "1") != "0"
+SOURCE_VERIFY_WAIT = float(os.getenv("SOURCE_VERIFY_WAIT", "5"))
+# MediaWiki accepts up to 50 titles per query
+TITLES_PER_REQUEST = 50
+
+# Canonical page title (or None when the page does not exist) per requested title
+title_cache = ResultCache(
+    "wikipedia_titles",
+    max_entries=int(os.getenv("TITLE_CACHE_MAX_ENTRIES", "4096")),
+    ttl=float(os.getenv("TITLE_CACHE_TTL", str(24 * 3600))),
+    path=os.getenv("WIKI_CACHE_PATH", "wiki_cache.sqlite3")
+)
+
+def get_title_cache_stats():
+    return title_cache.stats()
+
+def wikipedia_url(title: str) -> str:
+    return f"https://en.wikipedia.org/wiki/{quote(title.replace(' ', '_'), safe='()_,:')}"
+
+def _source_candidates() -> list:
+    """(query, candidate titles, original URL) per lookup so far.
+
+    The candidates are the query itself, then the pages its search returned.
+    """
+    research = current_research()
+    with research.lock:
+        facts = list(research.facts.items())
+    return [
+        (
+            query,
+            list(dict.fromkeys([query] + re.findall(r"^Page: (.+)$", entry["content"], re.MULTILINE))),
+            entry["source"],
+        )
+        for query, entry in facts
+    ]
+
+def _resolve_titles(titles: list) -> dict:
+    """One batched MediaWiki query: requested title -> canonical title, or None if the page is missing."""
+    response = get_session().get(WIKI_API_URL, params={
+        "action": "query", "titles": "|".join(titles), "redirects": 1, "format": "json", "formatversion": 2
+    }, timeout=WIKI_TIMEOUT)
+    response.raise_for_status()
+    query = response.json().get("query", {})
+    renames = {r["from"]: r["to"] for r in query.get("normalized", []) + query.get("redirects", [])}
+    existing = {page["title"] for page in query.get("pages", []) if not page.get("missing") and not page.get("invalid")}
+    resolved = {}
+    for title in titles:
+        canonical = title
+        for _ in range(3):  # normalized -> redirect chains are short
+            canonical = renames.get(canonical, canonical)
+        resolved[title] = canonical if canonical in existing else None
+    return resolved
+
+def _title_cache_key(title: str) -> str:
+    # Backends disagree on which pages exist (a local index is usually partial), so never share entries
+    source = getattr(research_backend, "path", WIKI_API_URL)
+    return json.dumps([research_backend.name, source, title])
+
+def verify_sources(candidates: list) -> list:
+    """Source entries with canonical, existing Wikipedia URLs.
+
+    Every uncached title is resolved in batched `titles=` queries, run concurrently;
+    results (including missing pages) are cached. A query whose candidates all turn
+    out to be missing is dropped; one that could not be checked keeps its original entry.
+    """
+    with stage("source_verify", queries=len(candidates)) as fields:
+        titles = list(dict.fromkeys(title for _, query_titles, _ in candidates for title in query_titles))
+        known = {}
+        for title in titles:
+            cached = title_cache.get(_title_cache_key(title))
+            if cached is not None:
+                known[title] = cached["title"]
+        missing = [title for title in titles if title not in known]
+        chunks = [missing[i:i + TITLES_PER_REQUEST] for i in range(0, len(missing), TITLES_PER_REQUEST)]
+
+        def resolve(chunk):
+            try:
+                return research_backend.resolve_titles(chunk)
+            except Exception as e:
+                log_event("source_verify_error", titles=len(chunk), error=str(e))
+                return {}
+
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=max(1, min(len(chunks), WIKI_MAX_WORKERS))) as pool:
+            for resolved in pool.map(lambda chunk: context.copy().run(resolve, chunk), chunks):
+                for title, canonical in resolved.items():
+                    title_cache.set(_title_cache_key(title), {"title": canonical})
+                    known[title] = canonical
+
+        sources, dropped = [], 0
+        for query, query_titles, original_url in candidates:
+            found = next((known[title] for title in query_titles if known.get(title)), None)
+            if found:
+                entry = f"Wikipedia: '{found}' - {wikipedia_url(found)}"
+            elif all(title in known for title in query_titles):
+                dropped += 1
+                continue
+            else:
+                entry = f"Wikipedia: '{query}' - {original_url}"
+            if entry not in sources:
+                sources.append(entry)
+
+        fields.update(titles=len(titles), requests=len(chunks), verified=len(sources), dropped=dropped)
+        return sources
+
+def start_source_verification():
+    """Snapshot this generation's lookups and verify their sources on a background thread.
+
+    Returns a Future of the verified source list, so callers can overlap it with writing.
+    """
+    candidates = _source_candidates()
+    context = contextvars.copy_context()
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="source-verify")
+    future = pool.submit(context.run, verify_sources, candidates)
+    pool.shutdown(wait=False)
+    return future
+
+RESEARCH_CONTEXT_TOKENS = int(os.getenv("RESEARCH_CONTEXT_TOKENS", "2500"))
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English prose; close enough for budgeting
+    return len(text) // 4 + 1
+
+def _split_passages(content: str) -> list:
+    passages = []
+    for block in re.split(r"\n\s*\n", content):
+        block = re.sub(r"^(Page|Summary):\s*", "", block.strip(), flags=re.MULTILINE)
+        passages.extend(line.strip() for line in block.split("\n") if len(line.strip()) > 40)
+    return passages
+
+def build_research_context(topic: str, token_budget=None):
+    """Rank, deduplicate and trim the collected research facts into a compact prompt context.
+    
+    Returns (context_text, stats) where stats compares raw and compact token estimates.
+    """
+    token_budget = token_budget or RESEARCH_CONTEXT_TOKENS
+    topic_terms = {term for term in re.findall(r"\w+", topic.lower()) if len(term) > 2}
+    
+    research = current_research()
+    with research.lock:
+        facts = list(research.facts.items())
+    
+    seen = set()
+    candidates = []
+    for query_rank, (query, facts_entry) in enumerate(facts):
+        for position, passage in enumerate(_split_passages(facts_entry['content'])):
+            fingerprint = " ".join(re.findall(r"\w+", passage.lower()))[:200]
+            if fingerprint in seen:
+                continue
+            seen.add(fingerprint)
+            
+            words = set(re.findall(r"\w+", passage.lower()))
+            overlap = len(topic_terms & words) / (len(topic_terms) or 1)
+            has_specifics = 1 if re.search(r"\b(1[5-9]\d\d|20\d\d)\b", passage) else 0
+            # Lead passages of each article and earlier queries are the most on-topic
+            score = overlap + 0.5 * has_specifics + 1.0 / (1 + position) + 0.5 / (1 + query_rank)
+            candidates.append((score, query_rank, position, passage, facts_entry['source']))
+    
+    selected = []
+    used_sources = set()
+    used_tokens = 0
+    for candidate in sorted(candidates, key=lambda c: -c[0]):
+        source = candidate[4]
+        cost = estimate_tokens(f"- {candidate[3]}\n")
+        if source not in used_sources:
+            cost += estimate_tokens(f"\n[Source: {source}]\n")
+        if used_tokens + cost > token_budget:
+            continue
+        selected.append(candidate)
+        used_sources.add(source)
+        used_tokens += cost
+    
+    # Present the chosen passages in reading order, grouped by source
+    selected.sort(key=lambda c: (c[1], c[2]))
+    lines = []
+    current_source = None
+    for _, _, _, passage, source in selected:
+        if source != current_source:
+            lines.append(f"\n[Source: {source}]")
+            current_source = source
+        lines.append(f"- {passage}")
+    
+    context = "\n".join(lines).strip()
+    stats = {
+        'raw_tokens': sum(estimate_tokens(entry['content']) for _, entry in facts),
+        'context_tokens': estimate_tokens(context) if context else 0,
+        'passages': len(selected),
+        'candidates': len(candidates)
+    }
+    return context, stats
 
 comprehensive_research_tool = Tool(
     name="comprehensive_wikipedia_research",
     func=comprehensive_topic_research,
+    coroutine=acomprehensive_topic_research,
     description="Conduct comprehensive Wikipedia research on a topic, including related subtopics. Use this for thorough fact-gathering. Input should be the main topic to research."
 )
 
 wikipedia_research_tool = Tool(
     name="wikipedia_research",
     func=forced_wikipedia_research,
+    coroutine=aforced_wikipedia_research,
     description="Research a specific topic on Wikipedia and collect factual information. Input should be a specific topic or concept to research."
 )
 
@@ -0,0 +1,200 @@
+"""Keep the caches warm for popular topics: python warm.py topics.txt --assignments --concurrency 4
+
+For each topic the Wikipedia lookups a generation would make in the configured
+RESEARCH_MODE are fetched into the research cache, and with --assignments whole
+assignments are generated into the result cache, so /generate answers those topics from
+cache. In planner mode the plan itself is one LLM call that LLM_CACHE keeps, so
+generations plan the same queries and find them warm; the agent chooses its queries as
+it goes, so in agent mode only the lookups it shares with the template queries are
+warmed (use --assignments there). Only
+entries that are missing or older than --max-age (default: each cache's TTL) are
+refreshed, so rerunning it on a schedule (cron, or --every SECONDS) is cheap.
+--report prints how stale each topic is without fetching any articles.
+
+The app only sees the warmed entries when WIKI_CACHE_PATH and RESULT_CACHE_PATH point
+at the same files for both processes. Alternatively set WARM_TOPICS_PATH and the app
+runs this warm-up itself on a background thread.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tools
+from batch import read_topics
+from metrics import log_event
+
+WARM_CONCURRENCY = int(os.getenv("WARM_CONCURRENCY", "4"))
+
+
+def _stale(cache, key, max_age):
+    """(age in seconds or None, whether the entry needs refreshing)"""
+    age = cache.age(key)
+    limit = max_age if max_age is not None else cache.ttl
+    return age, age is None or (limit is not None and age > limit)
+
+
+def research_queries(topic):
+    """The Wikipedia lookups a generation for `topic` makes in the configured RESEARCH_MODE."""
+    import main
+
+    if main.RESEARCH_MODE == "planner":
+        from research import plan_queries
+
+        return plan_queries(main.get_llm(), topic)
+    return tools.build_search_terms(topic)
+
+
+def topic_staleness(topic, max_age=None, assignments=False):
+    """How old each cached entry for `topic` is, and which of them a warm-up would refresh."""
+    terms = research_queries(topic)
+    ages = {}
+    stale_terms = []
+    for term in terms:
+        age, stale = _stale(tools.wiki_cache, tools._wiki_cache_key(term), max_age)
+        ages[term] = age
+        if stale:
+            stale_terms.append(term)
+    known = [age for age in ages.values() if age is not None]
+    status = {
+        "topic": topic,
+        "wikipedia_lookups": len(terms),
+        "wikipedia_cached": len(known),
+        "wikipedia_stale": stale_terms,
+        "oldest_seconds": round(max(known), 1) if known else None,
+    }
+    if assignments:
+        from main import normalize_topic, result_cache
+
+        age, stale = _stale(result_cache, normalize_topic(topic), max_age)
+        status.update(assignment_age_seconds=round(age, 1) if age is not None else None, assignment_stale=stale)
+    return status
+
+
+def warm_topic(topic, max_age=None, assignments=False):
+    """Refresh the stale entries for one topic; never raises, so one topic cannot stop the run."""
+    start = time.perf_counter()
+    record = {"topic": topic, "wikipedia_refreshed": 0, "assignment_refreshed": False}
+    try:
+        status = topic_staleness(topic, max_age, assignments)
+        stale_terms = status["wikipedia_stale"]
+        if stale_terms and tools.research_backend.remote:
+            # Dropped first so the lookups fetch new text instead of returning the old entry
+            for term in stale_terms:
+                tools.wiki_cache.delete(tools._wiki_cache_key(term))
+            tools.clear_research_cache()
+            tools.comprehensive_topic_research(topic, search_terms=stale_terms)
+            record["wikipedia_refreshed"] = len(stale_terms)
+            record["wikipedia_failed"] = [
+                term for term in stale_terms if tools.wiki_cache.age(tools._wiki_cache_key(term)) is None
+            ]
+
+        if assignments and status["assignment_stale"]:
+            from main import get_or_create_assignment
+
+            # An expired assignment is regenerated from scratch; a missing one may reuse cached LLM responses
+            result = get_or_create_assignment(topic, force_fresh=status["assignment_age_seconds"] is not None)
+            if result.get("error") or result.get("partial"):
+                raise RuntimeError(result.get("error") or "writer output was incomplete")
+            record["assignment_refreshed"] = True
+        record["status"] = "ok"
+    except Exception as e:
+        record.update(status="error", error=str(e) or e.__class__.__name__)
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def warm(topics, concurrency=WARM_CONCURRENCY, max_age=None, assignments=False, log=print):
+    """Warm every topic, at most `concurrency` at a time; returns a summary."""
+    start = time.perf_counter()
+    records = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for record in pool.map(lambda topic: warm_topic(topic, max_age, assignments), topics):
+            records.append(record)
+            if record["status"] != "ok":
+                log(f"[{len(records)}/{len(topics)}] error {record['topic']}: {record['error']}")
+            elif record["wikipedia_refreshed"] or record["assignment_refreshed"]:
+                log(f"[{len(records)}/{len(topics)}] refreshed {record['wikipedia_refreshed']} lookups"
+                    f"{' and the assignment' if record['assignment_refreshed'] else ''} "
+                    f"in {record['seconds']:.1f}s  {record['topic']}")
+    return {
+        "topics": len(records),
+        "failed": sum(1 for record in records if record["status"] != "ok"),
+        "wikipedia_refreshed": sum(record["wikipedia_refreshed"] for record in records),
+        "assignments_refreshed": sum(1 for record in records if record["assignment_refreshed"]),
+        "already_fresh": sum(
+            1 for record in records
+            if record["status"] == "ok" and not record["wikipedia_refreshed"] and not record["assignment_refreshed"]
+        ),
+        "wall_seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def staleness_report(topics, max_age=None, assignments=False):
+    statuses = [topic_staleness(topic, max_age, assignments) for topic in topics]
+    for status in statuses:
+        oldest = "-" if status["oldest_seconds"] is None else f"{status['oldest_seconds'] / 3600:.1f}h"
+        line = (f"{status['wikipedia_cached']}/{status['wikipedia_lookups']} lookups cached, "
+                f"{len(status['wikipedia_stale'])} stale, oldest {oldest}")
+        if assignments:
+            age = status["assignment_age_seconds"]
+            line += f"; assignment {'missing' if age is None else f'{age / 3600:.1f}h old'}"
+            line += " (stale)" if status["assignment_stale"] and age is not None else ""
+        print(f"{line:<72} {status['topic']}")
+    summary = {
+        "topics": len(statuses),
+        "topics_with_stale_lookups": sum(1 for status in statuses if status["wikipedia_stale"]),
+        "stale_lookups": sum(len(status["wikipedia_stale"]) for status in statuses),
+    }
+    if assignments:
+        summary["stale_assignments"] = sum(1 for status in statuses if status["assignment_stale"])
+    return summary
+
+
+def start_warm_scheduler(path, interval, concurrency=WARM_CONCURRENCY, assignments=False):
+    """Warm the topics in `path` now and then every `interval` seconds on a daemon thread."""
+    def loop():
+        while True:
+            try:
+                summary = warm(read_topics(path), concurrency, assignments=assignments, log=lambda line: None)
+                log_event("cache_warm", **summary)
+            except Exception as e:
+                log_event("cache_warm_failed", error=str(e) or e.__class__.__name__)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="cache-warmer", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("topics", help="text file with one topic per line, or JSONL with a 'topic' field")
+    parser.add_argument("--assignments", action="store_true", help="also pre-generate whole assignments")
+    parser.add_argument("--concurrency", type=int, default=WARM_CONCURRENCY, help="topics warmed at once")
+    parser.add_argument("--max-age", type=float, help="refresh entries older than this many seconds "
+                                                      "(default: the cache's TTL)")
+    parser.add_argument("--report", action="store_true", help="only print how stale each topic's entries are")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="repeat the warm-up on this interval")
+    args = parser.parse_args()
+
+    if args.report:
+        print(json.dumps(staleness_report(read_topics(args.topics), args.max_age, args.assignments), indent=2))
+        return
+    if not tools.research_backend.remote:
+        print("WIKI_BACKEND=local answers lookups from the index; only assignments are warmed")
+
+    while True:
+        # Re-read every round so edits to the topic list apply without a restart
+        topics = read_topics(args.topics)
+        print(f"Warming {len(topics)} topics, {args.concurrency} at a time")
+        print(json.dumps(warm(topics, args.concurrency, args.max_age, args.assignments), indent=2))
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Build a local full-text Wikipedia index: python wikiindex.py articles.jsonl -o wiki_index.sqlite3
+
+Input is JSONL with one article per line: {"title": ..., "text": ...}. This is the format
+written by `wikiextractor --json` from a pages-articles dump. Records with a "redirect" field
+({"title": "UK", "redirect": "United Kingdom"}) are stored as redirects. .gz and .bz2 files
+are read directly. Rerunning the command with more files adds to (or updates) the index.
+
+Serve research from the index with WIKI_BACKEND=local WIKI_INDEX_PATH=wiki_index.sqlite3.
+"""
+import argparse
+import bz2
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS articles (id INTEGER PRIMARY KEY, title TEXT NOT NULL UNIQUE, text TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS redirects (title TEXT PRIMARY KEY, target TEXT NOT NULL)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5("
+    "title, text, content='articles', content_rowid='id', tokenize='porter unicode61')",
+)
+
+
+def _normalize_title(title: str) -> str:
+    # MediaWiki titles: underscores are spaces, the first letter is case-insensitive
+    title = " ".join(title.replace("_", " ").split())
+    return title[:1].upper() + title[1:]
+
+
+class LocalIndexBackend:
+    """Research backend answering Wikipedia lookups from a local SQLite FTS5 index.
+
+    Lookups take milliseconds and need no network, so they skip the rate limiter and cache.
+    """
+
+    name = "local"
+    remote = False
+
+    def __init__(self, path, top_k_results=2, chars_max=4000):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Wikipedia index {path} not found; build it with `python wikiindex.py`")
+        self.path = path
+        self.top_k_results = top_k_results
+        self.chars_max = chars_max
+        self._local = threading.local()
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def search(self, query: str, limit=None) -> list:
+        """(title, text) of the best matches: an exact title, then title matches, then full-text matches."""
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        db = self._connection()
+        limit = limit or self.top_k_results
+
+        ids = []
+        exact = self.resolve_title(query)
+        if exact:
+            ids.append(db.execute("SELECT id FROM articles WHERE title = ?", (exact,)).fetchone()[0])
+        phrase = " ".join(f'"{word}"' for word in words)
+        # Title matches first (few rows, most relevant); then every word anywhere; then any word.
+        # ORDER BY rank with a LIMIT lets FTS5 keep only the top rows instead of sorting every match.
+        for match in (f"title : ({phrase})", phrase, " OR ".join(f'"{word}"' for word in words)):
+            if len(ids) >= limit:
+                break
+            for (rowid,) in db.execute(
+                "SELECT rowid FROM articles_fts WHERE articles_fts MATCH ? ORDER BY rank LIMIT ?",
+                (match, limit + len(ids)),
+            ):
+                if rowid not in ids:
+                    ids.append(rowid)
+        ids = ids[:limit]
+        rows = dict(
+            (row[0], row[1:]) for row in db.execute(
+                f"SELECT id, title, text FROM articles WHERE id IN ({','.join('?' * len(ids))})", ids
+            )
+        ) if ids else {}
+        return [rows[rowid] for rowid in ids if rowid in rows]
+
+    def lookup(self, query: str) -> str:
+        pages = [f"Page: {title}\nSummary: {text}" for title, text in self.search(query)]
+        if not pages:
+            return "No good Wikipedia Search Result was found"
+        return "\n\n".join(pages)[:self.chars_max]
+
+    async def alookup(self, query: str) -> str:
+        return self.lookup(query)
+
+    def resolve_title(self, title: str):
+        """Canonical title of an indexed article (following redirects), or None."""
+        db = self._connection()
+        title = _normalize_title(title)
+        redirect = db.execute("SELECT target FROM redirects WHERE title = ?", (title,)).fetchone()
+        if redirect:
+            title = _normalize_title(redirect[0])
+        row = db.execute("SELECT title FROM articles WHERE title = ? COLLATE NOCASE", (title,)).fetchone()
+        return row[0] if row else None
+
+    def resolve_titles(self, titles: list) -> dict:
+        return {title: self.resolve_title(title) for title in titles}
+
+
+def _open(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def read_articles(paths):
+    for path in paths:
+        with _open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                title = _normalize_title(record.get("title") or "")
+                if title:
+                    yield title, record
+
+
+def build_index(paths, output, max_chars=4000, batch_size=1000, progress=None):
+    """Add the articles in `paths` to the index at `output`; returns (articles, redirects) written.
+
+    `progress(articles, redirects)` is called after every batch.
+    """
+    db = sqlite3.connect(output)
+    db.execute("PRAGMA journal_mode=WAL")
+    for statement in SCHEMA:
+        db.execute(statement)
+
+    articles = redirects = 0
+    batch, redirect_batch = [], []
+
+    def flush():
+        db.executemany(
+            "INSERT INTO articles (title, text) VALUES (?, ?) ON CONFLICT(title) DO UPDATE SET text = excluded.text",
+            batch,
+        )
+        db.executemany("INSERT OR REPLACE INTO redirects (title, target) VALUES (?, ?)", redirect_batch)
+        db.commit()
+        batch.clear()
+        redirect_batch.clear()
+
+    for title, record in read_articles(paths):
+        if record.get("redirect"):
+            redirect_batch.append((title, _normalize_title(record["redirect"])))
+            redirects += 1
+        else:
+            text = (record.get("text") or record.get("extract") or "").strip()
+            if not text:
+                continue
+            batch.append((title, text[:max_chars]))
+            articles += 1
+        if len(batch) + len(redirect_batch) >= batch_size:
+            flush()
+            if progress:
+                progress(articles, redirects)
+    flush()
+
+    # External-content FTS tables are rebuilt from `articles` in one pass, which also covers updates
+    db.execute("INSERT INTO articles_fts(articles_fts) VALUES ('rebuild')")
+    db.execute("INSERT INTO articles_fts(articles_fts) VALUES ('optimize')")
+    # Title hits count ten times as much as body hits in `ORDER BY rank`
+    db.execute("INSERT INTO articles_fts(articles_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+    db.commit()
+    db.close()
+    return articles, redirects
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="JSONL article files (.jsonl, .jsonl.gz, .jsonl.bz2)")
+    parser.add_argument("-o", "--output", default=os.getenv("WIKI_INDEX_PATH", "wiki_index.sqlite3"))
+    parser.add_argument("--max-chars", type=int, default=4000, help="characters of each article to keep")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    articles, redirects = build_index(
+        args.inputs, args.output, max_chars=args.max_chars,
+        progress=lambda articles, redirects: print(f"  {articles} articles, {redirects} redirects", end="\r", flush=True),
+    )
+    size = os.path.getsize(args.output) / 1e6
+    print(f"Indexed {articles} articles and {redirects} redirects into {args.output} "
+          f"({size:.1f} MB) in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
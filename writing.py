@@ -0,0 +1,310 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from jsonstream import parse_json_object
+from llmcache import llm_cache_bypass
+from metrics import log_event, stage
+
+WRITER_MAX_WORKERS = int(os.getenv("WRITER_MAX_WORKERS", "6"))
+WRITER_SECTION_RETRIES = int(os.getenv("WRITER_SECTION_RETRIES", "2"))
+SECTION_COUNT = 4
+
+outline_prompt = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        """
+        You are an expert academic writer planning a university-level assignment.
+
+        OUTLINE: Propose exactly {section_count} main section titles that together cover the topic's
+        definitions, historical development, applications and examples, and perspectives or future trends.
+        Respond with ONLY a JSON object of the form {{"sections": ["Title 1", "Title 2", ...]}}.
+
+        RESEARCH NOTES:
+        {research_context}
+        """
+    ),
+    ("human", "Plan the assignment outline for: {topic}")
+])
+
+part_prompt = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        """
+        You are an expert academic writer creating one part of a university-level assignment on "{topic}".
+
+        The assignment's main sections are:
+        {outline}
+
+        Write ONLY the {part}. {instructions}
+        Use a formal academic tone with specific examples, dates, names and case studies from the research notes.
+        Respond with plain prose paragraphs only: no headings, no markdown, no JSON.
+
+        RESEARCH NOTES:
+        {research_context}
+        """
+    ),
+    ("human", "Write the {part} of the assignment on: {topic}")
+])
+
+PART_INSTRUCTIONS = {
+    "introduction": "Define key terms, provide context and outline the assignment in 150-200 words.",
+    "section": "Cover this section in depth with analysis and multiple perspectives in 300-400 words.",
+    "conclusion": "Synthesize the insights, discuss implications and suggest future directions in 150-200 words.",
+}
+
+
+def _text(message) -> str:
+    return (getattr(message, "content", message) or "").strip()
+
+
+def _with_retries(func, name, retries):
+    for attempt in range(retries + 1):
+        try:
+            # A retry must not be answered with the cached response that just failed
+            with llm_cache_bypass(attempt > 0):
+                result = func()
+            if result:
+                return result
+            raise ValueError(f"empty output for {name}")
+        except Exception as e:
+            log_event("writer_retry", part=name, attempt=attempt + 1, error=str(e))
+            if attempt == retries:
+                raise
+
+
+def _part_config(config, part, title=None):
+    """`config` plus metadata naming the writer part, so progress events can tell concurrent calls apart."""
+    config = dict(config or {})
+    config["metadata"] = {**config.get("metadata", {}), "writer_part": part, "section_title": title}
+    return config
+
+
+def parse_outline(text: str) -> list:
+    titles = parse_json_object(text)[0].get("sections", [])
+    if not isinstance(titles, list):
+        titles = []
+    titles = [str(title).strip() for title in titles if str(title).strip()]
+    if len(titles) < SECTION_COUNT:
+        raise ValueError(f"outline has {len(titles)} sections, expected {SECTION_COUNT}")
+    return titles[:SECTION_COUNT]
+
+
+def write_outline(llm, topic, research_context, config=None, retries=WRITER_SECTION_RETRIES):
+    config = _part_config(config, "outline")
+
+    def attempt():
+        message = (outline_prompt | llm).invoke(
+            {"topic": topic, "research_context": research_context, "section_count": SECTION_COUNT},
+            config=config,
+        )
+        return parse_outline(_text(message))
+
+    with stage("writer_outline"):
+        return _with_retries(attempt, "outline", retries)
+
+
+async def _awith_retries(func, name, retries):
+    for attempt in range(retries + 1):
+        try:
+            with llm_cache_bypass(attempt > 0):
+                result = await func()
+            if result:
+                return result
+            raise ValueError(f"empty output for {name}")
+        except Exception as e:
+            log_event("writer_retry", part=name, attempt=attempt + 1, error=str(e))
+            if attempt == retries:
+                raise
+
+
+async def awrite_outline(llm, topic, research_context, config=None, retries=WRITER_SECTION_RETRIES):
+    config = _part_config(config, "outline")
+
+    async def attempt():
+        message = await (outline_prompt | llm).ainvoke(
+            {"topic": topic, "research_context": research_context, "section_count": SECTION_COUNT},
+            config=config,
+        )
+        return parse_outline(_text(message))
+
+    with stage("writer_outline"):
+        return await _awith_retries(attempt, "outline", retries)
+
+
+def _part_inputs(topic, outline, research_context, part, title):
+    return {
+        "topic": topic,
+        "outline": "\n".join(f"{i}. {t}" for i, t in enumerate(outline, 1)),
+        "part": f'main section titled "{title}"' if title else part,
+        "instructions": PART_INSTRUCTIONS[part],
+        "research_context": research_context,
+    }
+
+
+def write_part(llm, topic, outline, research_context, part, title=None, config=None,
+               retries=WRITER_SECTION_RETRIES):
+    """Write the introduction, one main section (by title) or the conclusion."""
+    inputs = _part_inputs(topic, outline, research_context, part, title)
+    config = _part_config(config, part, title)
+
+    def attempt():
+        return _text((part_prompt | llm).invoke(inputs, config=config))
+
+    with stage("writer_part", part=part, title=title):
+        return _with_retries(attempt, title or part, retries)
+
+
+async def awrite_part(llm, topic, outline, research_context, part, title=None, config=None,
+                      retries=WRITER_SECTION_RETRIES):
+    inputs = _part_inputs(topic, outline, research_context, part, title)
+    config = _part_config(config, part, title)
+
+    async def attempt():
+        return _text(await (part_prompt | llm).ainvoke(inputs, config=config))
+
+    with stage("writer_part", part=part, title=title):
+        return await _awith_retries(attempt, title or part, retries)
+
+
+def write_assignment_parallel(llm, topic, research_context, current_date, config=None,
+                              max_workers=None, on_event=None):
+    """Outline first, then write introduction, sections and conclusion concurrently.
+
+    Returns a dict in the AssignmentResponse shape (sources are filled in by the caller).
+    """
+    outline = write_outline(llm, topic, research_context, config=config)
+    if on_event:
+        on_event({"type": "outline", "sections": outline})
+
+    jobs = [("introduction", None)] + [("section", title) for title in outline] + [("conclusion", None)]
+    context = contextvars.copy_context()
+
+    def run(job):
+        part, title = job
+        content = context.copy().run(write_part, llm, topic, outline, research_context, part, title, config)
+        if on_event:
+            on_event({"type": "section", "part": part, "title": title, "content": content})
+        return content
+
+    with ThreadPoolExecutor(max_workers=max_workers or WRITER_MAX_WORKERS) as pool:
+        parts = list(pool.map(run, jobs))
+
+    return _assemble(topic, current_date, outline, parts)
+
+
+async def awrite_assignment_parallel(llm, topic, research_context, current_date, config=None,
+                                     max_workers=None, on_event=None):
+    """Async counterpart of write_assignment_parallel; parts run as tasks bounded by a semaphore."""
+    outline = await awrite_outline(llm, topic, research_context, config=config)
+    if on_event:
+        on_event({"type": "outline", "sections": outline})
+
+    jobs = [("introduction", None)] + [("section", title) for title in outline] + [("conclusion", None)]
+    limit = asyncio.Semaphore(max_workers or WRITER_MAX_WORKERS)
+
+    async def run(part, title):
+        async with limit:
+            content = await awrite_part(llm, topic, outline, research_context, part, title, config)
+        if on_event:
+            on_event({"type": "section", "part": part, "title": title, "content": content})
+        return content
+
+    parts = await asyncio.gather(*(run(part, title) for part, title in jobs))
+    return _assemble(topic, current_date, outline, parts)
+
+
+def write_assignment_pipelined(llm, topic, research, research_context, current_date, config=None,
+                               max_workers=None, on_event=None, on_research_done=None):
+    """write_assignment_parallel overlapped with research still being fetched.
+
+    `research` holds the lookup futures, main topic first, and `research_context()` returns
+    the notes collected so far. The outline and introduction start once the main topic's
+    lookup is in; each main section starts as the next subtopic lookup completes, with the
+    notes gathered by then; the conclusion waits for all of the research.
+    """
+    research[0].result()
+    outline = write_outline(llm, topic, research_context(), config=config)
+    if on_event:
+        on_event({"type": "outline", "sections": outline})
+
+    context = contextvars.copy_context()
+
+    def run(part, title, notes):
+        content = context.copy().run(write_part, llm, topic, outline, notes, part, title, config)
+        if on_event:
+            on_event({"type": "section", "part": part, "title": title, "content": content})
+        return content
+
+    with ThreadPoolExecutor(max_workers=max_workers or WRITER_MAX_WORKERS) as pool:
+        introduction = pool.submit(run, "introduction", None, research_context())
+        pending = list(outline)
+        sections = []
+        for _ in as_completed(research[1:]):
+            if pending:
+                sections.append(pool.submit(run, "section", pending.pop(0), research_context()))
+        if on_research_done:
+            on_research_done()
+        notes = research_context()
+        sections += [pool.submit(run, "section", title, notes) for title in pending]
+        conclusion = pool.submit(run, "conclusion", None, notes)
+        parts = [introduction.result()] + [section.result() for section in sections] + [conclusion.result()]
+
+    return _assemble(topic, current_date, outline, parts)
+
+
+async def awrite_assignment_pipelined(llm, topic, research, research_context, current_date, config=None,
+                                      max_workers=None, on_event=None, on_research_done=None):
+    """Async counterpart of write_assignment_pipelined; `research` holds the lookup tasks."""
+    await research[0]
+    outline = await awrite_outline(llm, topic, research_context(), config=config)
+    if on_event:
+        on_event({"type": "outline", "sections": outline})
+
+    limit = asyncio.Semaphore(max_workers or WRITER_MAX_WORKERS)
+
+    async def run(part, title, notes):
+        async with limit:
+            content = await awrite_part(llm, topic, outline, notes, part, title, config)
+        if on_event:
+            on_event({"type": "section", "part": part, "title": title, "content": content})
+        return content
+
+    # Introduction, sections in outline order, then the conclusion
+    tasks = [asyncio.ensure_future(run("introduction", None, research_context()))]
+    pending = list(outline)
+    try:
+        for lookup in asyncio.as_completed(research[1:]):
+            await lookup
+            if pending:
+                tasks.append(asyncio.ensure_future(run("section", pending.pop(0), research_context())))
+        if on_research_done:
+            on_research_done()
+        notes = research_context()
+        tasks += [asyncio.ensure_future(run("section", title, notes)) for title in pending]
+        tasks.append(asyncio.ensure_future(run("conclusion", None, notes)))
+        parts = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    return _assemble(topic, current_date, outline, list(parts))
+
+
+def _assemble(topic, current_date, outline, parts):
+    return {
+        "topic": topic,
+        "author": "AI Research Assistant",
+        "date": current_date,
+        "introduction": parts[0],
+        "main_sections": [
+            {"title": title, "content": content} for title, content in zip(outline, parts[1:-1])
+        ],
+        "conclusion": parts[-1],
+        "sources": [],
+        "tools_used": ["wikipedia"],
+    }